@@ -0,0 +1,97 @@
+"""
+Бенчмарк алгоритмов кластеризации (utils.clustering.make_kmeans) на признаках кошельков.
+
+    python -m benchmarks.bench_clustering --data wallets.parquet --k 4 8
+    python -m benchmarks.bench_clustering --rows 100000 1000000
+
+Признаки — из выгрузки метрик (--data, через preprocess_out_of_core) или синтетические: логнормальные
+счетчики и объемы с несколькими группами кошельков, прошедшие ту же предобработку (log1p + StandardScaler).
+Для каждого размера, k и варианта (KMeans / MiniBatchKMeans, float64 / float32) отчет содержит время обучения,
+инерцию относительно полного KMeans на float64, silhouette по выборкам и совпадение разбиения (ARI).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import adjusted_rand_score
+
+from utils.clustering import MINIBATCH_BATCH_SIZE, make_kmeans, sampled_silhouette
+from utils.preprocessing import WalletPreprocessor, metric_columns, preprocess_out_of_core
+
+
+def synthetic_wallet_frame(rows, groups=6, seed=0):
+    """Метрики кошельков: groups групп с разными медианами активности и объемов (логнормальный шум)."""
+    rng = np.random.default_rng(seed)
+    group = rng.integers(0, groups, rows)
+    centers = rng.normal(0.0, 1.5, (groups, len(metric_columns)))
+    data = pd.DataFrame(
+        np.expm1(np.abs(centers[group] + rng.normal(0.0, 0.7, (rows, len(metric_columns)))) * 2).astype(np.float32),
+        columns=metric_columns,
+    )
+    data["address"] = [f"0x{i:040x}" for i in range(rows)]
+    return data
+
+
+def bench(features, k, engine, float32, batch_size, reference=None):
+    X = np.asarray(features, dtype=np.float32) if float32 else features
+    started = time.perf_counter()
+    model = make_kmeans(k, engine, batch_size).fit(X)
+    seconds = time.perf_counter() - started
+    labels = model.labels_
+    # Инерция пересчитывается на float64 одинаково для всех вариантов
+    centers = model.cluster_centers_.astype(np.float64)
+    inertia = float(((features - centers[labels]) ** 2).sum())
+    silhouette, _ = sampled_silhouette(features, labels, 5000, 3)
+    return {
+        "engine": engine, "dtype": "float32" if float32 else "float64", "k": k,
+        "fit_seconds": seconds, "inertia": inertia, "silhouette": silhouette,
+        "ari_vs_kmeans": adjusted_rand_score(reference, labels) if reference is not None else 1.0,
+    }, labels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Скорость и качество KMeans / MiniBatchKMeans на признаках кошельков.")
+    parser.add_argument("--data", help="выгрузка метрик (CSV, Parquet, Arrow IPC); по умолчанию — синтетические данные")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000], help="размеры синтетических данных")
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--batch-size", type=int, default=MINIBATCH_BATCH_SIZE)
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.data:
+            features, _ = preprocess_out_of_core(args.data, os.path.join(tmp, "features.npy"))
+            datasets = [(os.path.basename(args.data), np.asarray(features, dtype=np.float64))]
+        else:
+            datasets = []
+            for size in args.rows:
+                data = synthetic_wallet_frame(size)
+                datasets.append((f"synthetic-{size}", WalletPreprocessor.fit(data).transform(data).astype(np.float64)))
+
+        for name, features in datasets:
+            for k in args.k:
+                reference, reference_labels = bench(features, k, "kmeans", False, args.batch_size)
+                results = [reference] + [
+                    bench(features, k, engine, float32, args.batch_size, reference_labels)[0]
+                    for engine, float32 in (("kmeans", True), ("minibatch", False), ("minibatch", True))
+                ]
+                for result in results:
+                    result["inertia_ratio"] = result["inertia"] / reference["inertia"]
+                    rows.append({"data": name, "rows": len(features), **result})
+                print(f"{name}, k={k}: готово.", file=sys.stderr)
+
+    report = pd.DataFrame(rows).drop(columns=["inertia"])
+    print(report.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
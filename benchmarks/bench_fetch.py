@@ -0,0 +1,130 @@
+"""
+Бенчмарк конвейера сбора данных (run_fetch_and_process) против локальной заглушки Etherscan.
+
+    python -m benchmarks.bench_fetch --scales small medium --modes stream list --json results.json
+    python -m benchmarks.bench_fetch --store --modes daily stream list
+
+Для каждого масштаба поднимается заглушка с синтетической историей (src.etherscan_stub), а каждый
+прогон выполняется в отдельном процессе (spawn), чтобы пиковая память (RSS) относилась только к нему.
+Режимы: daily — дневные агрегаты (только с --store), stream — потоковый, list — список переводов в памяти.
+Отчет: время, число запросов и запросов в секунду, ответы о лимите и окне 10k, пиковый RSS.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from src.etherscan_stub import ChainData, EtherscanStub, StubServer
+
+# масштаб: (дней истории и анализа, переводов в день, кошельков)
+SCALES = {
+    "small": (7, 5000, 1000),
+    "medium": (15, 20000, 5000),
+    "large": (30, 100000, 20000),
+}
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_pipeline(url, contract, days, mode, store_path, calls_per_second, balance_mode, results):
+    """Прогон в дочернем процессе: результаты (время, строки, пиковый RSS) кладутся в очередь results."""
+    os.environ["TQDM_DISABLE"] = "1"
+    from src.etherscan_client import EtherscanClient
+    from src.fetch_wallet import run_fetch_and_process
+
+    client = EtherscanClient("bench", calls_per_second=calls_per_second, base_url=url, retry_delay=0.1)
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        df, days_hit_limit = run_fetch_and_process(contract, days, client, store=store_path or False,
+                                                   stream=mode == "stream", daily=mode == "daily",
+                                                   balance_mode=balance_mode)
+    totals = client.metrics.snapshot()["total"]
+    results.put({
+        "wall_seconds": time.perf_counter() - started,
+        "client_wait_seconds": totals["limiter_wait_seconds"] + totals["retry_sleep_seconds"],
+        "wallets": 0 if df is None else len(df),
+        "days_hit_limit": len(days_hit_limit),
+        "peak_rss_mb": _peak_rss_mb(),
+    })
+    client.close()
+
+
+def run_scale(name, modes=("stream",), store=False, calls_per_second=200, balance_mode="api",
+              rate_limit_rate=0.0, timeout_rate=0.0, latency=0.0):
+    """Прогоны одного масштаба для каждого режима (daily/stream/list); возвращает список строк отчета."""
+    days, transfers_per_day, wallets = SCALES[name]
+    chain = ChainData.synthetic(days, transfers_per_day, wallets)
+    stub = EtherscanStub(chain, calls_per_second=None, rate_limit_rate=rate_limit_rate,
+                         timeout_rate=timeout_rate, latency=latency)
+    server = StubServer(stub).start()
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    try:
+        for mode in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                store_path = os.path.join(tmp, "transfers.sqlite") if store else None
+                requests_before = dict(stub.stats, actions=dict(stub.stats["actions"]))
+                results = context.Queue()
+                process = context.Process(target=_run_pipeline, args=(
+                    server.url, chain.contract, days, mode, store_path, calls_per_second, balance_mode, results
+                ))
+                process.start()
+                result = results.get()
+                process.join()
+            requests = stub.stats["requests"] - requests_before["requests"]
+            rows.append({
+                "scale": name, "mode": mode, "transfers": len(chain), **result,
+                "requests": requests,
+                "requests_per_second": requests / result["wall_seconds"] if result["wall_seconds"] else 0.0,
+                "tokentx": stub.stats["actions"].get("tokentx", 0) - requests_before["actions"].get("tokentx", 0),
+                "tokenbalance": stub.stats["actions"].get("tokenbalance", 0) - requests_before["actions"].get("tokenbalance", 0),
+                "rate_limited": stub.stats["rate_limited"] - requests_before["rate_limited"],
+                "window_exceeded": stub.stats["window_exceeded"] - requests_before["window_exceeded"],
+            })
+    finally:
+        server.stop()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк run_fetch_and_process против заглушки Etherscan.")
+    parser.add_argument("--scales", nargs="+", choices=sorted(SCALES), default=["small", "medium"])
+    parser.add_argument("--modes", nargs="+", choices=("daily", "stream", "list"), default=["stream", "list"])
+    parser.add_argument("--store", action="store_true", help="сохранять переводы во временное SQLite-хранилище")
+    parser.add_argument("--calls-per-second", type=float, default=200, help="лимит клиента на ключ")
+    parser.add_argument("--balance-mode", choices=("api", "ledger"), default="api")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля случайных ответов о лимите")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="доля ответов Query Timeout")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа заглушки, сек")
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+    if "daily" in args.modes and not args.store:
+        parser.error("режим daily требует --store (дневные агрегаты хранятся в SQLite)")
+
+    rows = []
+    for name in args.scales:
+        rows.extend(run_scale(
+            name, args.modes, args.store, args.calls_per_second, args.balance_mode,
+            args.rate_limit_rate, args.timeout_rate, args.latency,
+        ))
+        print(f"Масштаб {name}: готово.", file=sys.stderr)
+
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False, float_format=lambda value: f"{value:.1f}"))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
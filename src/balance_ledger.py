@@ -0,0 +1,84 @@
+import numpy as np
+
+from src.transfer_table import VALUE_LIMBS, AddressInterner
+
+_CHUNK_BITS = 32  # uint256 суммируется кусками по 32 бита в int64: переполнения нет до 2**31 переводов на адрес
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+_CHUNKS = VALUE_LIMBS * 2
+
+
+def _value_chunks(value):
+    """Колонки limbs uint64 (n, VALUE_LIMBS) -> куски по 32 бита (n, _CHUNKS) в int64, младший первый."""
+    chunks = np.empty((len(value), _CHUNKS), dtype=np.int64)
+    chunks[:, 0::2] = (value & np.uint64(_CHUNK_MASK)).astype(np.int64)
+    chunks[:, 1::2] = (value >> np.uint64(_CHUNK_BITS)).astype(np.int64)
+    return chunks
+
+
+class BalanceLedger:
+    """
+    Леджер балансов: сырой баланс адреса (точное целое uint256) восстанавливается как
+    опорное значение (checkpoint) плюс сумма входящих минус сумма исходящих переводов после него.
+    Адрес без опорной точки начинает с нулевого баланса в начале воспроизводимой истории.
+    Страницы переводов (TransferTable) сворачиваются векторно по id адресов; сами переводы не хранятся.
+    Опорные точки задаются до воспроизведения: переводы не новее блока точки для адреса не учитываются.
+    """
+
+    def __init__(self, interner=None, checkpoints=None):
+        """checkpoints: словарь {адрес: (номер блока, сырой баланс)}."""
+        self.interner = interner or AddressInterner()
+        self.transfer_count = 0
+        self.last_block = None
+        self._net = np.zeros((0, _CHUNKS), dtype=np.int64)
+        self._seed_block = np.zeros(0, dtype=np.int64)
+        self._seeds = {}
+        for address, (block_number, balance) in (checkpoints or {}).items():
+            self.seed(address, block_number, balance)
+
+    def _grow(self, size):
+        extra = size - len(self._seed_block)
+        self._net = np.vstack([self._net, np.zeros((extra, _CHUNKS), dtype=np.int64)])
+        self._seed_block = np.append(self._seed_block, np.full(extra, -1, dtype=np.int64))
+
+    def _ensure_size(self):
+        if len(self.interner) > len(self._seed_block):
+            self._grow(max(len(self.interner), 2 * len(self._seed_block)))
+
+    def seed(self, address, block_number, balance):
+        """Опорная точка: сырой баланс адреса на конец блока block_number."""
+        address_id = self.interner.intern(address)
+        self._ensure_size()
+        self._seed_block[address_id] = block_number
+        self._seeds[address_id] = int(balance)
+
+    def add_transactions(self, table):
+        """Сворачивает страницу переводов (TransferTable с тем же словарем адресов) в балансы."""
+        if table.interner is not self.interner:
+            raise ValueError("Таблица переводов построена с другим словарем адресов.")
+        if not len(table):
+            return
+        self._ensure_size()
+        self.transfer_count += len(table)
+        block_max = int(table.block_number.max())
+        self.last_block = block_max if self.last_block is None else max(self.last_block, block_max)
+
+        chunks = _value_chunks(table.value)
+        incoming = table.block_number > self._seed_block[table.receiver]
+        outgoing = table.block_number > self._seed_block[table.sender]
+        np.add.at(self._net, table.receiver[incoming], chunks[incoming])
+        np.subtract.at(self._net, table.sender[outgoing], chunks[outgoing])
+
+    def balance(self, address):
+        """Сырой баланс адреса (int); неизвестный адрес — 0."""
+        address_id = self.interner.lookup(address)
+        if address_id <= AddressInterner.ZERO_ID:
+            return 0
+        balance = self._seeds.get(address_id, 0)
+        if address_id < len(self._net):
+            for i, chunk in enumerate(self._net[address_id].tolist()):
+                balance += chunk << (_CHUNK_BITS * i)
+        return balance
+
+    def balances(self, addresses):
+        """Словарь {адрес: сырой баланс (int)} — формат balances для compute_wallet_metrics."""
+        return {address: self.balance(address) for address in addresses}
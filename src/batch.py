@@ -0,0 +1,197 @@
+"""
+Пакетное обновление кластеров для нескольких токенов без Streamlit.
+
+    python -m src.batch 0x514910771AF9Ca656af840dff83E8264EcF986CA:30 0xdAC17F958D2ee523a2206206994597C13D831ec7 \
+        --days 15 --clusters 5 --workers 8 --output-dir output
+
+Токены обрабатываются параллельно в пуле процессов. Все процессы используют общий лимитер запросов
+(SharedTokenBucket на каждый ключ) и общее локальное хранилище (SQLite), поэтому суммарная нагрузка
+на ключи Etherscan не превышает их лимитов, а время обновления близко ко времени самого долгого токена.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import dotenv
+import pandas as pd
+
+from src.etherscan_client import DEFAULT_CALLS_PER_SECOND, get_client, parse_api_keys, shared_limiters
+from src.transfer_store import DEFAULT_STORE_PATH
+
+dotenv.load_dotenv()
+
+DEFAULT_DAYS = 15
+DEFAULT_CLUSTERS = 4
+
+
+def parse_job(spec, default_days=DEFAULT_DAYS):
+    """'0xADDRESS' или '0xADDRESS:DAYS' -> (адрес, число дней)."""
+    address, _, days = spec.strip().partition(":")
+    return address, int(days) if days else default_days
+
+
+def read_jobs(specs, tokens_file=None, default_days=DEFAULT_DAYS):
+    """Задания из аргументов и файла (по одному на строку, '#' — комментарий); дубликаты убираются."""
+    specs = list(specs)
+    if tokens_file:
+        with open(tokens_file, encoding="utf-8") as f:
+            specs.extend(line.split("#", 1)[0] for line in f)
+    jobs = [parse_job(spec, default_days) for spec in specs if spec.strip()]
+    return list(dict.fromkeys((address.lower(), days) for address, days in jobs))
+
+
+def _init_worker(api_keys, limiters):
+    """Создает в процессе общий клиент Etherscan с лимитерами из общей памяти."""
+    get_client(api_keys, limiters=limiters)
+
+
+def run_job(address, days, api_keys, n_clusters=DEFAULT_CLUSTERS, output_dir="output", store=DEFAULT_STORE_PATH,
+            stream=True, balance_mode="api", graph_features=False, incremental=False, daily=True):
+    """
+    Сбор данных, предобработка и кластеризация одного токена.
+    Пишет в output_dir/<адрес>_<дни>d/ файлы metrics.csv, clusters.csv, model.npz (WalletClusterModel), summary.json
+    и счетчики запросов etherscan_metrics.json / etherscan_metrics.prom; возвращает summary.
+    incremental — обновлять кластеры прошлого запуска (OnlineClusterModel в job_dir/online) вместо полного обучения.
+    daily — метрики из дневных агрегатов хранилища; stream учитывается только при daily=False (см. run_fetch_and_process).
+    """
+    from src.fetch_wallet import run_fetch_and_process
+    from utils.clustering import WalletClusterModel
+    from utils.online_clustering import OnlineClusterModel
+
+    started = time.monotonic()
+    client = get_client(api_keys)
+    client.metrics.reset()  # процесс пула выполняет одно задание за раз, поэтому счетчики относятся к этому токену
+    job_dir = os.path.join(output_dir, f"{address}_{days}d")
+    os.makedirs(job_dir, exist_ok=True)
+    summary = {"address": address, "days": days, "wallets": 0, "clusters": None, "days_hit_limit": []}
+
+    df, days_hit_limit = run_fetch_and_process(address, days, api_keys, store=store, stream=stream, balance_mode=balance_mode,
+                                                daily=daily, graph_features=graph_features)
+    summary["days_hit_limit"] = [day.strftime("%Y-%m-%d") for day in sorted(set(days_hit_limit))]
+    if df is None:
+        summary["error"] = "Критическая ошибка сбора данных."
+    elif df.empty:
+        summary["error"] = "Не найдено кошельков за период."
+    else:
+        df.to_csv(os.path.join(job_dir, "metrics.csv"), index=False)
+        summary["wallets"] = len(df)
+        if len(df) >= n_clusters:
+            state_dir = os.path.join(job_dir, "online")
+            if incremental:
+                online = _load_online(state_dir, n_clusters, graph_features)
+                if online is None:
+                    online = OnlineClusterModel.fit(df, n_clusters, graph_features)
+                else:
+                    summary["online"] = online.refresh(df)
+                online.save(state_dir)
+                model = online.model
+                clusters = online.labels.rename("cluster").rename_axis("address").reset_index()
+            else:
+                model = WalletClusterModel.fit(df, n_clusters, graph_features)
+                clusters = pd.DataFrame({"address": df["address"].to_numpy(), "cluster": model.labels})
+            model.save(os.path.join(job_dir, "model.npz"))
+            clusters.to_csv(os.path.join(job_dir, "clusters.csv"), index=False)
+            summary["clusters"] = {int(label): int(count) for label, count in clusters["cluster"].value_counts().sort_index().items()}
+        else:
+            summary["error"] = f"Кошельков меньше, чем кластеров ({len(df)} < {n_clusters})."
+
+    summary["seconds"] = round(time.monotonic() - started, 1)
+    summary["requests"] = client.metrics.snapshot()["total"]["requests"]
+    with open(os.path.join(job_dir, "etherscan_metrics.json"), "w", encoding="utf-8") as f:
+        f.write(client.metrics.to_json(indent=2))
+    with open(os.path.join(job_dir, "etherscan_metrics.prom"), "w", encoding="utf-8") as f:
+        f.write(client.metrics.to_prometheus())
+    with open(os.path.join(job_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def _load_online(state_dir, n_clusters, graph_features):
+    """Состояние OnlineClusterModel прошлого запуска, если оно есть и обучено с теми же параметрами."""
+    from utils.online_clustering import OnlineClusterModel
+
+    if not os.path.exists(os.path.join(state_dir, "state.npz")):
+        return None
+    online = OnlineClusterModel.load(state_dir)
+    if online.n_clusters != n_clusters or online.graph_features != graph_features:
+        return None
+    return online
+
+
+def run_batch(jobs, api_key, n_clusters=DEFAULT_CLUSTERS, output_dir="output", store=DEFAULT_STORE_PATH,
+              workers=None, calls_per_second=DEFAULT_CALLS_PER_SECOND, stream=True, balance_mode="api",
+              graph_features=False, incremental=False, daily=True):
+    """Выполняет задания (адрес, дни) в пуле процессов с общим лимитером; возвращает список summary."""
+    api_keys = parse_api_keys(api_key)
+    # spawn: процессы не наследуют клиент родителя с локальными лимитерами (см. get_client)
+    context = multiprocessing.get_context("spawn")
+    limiters = shared_limiters(api_keys, calls_per_second, context)
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(api_keys, limiters)) as executor:
+        futures = {
+            executor.submit(run_job, address, days, api_keys, n_clusters, output_dir, store, stream, balance_mode,
+                            graph_features, incremental, daily): (address, days)
+            for address, days in jobs
+        }
+        for future in as_completed(futures):
+            address, days = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {"address": address, "days": days, "error": f"{type(e).__name__}: {e}"}
+            summaries.append(summary)
+            status = summary.get("error") or f"{summary['wallets']} кошельков, {summary['seconds']} сек"
+            print(f"[{len(summaries)}/{len(jobs)}] {address} ({days} д.): {status}")
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный сбор метрик и кластеризация кошельков для списка токенов.")
+    parser.add_argument("tokens", nargs="*", help="адреса контрактов, опционально с окном в днях: 0xADDRESS:DAYS")
+    parser.add_argument("--tokens-file", help="файл с заданиями 0xADDRESS[:DAYS], по одному на строку")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="окно в днях по умолчанию")
+    parser.add_argument("--clusters", type=int, default=DEFAULT_CLUSTERS, help="число кластеров KMeans")
+    parser.add_argument("--output-dir", default="output", help="каталог для результатов")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="путь к общему SQLite-хранилищу")
+    parser.add_argument("--workers", type=int, help="число процессов (по умолчанию — по числу токенов, не больше числа CPU)")
+    parser.add_argument("--calls-per-second", type=float, default=DEFAULT_CALLS_PER_SECOND, help="лимит запросов на ключ")
+    parser.add_argument("--no-daily", action="store_true",
+                        help="считать метрики по переводам, а не из дневных агрегатов хранилища")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="собирать все переводы периода в памяти (только вместе с --no-daily)")
+    parser.add_argument("--balance-mode", choices=("api", "ledger"), default="api", help="источник балансов")
+    parser.add_argument("--graph-features", action="store_true", help="добавить признаки графа контрагентов")
+    parser.add_argument("--incremental", action="store_true",
+                        help="обновлять кластеры прошлого запуска без полного переобучения (переобучение при дрейфе)")
+    parser.add_argument("--api-key", default=os.getenv("ETHERSCAN_API_KEYS") or os.getenv("ETHERSCAN_API_KEY"),
+                        help="ключ(и) Etherscan через запятую (по умолчанию ETHERSCAN_API_KEYS / ETHERSCAN_API_KEY)")
+    args = parser.parse_args(argv)
+
+    jobs = read_jobs(args.tokens, args.tokens_file, args.days)
+    if not jobs:
+        parser.error("не указано ни одного токена")
+    if not parse_api_keys(args.api_key):
+        parser.error("не указан ключ Etherscan (--api-key или ETHERSCAN_API_KEY)")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    started = time.monotonic()
+    summaries = run_batch(
+        jobs, args.api_key, args.clusters, args.output_dir, args.store, args.workers,
+        args.calls_per_second, not args.no_stream, args.balance_mode, args.graph_features,
+        args.incremental, not args.no_daily,
+    )
+    with open(os.path.join(args.output_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summaries, f, ensure_ascii=False, indent=2)
+    failed = [summary for summary in summaries if summary.get("error")]
+    print(f"\nГотово за {time.monotonic() - started:.1f} сек: {len(summaries) - len(failed)} из {len(summaries)} токенов без ошибок.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
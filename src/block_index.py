@@ -0,0 +1,101 @@
+import bisect
+from datetime import datetime
+
+MAX_ANCHOR_GAP_SECONDS = 30 * 24 * 3600  # между точными опорными точками интерполяция считается достаточно точной
+
+
+class BlockIndex:
+    """
+    Индекс timestamp -> номер блока (closest="before") поверх локального хранилища (store может быть None).
+    Точные значения (опорные точки) берутся из хранилища или запрашиваются через resolver;
+    промежуточные границы интерполируются линейно между ближайшими опорными точками.
+    """
+
+    def __init__(self, store, resolver, client=None, max_anchor_gap=MAX_ANCHOR_GAP_SECONDS):
+        """
+        resolver: функция datetime -> номер блока (или None), делающая запрос к API и кеширующая
+        окончательные результаты в хранилище; client — для параллельного уточнения опорных точек.
+        """
+        self.store = store
+        self.resolver = resolver
+        self.client = client
+        self.max_anchor_gap = max_anchor_gap
+        self._anchors = {}
+
+    def _load_anchors(self, start_timestamp, end_timestamp):
+        if self.store is None:
+            return
+        for timestamp, block_number in self.store.block_anchors(start_timestamp, end_timestamp):
+            self._anchors[timestamp] = block_number
+
+    def resolve(self, timestamps):
+        """Точные номера блоков для набора timestamp (параллельно, если есть client)."""
+        missing = [ts for ts in timestamps if ts not in self._anchors]
+        map_func = self.client.map if self.client else lambda func, items: list(map(func, items))
+        for timestamp, block_number in zip(missing, map_func(lambda ts: self.resolver(datetime.fromtimestamp(ts)), missing)):
+            if block_number is not None:
+                self._anchors[timestamp] = block_number
+        return {ts: self._anchors.get(ts) for ts in timestamps}
+
+    def interpolate(self, timestamp):
+        """Оценка номера блока линейной интерполяцией между ближайшими опорными точками."""
+        if timestamp in self._anchors:
+            return self._anchors[timestamp]
+        times = sorted(self._anchors)
+        position = bisect.bisect_left(times, timestamp)
+        if position == 0 or position == len(times):
+            return None
+        t_low, t_high = times[position - 1], times[position]
+        b_low, b_high = self._anchors[t_low], self._anchors[t_high]
+        return b_low + (b_high - b_low) * (timestamp - t_low) // (t_high - t_low)
+
+    def _wide_gaps(self, timestamps):
+        """Для каждого слишком широкого интервала между опорными точками — запрошенный timestamp ближе всего к его середине."""
+        times = sorted(self._anchors)
+        refine = []
+        for t_low, t_high in zip(times, times[1:]):
+            if t_high - t_low <= self.max_anchor_gap:
+                continue
+            inside = [ts for ts in timestamps if t_low < ts < t_high]
+            if inside:
+                middle = (t_low + t_high) / 2
+                refine.append(min(inside, key=lambda ts: abs(ts - middle)))
+        return refine
+
+    def boundaries(self, timestamps, exact=()):
+        """
+        Номера блоков для отсортированных timestamp границ.
+        Первая и последняя границы и все timestamp из exact определяются точно; остальные
+        интерполируются, а точный запрос делается только если соседние опорные точки
+        отстоят дальше, чем на max_anchor_gap. Возвращает None, если крайние границы не определены.
+        """
+        if not timestamps:
+            return []
+        self._load_anchors(timestamps[0], timestamps[-1])
+        resolved = self.resolve(sorted({timestamps[0], timestamps[-1], *exact}))
+        if resolved[timestamps[0]] is None or resolved[timestamps[-1]] is None:
+            return None
+
+        while True:
+            refine = self._wide_gaps(timestamps)
+            if not refine:
+                break
+            resolved = self.resolve(refine)
+            if any(block_number is None for block_number in resolved.values()):
+                break
+
+        blocks = [self.interpolate(ts) for ts in timestamps]
+        # Оценки должны быть монотонны (на случай неточных опорных точек)
+        for i in range(1, len(blocks)):
+            if blocks[i] is None or blocks[i] < blocks[i - 1]:
+                blocks[i] = blocks[i - 1]
+        return blocks
+
+    def final_block(self, cutoff_timestamp):
+        """Наибольший точно известный блок не позже cutoff_timestamp (блоки до него не изменятся)."""
+        candidates = [block for ts, block in self._anchors.items() if ts <= cutoff_timestamp]
+        return max(candidates) if candidates else None
+
+    @property
+    def exact_count(self):
+        return len(self._anchors)
@@ -0,0 +1,257 @@
+import io
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from src.transfer_table import AddressInterner
+from src.wallet_metrics import (
+    METRIC_COLUMNS, _balance_to_tokens, _local_day_ordinals, explode_transfers,
+)
+
+_ID_BITS = 32
+_ID_MASK = (1 << _ID_BITS) - 1
+FORMAT_VERSION = 2  # сохраненные агрегаты другой версии пересчитываются
+
+
+def _pair_heads(pairs):
+    return pairs >> _ID_BITS
+
+
+class WalletPartial:
+    """
+    Частичные агрегаты кошельков по набору переводов (обычно — за один локальный день),
+    которые сливаются в метрики любого окна без повторного прохода по переводам.
+    Колонки выровнены по address_ids (отсортированные id из общего AddressInterner): число входящих
+    и исходящих переводов, объемы (в единицах токена), первый и последний timestamp.
+    Множества контрагентов и активных дней хранятся как отсортированные пары (id << 32 | id контрагента / день).
+    Ребра графа переводов (отправитель << 32 | получатель, без нулевого адреса и переводов самому себе)
+    хранятся с суммарным объемом и числом переводов (см. TransferGraph.from_partial).
+    """
+
+    def __init__(self, interner, address_ids, incoming, outgoing, volume_in, volume_out, first_ts, last_ts,
+                 counterparty_pairs, day_pairs, edge_pairs=None, edge_volume=None, edge_count=None):
+        self.interner = interner
+        self.address_ids = np.asarray(address_ids, dtype=np.int64)
+        self.incoming = np.asarray(incoming, dtype=np.int64)
+        self.outgoing = np.asarray(outgoing, dtype=np.int64)
+        self.volume_in = np.asarray(volume_in, dtype=np.float64)
+        self.volume_out = np.asarray(volume_out, dtype=np.float64)
+        self.first_ts = np.asarray(first_ts, dtype=np.int64)
+        self.last_ts = np.asarray(last_ts, dtype=np.int64)
+        self.counterparty_pairs = np.asarray(counterparty_pairs, dtype=np.int64)
+        self.day_pairs = np.asarray(day_pairs, dtype=np.int64)
+        self.edge_pairs = np.asarray(edge_pairs if edge_pairs is not None else [], dtype=np.int64)
+        self.edge_volume = np.asarray(edge_volume if edge_volume is not None else [], dtype=np.float64)
+        self.edge_count = np.asarray(edge_count if edge_count is not None else [], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.address_ids)
+
+    @classmethod
+    def empty(cls, interner):
+        return cls(interner, *(np.zeros(0) for _ in range(12)))
+
+    @classmethod
+    def from_table(cls, table, token_decimals, start_timestamp=None, end_timestamp=None):
+        """
+        Агрегаты по TransferTable. Адреса — все участники таблицы; метрики считаются только по переводам
+        в [start_timestamp, end_timestamp] (если интервал задан), как в compute_wallet_metrics.
+        """
+        address_ids = table.participant_ids().astype(np.int64)
+        size = len(address_ids)
+        if start_timestamp is not None:
+            table = table.between(start_timestamp, end_timestamp)
+        token_values = table.token_values(token_decimals)
+        address_col, counterparties, timestamps, values, is_incoming = explode_transfers(table, token_values)
+        participant = address_col > AddressInterner.ZERO_ID
+        address_col, counterparties = address_col[participant].astype(np.int64), counterparties[participant].astype(np.int64)
+        timestamps, values, is_incoming = timestamps[participant], values[participant], is_incoming[participant]
+        rows = np.searchsorted(address_ids, address_col)
+
+        first_ts = np.full(size, np.iinfo(np.int64).max, dtype=np.int64)
+        last_ts = np.full(size, np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(first_ts, rows, timestamps)
+        np.maximum.at(last_ts, rows, timestamps)
+        cp_mask = (counterparties != AddressInterner.ZERO_ID) & (counterparties != address_col)
+
+        senders, receivers = table.sender.astype(np.int64), table.receiver.astype(np.int64)
+        edge_mask = (senders > AddressInterner.ZERO_ID) & (receivers > AddressInterner.ZERO_ID) & (senders != receivers)
+        edge_pairs, edge_rows = np.unique((senders[edge_mask] << _ID_BITS) | receivers[edge_mask], return_inverse=True)
+        edge_values = token_values[edge_mask]
+        return cls(
+            table.interner, address_ids,
+            np.bincount(rows[is_incoming], minlength=size),
+            np.bincount(rows[~is_incoming], minlength=size),
+            np.bincount(rows[is_incoming], weights=values[is_incoming], minlength=size),
+            np.bincount(rows[~is_incoming], weights=values[~is_incoming], minlength=size),
+            first_ts, last_ts,
+            np.unique((address_col[cp_mask] << _ID_BITS) | counterparties[cp_mask]),
+            np.unique((address_col << _ID_BITS) | _local_day_ordinals(timestamps)),
+            edge_pairs,
+            np.bincount(edge_rows, weights=edge_values, minlength=len(edge_pairs)),
+            np.bincount(edge_rows, minlength=len(edge_pairs)),
+        )
+
+    @classmethod
+    def merge(cls, partials, interner=None):
+        """Сливает агрегаты (с общим словарем адресов) — O(суммарного числа адресов и пар)."""
+        partials = [partial for partial in partials if partial is not None]
+        if not partials:
+            return cls.empty(interner or AddressInterner())
+        interner = partials[0].interner
+        if any(partial.interner is not interner for partial in partials):
+            raise ValueError("Агрегаты построены с разными словарями адресов.")
+        if len(partials) == 1:
+            return partials[0]
+
+        address_ids, rows = np.unique(np.concatenate([partial.address_ids for partial in partials]), return_inverse=True)
+        size = len(address_ids)
+        column = lambda name: np.concatenate([getattr(partial, name) for partial in partials])
+        first_ts = np.full(size, np.iinfo(np.int64).max, dtype=np.int64)
+        last_ts = np.full(size, np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(first_ts, rows, column("first_ts"))
+        np.maximum.at(last_ts, rows, column("last_ts"))
+        edge_pairs, edge_rows = np.unique(column("edge_pairs"), return_inverse=True)
+        return cls(
+            interner, address_ids,
+            np.bincount(rows, weights=column("incoming"), minlength=size).astype(np.int64),
+            np.bincount(rows, weights=column("outgoing"), minlength=size).astype(np.int64),
+            np.bincount(rows, weights=column("volume_in"), minlength=size),
+            np.bincount(rows, weights=column("volume_out"), minlength=size),
+            first_ts, last_ts,
+            np.unique(column("counterparty_pairs")),
+            np.unique(column("day_pairs")),
+            edge_pairs,
+            np.bincount(edge_rows, weights=column("edge_volume"), minlength=len(edge_pairs)),
+            np.bincount(edge_rows, weights=column("edge_count"), minlength=len(edge_pairs)).astype(np.int64),
+        )
+
+    @property
+    def addresses(self):
+        return [self.interner.addresses[address_id] for address_id in self.address_ids]
+
+    def _pair_counts(self, pairs):
+        return np.bincount(np.searchsorted(self.address_ids, _pair_heads(pairs)), minlength=len(self))
+
+    def to_frame(self, token_decimals, balances=None):
+        """DataFrame метрик в том же формате, что и compute_wallet_metrics."""
+        balances = balances or {}
+        addresses = self.addresses
+        incoming, outgoing = self.incoming, self.outgoing
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_in = np.where(incoming > 0, self.volume_in / np.maximum(incoming, 1), 0.0)
+            avg_out = np.where(outgoing > 0, self.volume_out / np.maximum(outgoing, 1), 0.0)
+        has_tx = (incoming + outgoing) > 0
+        return pd.DataFrame({
+            "address": addresses,
+            "period_total_tx_count": incoming + outgoing,
+            "period_incoming_tx_count": incoming,
+            "period_outgoing_tx_count": outgoing,
+            "period_total_volume_in": self.volume_in,
+            "period_total_volume_out": self.volume_out,
+            "period_avg_volume_in": avg_in,
+            "period_avg_volume_out": avg_out,
+            "period_unique_counterparties": self._pair_counts(self.counterparty_pairs),
+            "period_first_tx_date": [datetime.fromtimestamp(int(ts)) if active else None for ts, active in zip(self.first_ts, has_tx)],
+            "period_last_tx_date": [datetime.fromtimestamp(int(ts)) if active else None for ts, active in zip(self.last_ts, has_tx)],
+            "period_active_days": self._pair_counts(self.day_pairs),
+            "current_token_balance": [
+                _balance_to_tokens(balances.get(address, 0), token_decimals) for address in addresses
+            ],
+        }, columns=METRIC_COLUMNS)
+
+    # --- Сохранение агрегатов одного дня ---
+
+    def to_bytes(self):
+        """Сериализация (npz) с адресами вместо id; пары хранятся как индексы в списке адресов."""
+        index_of = {address_id: i for i, address_id in enumerate(self.address_ids.tolist())}
+        cp_owner = _pair_heads(self.counterparty_pairs)
+        cp_other = self.counterparty_pairs & _ID_MASK
+        edge_src, edge_dst = _pair_heads(self.edge_pairs), self.edge_pairs & _ID_MASK
+        extra = sorted(set(cp_other.tolist()).union(edge_src.tolist(), edge_dst.tolist()) - index_of.keys())
+        for address_id in extra:
+            index_of[address_id] = len(index_of)
+        all_ids = np.concatenate([self.address_ids, np.asarray(extra, dtype=np.int64)])
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            version=np.array(FORMAT_VERSION),
+            addresses=np.array([self.interner.addresses[address_id] for address_id in all_ids], dtype="U42"),
+            incoming=self.incoming, outgoing=self.outgoing,
+            volume_in=self.volume_in, volume_out=self.volume_out,
+            first_ts=self.first_ts, last_ts=self.last_ts,
+            cp_owner=np.array([index_of[i] for i in cp_owner.tolist()], dtype=np.int32),
+            cp_other=np.array([index_of[i] for i in cp_other.tolist()], dtype=np.int32),
+            day_owner=np.array([index_of[i] for i in _pair_heads(self.day_pairs).tolist()], dtype=np.int32),
+            days=(self.day_pairs & _ID_MASK),
+            edge_src=np.array([index_of[i] for i in edge_src.tolist()], dtype=np.int32),
+            edge_dst=np.array([index_of[i] for i in edge_dst.tolist()], dtype=np.int32),
+            edge_volume=self.edge_volume, edge_count=self.edge_count,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, interner, data):
+        """Обратное к to_bytes: адреса интернируются в interner. None — для агрегатов другой версии формата."""
+        arrays = np.load(io.BytesIO(data))
+        if "version" not in arrays or int(arrays["version"]) != FORMAT_VERSION:
+            return None
+        intern = interner.intern
+        ids = np.array([intern(address) for address in arrays["addresses"].tolist()], dtype=np.int64)
+        size = len(arrays["incoming"])
+        order = np.argsort(ids[:size], kind="stable")
+        column = lambda name: arrays[name][order]
+        return cls(
+            interner, ids[:size][order],
+            column("incoming"), column("outgoing"), column("volume_in"), column("volume_out"),
+            column("first_ts"), column("last_ts"),
+            np.unique((ids[arrays["cp_owner"]] << _ID_BITS) | ids[arrays["cp_other"]]),
+            np.unique((ids[arrays["day_owner"]] << _ID_BITS) | arrays["days"]),
+            *cls._load_edges(ids, arrays),
+        )
+
+    @staticmethod
+    def _load_edges(ids, arrays):
+        edge_pairs = (ids[arrays["edge_src"]] << _ID_BITS) | ids[arrays["edge_dst"]]
+        order = np.argsort(edge_pairs, kind="stable")
+        return edge_pairs[order], arrays["edge_volume"][order], arrays["edge_count"][order]
+
+
+class DailyPartials:
+    """
+    Агрегаты по локальным дням: страницы переводов раскладываются по дням и сворачиваются в WalletPartial.
+    Агрегаты дня сливаются, когда их набирается max_pending, так что память растет
+    с числом дней и активных в них кошельков, а не с числом переводов.
+    """
+
+    def __init__(self, token_decimals, start_timestamp, end_timestamp, max_pending=16):
+        self.token_decimals = token_decimals
+        self.start_timestamp = start_timestamp
+        self.end_timestamp = end_timestamp
+        self.max_pending = max_pending
+        self._days = {}
+
+    def add_table(self, table):
+        if not len(table):
+            return
+        day_ordinals = _local_day_ordinals(table.time_stamp)
+        for day_ordinal in np.unique(day_ordinals).tolist():
+            partial = WalletPartial.from_table(
+                table.take(day_ordinals == day_ordinal), self.token_decimals, self.start_timestamp, self.end_timestamp
+            )
+            pending = self._days.setdefault(date.fromordinal(day_ordinal), [])
+            pending.append(partial)
+            if len(pending) >= self.max_pending:
+                pending[:] = [WalletPartial.merge(pending)]
+
+    def days(self):
+        return sorted(self._days)
+
+    def get(self, day):
+        """Слитые агрегаты дня или None."""
+        pending = self._days.get(day)
+        if not pending:
+            return None
+        pending[:] = [WalletPartial.merge(pending)]
+        return pending[0]
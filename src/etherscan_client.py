@@ -0,0 +1,412 @@
+import multiprocessing
+import os
+import threading
+import time as os_time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.request_metrics import RequestMetrics
+
+ETHERSCAN_API_URL = os.getenv("ETHERSCAN_API_URL", "https://api.etherscan.io/api")  # например, адрес src.etherscan_stub
+DEFAULT_CALLS_PER_SECOND = 5  # лимит бесплатного ключа Etherscan
+DEFAULT_WORKERS_PER_KEY = 8
+RATE_LIMIT_BENCH_SECONDS = 5  # базовая пауза ключа после "Max rate limit reached" (растет с каждым повтором)
+INVALID_KEY_BENCH_SECONDS = 3600
+MAX_KEY_WAIT_SECONDS = 120  # дольше ждать освобождения ключа не имеет смысла — запрос пропускается
+
+
+class TokenBucket:
+    """
+    Потокобезопасный token-bucket лимитер.
+    rate — пополнение (вызовов в секунду), capacity — максимальный размер всплеска.
+    По умолчанию capacity=1: запросы идут равномерно, и в любом окне в 1 секунду
+    их не больше, чем разрешает Etherscan.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = os_time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def try_acquire(self):
+        """Забирает токен без ожидания. Возвращает время ожидания (0.0, если токен получен)."""
+        with self._lock:
+            now = os_time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Блокирует только вызывающий поток до появления свободного токена."""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            os_time.sleep(wait)
+
+    def pause(self, seconds):
+        """Останавливает выдачу токенов на seconds секунд (после ответа 'Max rate limit reached')."""
+        with self._lock:
+            now = os_time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = max(self._updated, self._paused_until)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token-bucket лимитер в общей памяти: один бюджет запросов для всех процессов,
+    получивших его при запуске (например, через initargs пула процессов).
+    time.monotonic общий для процессов одной машины, поэтому логика та же, что у TokenBucket.
+    """
+
+    def __init__(self, rate, capacity=1, context=None):
+        context = context or multiprocessing.get_context()
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._state = context.RawArray("d", [self.capacity, os_time.monotonic(), 0.0])
+        self._lock = context.Lock()
+
+    # Состояние хранится в общем массиве: [токены, время пополнения, пауза до]
+    @property
+    def _tokens(self):
+        return self._state[0]
+
+    @_tokens.setter
+    def _tokens(self, value):
+        self._state[0] = value
+
+    @property
+    def _updated(self):
+        return self._state[1]
+
+    @_updated.setter
+    def _updated(self, value):
+        self._state[1] = value
+
+    @property
+    def _paused_until(self):
+        return self._state[2]
+
+    @_paused_until.setter
+    def _paused_until(self, value):
+        self._state[2] = value
+
+
+def parse_api_keys(api_key):
+    """Приводит ключ(и) к кортежу: строка "k1,k2", список ключей или один ключ."""
+    if not api_key:
+        return ()
+    if isinstance(api_key, str):
+        keys = [key.strip() for key in api_key.split(",")]
+    else:
+        keys = [str(key).strip() for key in api_key]
+    return tuple(dict.fromkeys(key for key in keys if key))
+
+
+class ApiKeyPool:
+    """
+    Пул ключей Etherscan: round-robin распределение запросов, собственный token-bucket на ключ
+    и временное отстранение ключей, получивших ответ о лимите или неверном ключе.
+    """
+
+    def __init__(self, api_keys, calls_per_second=DEFAULT_CALLS_PER_SECOND, limiters=None):
+        """limiters — готовые лимитеры по ключам (например, SharedTokenBucket, общие для процессов)."""
+        self.keys = parse_api_keys(api_keys)
+        limiters = limiters or {}
+        self.limiters = {key: limiters.get(key) or TokenBucket(calls_per_second) for key in self.keys}
+        self.stats = {
+            key: {"requests": 0, "rate_limited": 0, "invalid": 0, "benched_until": 0.0, "strikes": 0}
+            for key in self.keys
+        }
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def use_limiters(self, limiters):
+        """Заменяет лимитеры ключей готовыми (например, SharedTokenBucket, общими для процессов)."""
+        with self._lock:
+            for key in self.keys:
+                if key in limiters:
+                    self.limiters[key] = limiters[key]
+
+    def _try_acquire(self):
+        """Один проход round-robin по ключам. Возвращает (ключ, 0) или (None, время ожидания)."""
+        with self._lock:
+            now = os_time.monotonic()
+            min_wait = None
+            for i in range(len(self.keys)):
+                key = self.keys[(self._next + i) % len(self.keys)]
+                benched_for = self.stats[key]["benched_until"] - now
+                wait = benched_for if benched_for > 0 else self.limiters[key].try_acquire()
+                if wait <= 0:
+                    self._next = (self._next + i + 1) % len(self.keys)
+                    self.stats[key]["requests"] += 1
+                    return key, 0.0
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+            return None, min_wait
+
+    def acquire(self, max_wait=MAX_KEY_WAIT_SECONDS):
+        """
+        Возвращает ключ со свободным токеном, ожидая при необходимости (блокирует только текущий поток).
+        Возвращает None, если все ключи отстранены дольше чем на max_wait секунд.
+        """
+        if not self.keys:
+            return None
+        while True:
+            key, wait = self._try_acquire()
+            if key is not None:
+                return key
+            if wait > max_wait:
+                return None
+            os_time.sleep(wait)
+
+    def bench(self, key, seconds, reason):
+        """Отстраняет ключ на seconds секунд; reason — 'rate_limited' или 'invalid'."""
+        with self._lock:
+            stats = self.stats[key]
+            stats[reason] += 1
+            stats["strikes"] += 1
+            stats["benched_until"] = max(stats["benched_until"], os_time.monotonic() + seconds)
+
+    def report_success(self, key):
+        with self._lock:
+            self.stats[key]["strikes"] = 0
+
+    def strikes(self, key):
+        return self.stats[key]["strikes"]
+
+    def snapshot(self):
+        """Копия статистики по ключам (ключи маскируются)."""
+        with self._lock:
+            now = os_time.monotonic()
+            return {
+                f"{key[:4]}...{key[-4:]}": {
+                    "requests": stats["requests"],
+                    "rate_limited": stats["rate_limited"],
+                    "invalid": stats["invalid"],
+                    "benched_for": round(max(0.0, stats["benched_until"] - now), 1),
+                }
+                for key, stats in self.stats.items()
+            }
+
+
+class EtherscanClient:
+    """
+    Клиент Etherscan API с пулом keep-alive соединений, пулом ключей (свой token-bucket на ключ)
+    и пулом потоков для параллельного выполнения запросов.
+    api_key — один ключ, строка "k1,k2" или список ключей.
+    """
+
+    def __init__(self, api_key, calls_per_second=DEFAULT_CALLS_PER_SECOND, max_workers=None,
+                 base_url=ETHERSCAN_API_URL, max_retries=4, retry_delay=5, timeout=30, limiters=None):
+        self.key_pool = ApiKeyPool(api_key, calls_per_second, limiters)
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        if max_workers is None:
+            max_workers = DEFAULT_WORKERS_PER_KEY * max(1, len(self.key_pool))
+        self.max_workers = max_workers
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="etherscan")
+        self.metrics = RequestMetrics()
+
+    def request(self, params):
+        """
+        Выполняет запрос в вызывающем потоке с учетом лимитера и повторов.
+        Возвращает result, пустой список, если записей нет ("No transactions found"), строку "10k_limit"
+        или None, если ответ не получен (сеть, все ключи отстранены, исчерпаны повторы) или это ошибка API.
+        Паузы между повторами блокируют только текущий поток; ключ, получивший ответ
+        о лимите или неверном ключе, отстраняется, и повтор уходит на следующий ключ пула.
+        Исходы, повторы, задержки и ожидание учитываются в self.metrics (RequestMetrics) по params["action"].
+        """
+        action = params.get("action", "unknown")
+        if not len(self.key_pool):
+            print("Ошибка: ETHERSCAN_API_KEY не передан или не найден.")
+            self.metrics.count_result(action, "failed")
+            return None
+
+        params = dict(params)
+        max_retries = self.max_retries
+        retry_delay = self.retry_delay
+
+        for attempt in range(max_retries):
+            wait_started = os_time.perf_counter()
+            api_key = self.key_pool.acquire()
+            self.metrics.add_wait(action, os_time.perf_counter() - wait_started)
+            if api_key is None:
+                print("\nОшибка: Все ключи Etherscan отстранены (лимит запросов или неверный ключ). Пропуск запроса.")
+                self.metrics.count_result(action, "failed")
+                return None
+            params["apikey"] = api_key
+            sent = os_time.perf_counter()
+            response = None
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+                self.metrics.observe_response(action, os_time.perf_counter() - sent, len(response.content))
+                response.raise_for_status()
+                data = response.json()
+
+                if data.get("status") == "1":
+                    self.key_pool.report_success(api_key)
+                    self.metrics.count_result(action, "ok")
+                    return data["result"]
+                elif data.get("status") == "0":
+                    message = data.get("message", "")
+                    result_val = data.get("result")
+                    # Etherscan часто кладет текст ошибки в result, а не в message
+                    details = f"{message} {result_val if isinstance(result_val, str) else ''}"
+
+                    if "Result window is too large" in details:
+                        print(f"\n[Окно 10k] Достигнуто окно результатов Etherscan ({message}) для запроса: {_masked(params)}.")
+                        self.metrics.count_result(action, "window")
+                        return "10k_limit"
+                    elif "Max rate limit reached" in details:
+                        bench_seconds = RATE_LIMIT_BENCH_SECONDS * (self.key_pool.strikes(api_key) + 1)
+                        print(f"\nПредупреждение: Достигнут лимит запросов ({message}). Ключ {api_key[:4]}... отстранен на {bench_seconds} сек, повтор...")
+                        self.key_pool.limiters[api_key].pause(1.0)
+                        self.key_pool.bench(api_key, bench_seconds, "rate_limited")
+                        self.metrics.count_retry(action, "rate_limited")
+                        continue
+                    elif "Invalid API Key" in details:
+                        print(f"\nОшибка: Неверный ключ Etherscan {api_key[:4]}... — ключ отстранен на {INVALID_KEY_BENCH_SECONDS} сек, повтор с другим ключом...")
+                        self.key_pool.bench(api_key, INVALID_KEY_BENCH_SECONDS, "invalid")
+                        self.metrics.count_retry(action, "invalid_key")
+                        continue
+                    elif "No transactions found" in details or "No records found" in details:
+                        # Пустой результат — не ошибка: вызывающий может считать диапазон загруженным
+                        self.metrics.count_result(action, "empty")
+                        return []
+                    elif "Invalid address format" in details:
+                        print(f"\nПредупреждение: Неверный формат адреса в запросе: {_masked(params)}")
+                        self.metrics.count_result(action, "error")
+                        return None
+                    elif "Query Timeout" in details:
+                        print(f"\nПредупреждение: Таймаут запроса Etherscan ({message}). Повтор через {retry_delay * (attempt + 1)} сек...")
+                        self.metrics.count_retry(action, "query_timeout")
+                        self._sleep(action, retry_delay * (attempt + 1))
+                        continue
+                    else:
+                        print(f"\nОшибка API Etherscan (Status 0): {message} | Result: {result_val} | Params: {_masked(params)}")
+                        self.metrics.count_result(action, "error")
+                        return None
+                else:
+                    print(f"\nНеожиданный формат ответа API Etherscan: {data}")
+                    self.metrics.count_result(action, "error")
+                    return None
+
+            except requests.exceptions.RequestException as e:
+                if response is None:
+                    self.metrics.observe_failure(action, os_time.perf_counter() - sent)
+                print(f"\nСетевая или HTTP ошибка во время запроса к Etherscan: {e}")
+                if attempt < max_retries - 1:
+                    print(f"Повтор через {retry_delay * (attempt + 1)} секунд...")
+                    self.metrics.count_retry(action, "network")
+                    self._sleep(action, retry_delay * (attempt + 1))
+                else:
+                    print("Достигнуто максимальное количество попыток для сетевой/HTTP ошибки. Пропуск запроса.")
+                    self.metrics.count_result(action, "failed")
+                    return None
+            except Exception as e:
+                print(f"\nПроизошла неожиданная ошибка при обработке API запроса: {e}")
+                self.metrics.count_result(action, "error")
+                return None
+
+        print("\nНе удалось получить успешный ответ после максимального количества попыток.")
+        self.metrics.count_result(action, "failed")
+        return None
+
+    def _sleep(self, action, seconds):
+        self.metrics.add_wait(action, seconds, "retry_sleep_seconds")
+        os_time.sleep(seconds)
+
+    def submit(self, func, *args, **kwargs):
+        """Запускает func в пуле потоков клиента и возвращает Future."""
+        return self._executor.submit(func, *args, **kwargs)
+
+    def imap_unordered(self, func, items):
+        """
+        Выполняет func(item) параллельно для всех items.
+        Генерирует пары (item, результат) по мере готовности в вызывающем потоке,
+        поэтому внутри цикла можно безопасно обновлять прогресс (например, Streamlit).
+        """
+        futures = {self._executor.submit(func, item): item for item in items}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def map(self, func, items):
+        """Параллельный аналог map(func, items); результаты в исходном порядке."""
+        return list(self._executor.map(func, items))
+
+    def request_many(self, params_list):
+        """Параллельно выполняет набор запросов; результаты в исходном порядке."""
+        return self.map(self.request, params_list)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+def _masked(params):
+    """Параметры запроса для логов — без ключа API."""
+    return {key: value for key, value in params.items() if key != "apikey"}
+
+
+_clients = {}
+_client_options = {}
+_clients_lock = threading.Lock()
+
+
+def shared_limiters(api_key, calls_per_second=DEFAULT_CALLS_PER_SECOND, context=None):
+    """SharedTokenBucket для каждого ключа — передаются в get_client(..., limiters=...) во всех процессах."""
+    return {key: SharedTokenBucket(calls_per_second, context=context) for key in parse_api_keys(api_key)}
+
+
+def get_client(api_key, **kwargs):
+    """
+    Возвращает общий EtherscanClient для набора ключей (один пул ключей, лимитеры и соединения).
+    api_key — один ключ, строка "k1,k2", список ключей или уже созданный клиент.
+    kwargs — параметры EtherscanClient при создании. Если клиент уже создан, limiters подключаются
+    к его пулу ключей, а другие параметры, отличные от заданных при создании, дают ValueError.
+    """
+    if isinstance(api_key, EtherscanClient):
+        return api_key
+    keys = parse_api_keys(api_key)
+    limiters = kwargs.pop("limiters", None)
+    with _clients_lock:
+        client = _clients.get(keys)
+        if client is None:
+            client = EtherscanClient(keys, limiters=limiters, **kwargs)
+            _clients[keys] = client
+            _client_options[keys] = kwargs
+            return client
+        if kwargs and kwargs != _client_options[keys]:
+            raise ValueError(f"Клиент для этих ключей уже создан с другими параметрами: {_client_options[keys]} вместо {kwargs}")
+        if limiters:
+            client.key_pool.use_limiters(limiters)
+        return client
@@ -0,0 +1,345 @@
+"""
+Локальная замена Etherscan API для тестов и бенчмарков без расхода квоты ключей.
+
+    python -m src.etherscan_stub --port 8599 --days 30 --transfers-per-day 20000 --wallets 5000
+    ETHERSCAN_API_URL=http://127.0.0.1:8599/api python -m src.batch 0x...:15
+
+Обслуживает действия tokentx, getblocknobytime и tokenbalance по синтетическим данным
+или по переводам, записанным в локальном хранилище (TransferStore). Воспроизводит семантику
+ответов Etherscan: status/message/result, окно 10k результатов (page * offset), ответы о лимите
+запросов (собственный token-bucket на ключ и/или случайные), таймауты запросов и неверные ключи.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from src.etherscan_client import DEFAULT_CALLS_PER_SECOND, TokenBucket
+from src.transfer_table import ZERO_ADDRESS
+
+RESULT_WINDOW = 10000
+BLOCK_SECONDS = 12
+BLOCKS_PER_DAY = 24 * 3600 // BLOCK_SECONDS
+DEFAULT_CONTRACT = "0x514910771af9ca656af840dff83e8264ecf986ca"
+INITIAL_BALANCE = 10 ** 24  # стартовый баланс синтетических кошельков, чтобы переводы не уводили его в минус
+
+
+class ChainData:
+    """
+    Переводы одного токена в колоночном виде, отсортированные по блоку:
+    block_number, time_stamp, log_index — int64; sender, receiver — индексы в addresses;
+    values — сырые значения (int64 для синтетических данных, строки для записанных).
+    """
+
+    def __init__(self, contract, addresses, block_number, time_stamp, log_index, sender, receiver, values,
+                 tx_hashes=None, decimals=18, latest_block=None, initial_balance=0, genesis=None):
+        """genesis — время блока 0 при блоках каждые BLOCK_SECONDS секунд (иначе время блока — по переводам)."""
+        self.contract = contract.lower()
+        self.addresses = addresses
+        self.block_number = np.asarray(block_number, dtype=np.int64)
+        self.time_stamp = np.asarray(time_stamp, dtype=np.int64)
+        self.log_index = np.asarray(log_index, dtype=np.int64)
+        self.sender = np.asarray(sender, dtype=np.int64)
+        self.receiver = np.asarray(receiver, dtype=np.int64)
+        self.values = values
+        self.tx_hashes = tx_hashes
+        self.decimals = decimals
+        self.genesis = genesis
+        self.latest_block = int(latest_block if latest_block is not None else (self.block_number[-1] if len(self.block_number) else 0))
+        self._address_index = {address: i for i, address in enumerate(addresses)}
+        self._balances = self._replay_balances(initial_balance)
+
+    def __len__(self):
+        return len(self.block_number)
+
+    @classmethod
+    def synthetic(cls, days=30, transfers_per_day=20000, wallets=5000, contract=DEFAULT_CONTRACT, mint_share=0.01, seed=0, now=None):
+        """
+        Синтетическая история за days дней до now: блок каждые BLOCK_SECONDS секунд,
+        число переводов в блоке — пуассоновское, активность кошельков распределена по степенному закону.
+        """
+        rng = np.random.default_rng(seed)
+        now = int(now if now is not None else time.time())
+        n_blocks = (days + 1) * BLOCKS_PER_DAY
+        genesis = now - n_blocks * BLOCK_SECONDS
+        per_block = rng.poisson(transfers_per_day / BLOCKS_PER_DAY, n_blocks)
+        block_number = np.repeat(np.arange(n_blocks, dtype=np.int64), per_block)
+        n_transfers = len(block_number)
+        starts = np.repeat(np.cumsum(per_block) - per_block, per_block)
+        log_index = np.arange(n_transfers, dtype=np.int64) - starts
+
+        # Индекс 0 — нулевой адрес (mint/burn); кошельки с меньшими номерами активнее
+        addresses = [ZERO_ADDRESS] + [f"0x{i:040x}" for i in range(1, wallets + 1)]
+        sender = 1 + (rng.random(n_transfers) ** 3 * wallets).astype(np.int64)
+        receiver = 1 + (rng.random(n_transfers) ** 2 * wallets).astype(np.int64)
+        sender[rng.random(n_transfers) < mint_share] = 0
+        values = (10 ** rng.uniform(12, 18, n_transfers)).astype(np.int64)
+        return cls(
+            contract, addresses, block_number, genesis + block_number * BLOCK_SECONDS, log_index,
+            sender, receiver, values, latest_block=n_blocks - 1, initial_balance=INITIAL_BALANCE, genesis=genesis,
+        )
+
+    @classmethod
+    def from_store(cls, store, contract):
+        """Переводы контракта, записанные в локальном хранилище (TransferStore)."""
+        rows = [tx for page in store.iter_transfers(contract, 0, np.iinfo(np.int64).max) for tx in page]
+        addresses = list(dict.fromkeys([ZERO_ADDRESS] + [address for tx in rows for address in (tx["from"], tx["to"])]))
+        index = {address: i for i, address in enumerate(addresses)}
+        return cls(
+            contract, addresses,
+            [int(tx["blockNumber"]) for tx in rows], [int(tx["timeStamp"]) for tx in rows],
+            [int(tx["logIndex"]) for tx in rows],
+            [index[tx["from"]] for tx in rows], [index[tx["to"]] for tx in rows],
+            [tx["value"] for tx in rows], tx_hashes=[tx["hash"] for tx in rows],
+            decimals=store.get_decimals(contract) or 18,
+        )
+
+    def _replay_balances(self, initial_balance):
+        if isinstance(self.values, np.ndarray):
+            # Суммы по старшим и младшим 32 битам в float64 точны, пока не превышают 2**53
+            size = len(self.addresses)
+            high, low = (self.values >> 32).astype(np.float64), (self.values & 0xFFFFFFFF).astype(np.float64)
+            net_high = np.bincount(self.receiver, high, size) - np.bincount(self.sender, high, size)
+            net_low = np.bincount(self.receiver, low, size) - np.bincount(self.sender, low, size)
+            return {
+                i: initial_balance + (int(h) << 32) + int(l)
+                for i, (h, l) in enumerate(zip(net_high.tolist(), net_low.tolist()))
+            }
+        balances = {}
+        for sender, receiver, value in zip(self.sender.tolist(), self.receiver.tolist(), self.values):
+            balances[receiver] = balances.get(receiver, initial_balance) + int(value)
+            balances[sender] = balances.get(sender, initial_balance) - int(value)
+        return balances
+
+    def block_at(self, timestamp, closest="before"):
+        """Номер блока по времени (как getblocknobytime); None, если такого блока нет."""
+        if self.genesis is not None:
+            offset = timestamp - self.genesis
+            block = offset // BLOCK_SECONDS if closest == "before" else -(-offset // BLOCK_SECONDS)
+            return min(block, self.latest_block) if block >= 0 else (0 if closest != "before" else None)
+        times = self.time_stamp
+        if not len(times):
+            return None
+        if closest == "before":
+            position = np.searchsorted(times, timestamp, side="right") - 1
+            if position < 0:
+                return None
+            return int(self.block_number[position]) if timestamp < times[-1] else self.latest_block
+        position = np.searchsorted(times, timestamp, side="left")
+        return int(self.block_number[position]) if position < len(times) else None
+
+    def balance(self, address):
+        index = self._address_index.get(address.lower())
+        if index is None or index == 0:
+            return 0
+        return max(0, self._balances.get(index, 0))
+
+    def transfer_range(self, start_block, end_block):
+        """Индексы [first, last) переводов в блоках [start_block, end_block]."""
+        return (
+            int(np.searchsorted(self.block_number, start_block, side="left")),
+            int(np.searchsorted(self.block_number, end_block, side="right")),
+        )
+
+    def transfer(self, i):
+        """Перевод в формате ответа tokentx."""
+        block = int(self.block_number[i])
+        return {
+            "blockNumber": str(block),
+            "timeStamp": str(int(self.time_stamp[i])),
+            "hash": self.tx_hashes[i] if self.tx_hashes is not None else f"0x{i:064x}",
+            "from": self.addresses[self.sender[i]],
+            "contractAddress": self.contract,
+            "to": self.addresses[self.receiver[i]],
+            "value": str(self.values[i]),
+            "tokenName": "Stub Token",
+            "tokenSymbol": "STUB",
+            "tokenDecimal": str(self.decimals),
+            "transactionIndex": str(int(self.log_index[i])),
+            "confirmations": str(self.latest_block - block + 1),
+        }
+
+
+def _response(status, message, result):
+    return {"status": status, "message": message, "result": result}
+
+
+class EtherscanStub:
+    """
+    Обработчик запросов в стиле Etherscan поверх ChainData.
+    calls_per_second — серверный лимит на ключ (None — без лимита); rate_limit_rate и timeout_rate —
+    доли случайных ответов "Max rate limit reached" и "Query Timeout"; latency — задержка ответа в секундах.
+    api_keys — допустимые ключи (None — любой ключ допустим).
+    """
+
+    def __init__(self, chain, calls_per_second=DEFAULT_CALLS_PER_SECOND, rate_limit_rate=0.0, timeout_rate=0.0,
+                 latency=0.0, api_keys=None, seed=0):
+        self.chain = chain
+        self.calls_per_second = calls_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.latency = latency
+        self.api_keys = set(api_keys) if api_keys else None
+        self.stats = {"requests": 0, "rate_limited": 0, "timeouts": 0, "window_exceeded": 0, "actions": {}}
+        self._limiters = {}
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def _count(self, key, action=None):
+        with self._lock:
+            self.stats[key] += 1
+            if action is not None:
+                self.stats["actions"][action] = self.stats["actions"].get(action, 0) + 1
+
+    def _limiter(self, api_key):
+        with self._lock:
+            if api_key not in self._limiters:
+                self._limiters[api_key] = TokenBucket(self.calls_per_second, capacity=self.calls_per_second)
+            return self._limiters[api_key]
+
+    def handle(self, params):
+        """params — словарь параметров запроса; возвращает JSON-ответ (dict)."""
+        action = params.get("action", "")
+        self._count("requests", action)
+        if self.latency:
+            time.sleep(self.latency)
+
+        api_key = params.get("apikey", "")
+        if self.api_keys is not None and api_key not in self.api_keys:
+            return _response("0", "NOTOK", "Invalid API Key")
+        with self._lock:
+            rate_limited = self._rng.random() < self.rate_limit_rate
+            timed_out = self._rng.random() < self.timeout_rate
+        if rate_limited or (self.calls_per_second and self._limiter(api_key).try_acquire() > 0):
+            self._count("rate_limited")
+            return _response("0", "NOTOK", "Max rate limit reached")
+        if timed_out:
+            self._count("timeouts")
+            return _response("0", "NOTOK", "Query Timeout occured. Please select a smaller result dataset")
+
+        try:
+            if action == "tokentx":
+                return self._tokentx(params)
+            if action == "getblocknobytime":
+                return self._getblocknobytime(params)
+            if action == "tokenbalance":
+                return self._tokenbalance(params)
+        except (ValueError, TypeError) as e:
+            return _response("0", "NOTOK", f"Error! Invalid parameter: {e}")
+        return _response("0", "NOTOK", "Error! Missing Or invalid Action name")
+
+    def _tokentx(self, params):
+        contract = params.get("contractaddress", "").lower()
+        page = int(params.get("page", 1))
+        offset = int(params.get("offset", 10000))
+        if page * offset > RESULT_WINDOW:
+            self._count("window_exceeded")
+            return _response("0", "NOTOK", "Result window is too large, PageNo x Offset size must be less than or equal to 10000")
+        if contract != self.chain.contract:
+            return _response("0", "No transactions found", [])
+        start_block = int(params.get("startblock", 0))
+        end_block = min(int(params.get("endblock", self.chain.latest_block)), self.chain.latest_block)
+        first, last = self.chain.transfer_range(start_block, end_block)
+        if params.get("sort", "asc") == "desc":
+            indexes = range(last - 1 - (page - 1) * offset, max(first, last - page * offset) - 1, -1)
+        else:
+            indexes = range(first + (page - 1) * offset, min(last, first + page * offset))
+        result = [self.chain.transfer(i) for i in indexes]
+        if not result:
+            return _response("0", "No transactions found", [])
+        return _response("1", "OK", result)
+
+    def _getblocknobytime(self, params):
+        block = self.chain.block_at(int(params["timestamp"]), params.get("closest", "before"))
+        if block is None:
+            return _response("0", "NOTOK", "Error! No closest block found")
+        return _response("1", "OK", str(block))
+
+    def _tokenbalance(self, params):
+        if params.get("contractaddress", "").lower() != self.chain.contract:
+            return _response("1", "OK", "0")
+        return _response("1", "OK", str(self.chain.balance(params.get("address", ""))))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            body = self.server.stub.stats
+        else:
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            body = self.server.stub.handle(params)
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """HTTP-сервер заглушки; url — адрес для EtherscanClient(base_url=...) или ETHERSCAN_API_URL."""
+
+    daemon_threads = True
+
+    def __init__(self, stub, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.stub = stub
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self):
+        """Запускает сервер в фоновом потоке."""
+        self._thread = threading.Thread(target=self.serve_forever, name="etherscan-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальная замена Etherscan API (tokentx, getblocknobytime, tokenbalance).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8599)
+    parser.add_argument("--days", type=int, default=30, help="длина синтетической истории в днях")
+    parser.add_argument("--transfers-per-day", type=int, default=20000)
+    parser.add_argument("--wallets", type=int, default=5000)
+    parser.add_argument("--contract", default=DEFAULT_CONTRACT)
+    parser.add_argument("--store", help="отдавать переводы контракта из локального хранилища вместо синтетических")
+    parser.add_argument("--calls-per-second", type=float, default=DEFAULT_CALLS_PER_SECOND, help="лимит на ключ (0 — без лимита)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля случайных ответов о лимите")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="доля ответов Query Timeout")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    args = parser.parse_args(argv)
+
+    if args.store:
+        from src.transfer_store import TransferStore
+        chain = ChainData.from_store(TransferStore(args.store), args.contract)
+    else:
+        chain = ChainData.synthetic(args.days, args.transfers_per_day, args.wallets, args.contract)
+    stub = EtherscanStub(chain, args.calls_per_second or None, args.rate_limit_rate, args.timeout_rate, args.latency)
+    server = StubServer(stub, args.host, args.port)
+    print(f"Заглушка Etherscan: {server.url} (контракт {chain.contract}, переводов: {len(chain)}, блоков до {chain.latest_block})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,97 +1,67 @@
 import sys
-import time as os_time
+from concurrent.futures import FIRST_COMPLETED, wait
 from datetime import datetime, timedelta, time as dt_time
 
 import dotenv
+import numpy as np
 import pandas as pd
-import requests
 from tqdm import tqdm 
 
+from src.balance_ledger import BalanceLedger
+from src.block_index import BlockIndex
+from src.daily_aggregates import DailyPartials, WalletPartial
+from src.etherscan_client import get_client
+from src.transfer_graph import TransferGraph, TransferGraphBuilder
+from src.transfer_store import BALANCE_TTL_SECONDS, get_store
+from src.transfer_table import AddressInterner, TransferTable
+from src.wallet_metrics import WalletMetricsAccumulator, compute_wallet_metrics
+
 dotenv.load_dotenv()
 
-API_DELAY = 0.05  
+FINALITY_SECONDS = 15 * 60  # более свежие диапазоны блоков не считаются окончательно загруженными
+RESULT_WINDOW = 10000  # Etherscan отдает не больше page * offset = 10000 результатов на запрос
+LEDGER_SAMPLE_SIZE = 50  # число адресов, балансы которых запрашиваются у API для проверки леджера
 
 
-def etherscan_request(params, api_key):
-    """Отправляет запрос к Etherscan API с обработкой ошибок и задержкой."""
-    if not api_key:
-        print("Ошибка: ETHERSCAN_API_KEY не передан или не найден.")
-        return None 
+class BlockRangeFetchError(Exception):
+    """Страница переводов не получена (сеть, лимиты ключей, таймауты): диапазон блоков загружен не полностью."""
 
-    url = "https://api.etherscan.io/api"
-    params["apikey"] = api_key
-    max_retries = 4
-    retry_delay = 5
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get("status") == "1":
-                os_time.sleep(API_DELAY)
-                return data["result"]
-            elif data.get("status") == "0":
-                message = data.get("message", "")
-                result_val = data.get("result")
-
-                if "Result window is too large" in message:
-                    print(f"\n[Лимит Дня] Предупреждение: Достигнут лимит API Etherscan 10k ({message}) для запроса: {params}. Данные за этот день будут неполными.")
-                    os_time.sleep(API_DELAY)
-                    return "10k_limit"
-                elif "Max rate limit reached" in message:
-                     print(f"\nПредупреждение: Достигнут лимит запросов ({message}). Повтор через {retry_delay * (attempt + 2)} сек...")
-                     os_time.sleep(retry_delay * (attempt + 2))
-                     continue
-                elif "No transactions found" in message or "No records found" in message:
-                    os_time.sleep(API_DELAY)
-                    return None
-                elif "Invalid address format" in message:
-                    print(f"\nПредупреждение: Неверный формат адреса в запросе: {params}")
-                    os_time.sleep(API_DELAY)
-                    return None 
-                elif "Query Timeout" in message:
-                     print(f"\nПредупреждение: Таймаут запроса Etherscan ({message}). Повтор через {retry_delay * (attempt + 1)} сек...")
-                     os_time.sleep(retry_delay * (attempt + 1))
-                     continue
-                else:
-                    print(f"\nОшибка API Etherscan (Status 0): {message} | Result: {result_val} | Params: {params}")
-                    os_time.sleep(API_DELAY)
-                    return None
-            else:
-                print(f"\nНеожиданный формат ответа API Etherscan: {data}")
-                os_time.sleep(API_DELAY)
-                return None
-
-        except requests.exceptions.RequestException as e:
-            print(f"\nСетевая или HTTP ошибка во время запроса к Etherscan: {e}")
-            if attempt < max_retries - 1:
-                print(f"Повтор через {retry_delay * (attempt + 1)} секунд...")
-                os_time.sleep(retry_delay * (attempt + 1))
-            else:
-                print("Достигнуто максимальное количество попыток для сетевой/HTTP ошибки. Пропуск запроса.")
-                return None
-        except Exception as e:
-             print(f"\nПроизошла неожиданная ошибка при обработке API запроса: {e}")
-             return None
+def etherscan_request(params, api_key):
+    """
+    Отправляет запрос к Etherscan API с обработкой ошибок.
+    api_key — один ключ, строка "k1,k2" или список ключей: запросы распределяются по ключам
+    round-robin, у каждого ключа свой token-bucket лимитер.
+    """
+    return get_client(api_key).request(params)
 
-    print("\nНе удалось получить успешный ответ после максимального количества попыток.")
-    return None
+def _is_final(dt):
+    """Время достаточно далеко в прошлом, чтобы связанные с ним блоки и переводы больше не менялись."""
+    return dt <= datetime.now() - timedelta(seconds=FINALITY_SECONDS)
 
-def datetime_to_block(dt, api_key, closest="before"):
-    """Конвертирует datetime объект в примерный номер блока Ethereum."""
+def datetime_to_block(dt, api_key, closest="before", store=None):
+    """
+    Конвертирует datetime объект в примерный номер блока Ethereum.
+    Если передано хранилище, результаты для прошедшего времени кешируются в нем.
+    """
+    timestamp = int(dt.timestamp())
+    if store:
+        cached_block = store.get_block(timestamp, closest)
+        if cached_block is not None:
+            return cached_block
     params = {
         "module": "block",
         "action": "getblocknobytime",
-        "timestamp": int(dt.timestamp()),
+        "timestamp": timestamp,
         "closest": closest
     }
-    os_time.sleep(API_DELAY / 2)
     result = etherscan_request(params, api_key)
     if result and result != "10k_limit":
         try:
-            return int(result)
+            block_number = int(result)
+            if store and _is_final(dt):
+                store.put_block(timestamp, closest, block_number)
+            return block_number
         except (ValueError, TypeError):
             print(f"\nОшибка: Не удалось конвертировать результат номера блока '{result}' в целое число для {dt}.")
             return None
@@ -100,8 +70,13 @@ def datetime_to_block(dt, api_key, closest="before"):
              print(f"\nПредупреждение: Не удалось получить номер блока для {dt} из-за лимита. Результат: {result}")
         return None
 
-def fetch_token_decimals(contract_address, api_key):
-    """Получает количество десятичных знаков для токена."""
+def fetch_token_decimals(contract_address, api_key, store=None):
+    """Получает количество десятичных знаков для токена (с кешированием в хранилище, если оно передано)."""
+    if store:
+        cached_decimals = store.get_decimals(contract_address)
+        if cached_decimals is not None:
+            print(f"Десятичные знаки токена {contract_address} взяты из локального хранилища: {cached_decimals}")
+            return cached_decimals
     print(f"Получение информации о токене (десятичные знаки) для {contract_address}...")
     params_tx = {
         "module": "account",
@@ -114,6 +89,8 @@ def fetch_token_decimals(contract_address, api_key):
         try:
             decimals = int(tx_result[0].get('tokenDecimal', '18'))
             print(f"Успешно получены десятичные знаки из транзакции: {decimals}")
+            if store:
+                store.put_decimals(contract_address, decimals)
             return decimals
         except (ValueError, TypeError, KeyError) as e:
             print(f"\nНе удалось извлечь десятичные знаки из данных транзакции: {e}. Принимаем 18.")
@@ -122,225 +99,502 @@ def fetch_token_decimals(contract_address, api_key):
         print(f"\nПредупреждение: Не удалось найти транзакции для токена {contract_address}, чтобы определить десятичные знаки. Принимаем 18.")
         return 18 # Возвращаем значение по умолчанию
 
-def fetch_transactions_daily_chunks(contract_address, start_date_dt, end_date_dt, api_key, progress_callback=None):
+def _fetch_block_range(contract_address, start_block, end_block, api_key):
     """
-    Получает транзакции токена, разбивая период на дневные интервалы.
-    Возвращает список всех транзакций, множество уникальных адресов и список дат с достигнутым лимитом 10k.
+    Постранично получает транзакции токена в диапазоне блоков (страницы идут последовательно).
+    Возвращает (транзакции, next_block). next_block is None, если диапазон получен полностью.
+    Иначе ответ упёрся в окно Etherscan (10k результатов): транзакции блоков < next_block получены
+    полностью, а диапазон [next_block, end_block] нужно запросить отдельно. Если окно целиком занято
+    единственным блоком диапазона (next_block == start_block == end_block), возвращается полученная часть блока.
+    Если страницу получить не удалось, выбрасывает BlockRangeFetchError: пустой ответ API
+    ("No transactions found") и неудавшийся запрос различаются (см. EtherscanClient.request).
     """
-    print(f"\nПолучение транзакций токена {contract_address} по дням за период с {start_date_dt.date()} по {end_date_dt.date()}...")
-    all_transactions = []
-    unique_addresses = set()
-    days_with_10k_limit = []
+    range_transactions = []
+    page = 1
+    offset = 1000
+
+    while True:
+        params = {
+            "module": "account", "action": "tokentx",
+            "contractaddress": contract_address,
+            "startblock": start_block, "endblock": end_block,
+            "page": page, "offset": offset, "sort": "asc"
+        }
+        transactions_page = etherscan_request(params, api_key)
+
+        if transactions_page == "10k_limit":
+            break
+
+        if transactions_page is None:
+            raise BlockRangeFetchError(f"не получена страница {page} блоков {start_block}-{end_block}")
+        if not transactions_page or not isinstance(transactions_page, list):
+             return range_transactions, None
+
+        range_transactions.extend(
+            tx for tx in transactions_page
+            if isinstance(tx, dict) and tx.get("contractAddress", "").lower() == contract_address.lower()
+        )
+
+        if len(transactions_page) < offset:
+            return range_transactions, None
+
+        page += 1
+        if page * offset > RESULT_WINDOW:
+            break
+
+    # Окно исчерпано: последний блок ответа мог попасть в него частично
+    try:
+        next_block = max(int(tx["blockNumber"]) for tx in range_transactions)
+    except (ValueError, TypeError, KeyError):
+        next_block = start_block
+    complete_transactions = [tx for tx in range_transactions if int(tx.get("blockNumber", next_block)) < next_block]
+    if next_block == start_block == end_block:
+        # Один блок больше окна: полученная часть отдается один раз, здесь, а не на каждом уровне деления
+        complete_transactions = range_transactions
+    return complete_transactions, next_block
+
+def iter_transaction_pages(contract_address, start_date_dt, end_date_dt, api_key, progress_callback=None, store=None, days_with_10k_limit=None, interner=None):
+    """
+    Генератор страниц переводов токена (TransferTable) за период (дни с начала start_date_dt до конца end_date_dt).
+    Адреса всех страниц интернируются в общий словарь interner (AddressInterner).
+    Сначала отдает страницы из локального хранилища, затем — страницы из API по мере их получения.
+    Диапазоны блоков не пересекаются, поэтому каждая транзакция отдается ровно один раз.
+    Номера блоков и диапазоны запрашиваются параллельно через пул потоков клиента Etherscan;
+    недостающие диапазоны сохраняются в хранилище (store, см. get_store; False — без хранилища).
+    Даты, для которых данные неполные (блок больше окна 10k или диапазон, который не удалось загрузить),
+    добавляются в список days_with_10k_limit вместе с соседними днями периода: границы дней оценены
+    по индексу блоков, и блоки диапазона могут относиться к соседнему дню. Неудавшиеся диапазоны
+    не отмечаются в хранилище загруженными и запрашиваются снова при следующем запуске.
+    """
+    client = get_client(api_key)
+    store = get_store(store)
+    interner = interner if interner is not None else AddressInterner()
+    days_with_10k_limit = days_with_10k_limit if days_with_10k_limit is not None else []
     total_days = (end_date_dt.date() - start_date_dt.date()).days + 1
-    current_date = start_date_dt.date()
-    processed_days = 0
-
-    day_iterator = tqdm(range(total_days), desc="Обработка дней", unit=" день") if not progress_callback else range(total_days)
-
-    for _ in day_iterator:
-        if progress_callback:
-            progress_percentage = int((processed_days / total_days) * 100)
-            progress_callback(progress_percentage, f"Обработка дня {current_date.strftime('%Y-%m-%d')}...")
-
-        day_start_dt = datetime.combine(current_date, dt_time.min)
-        day_end_dt = datetime.combine(current_date, dt_time.max)
-
-        day_start_block = datetime_to_block(day_start_dt, api_key, closest="before")
-        day_end_block = datetime_to_block(day_end_dt, api_key, closest="before")
-
-        if day_start_block is None or day_end_block is None or day_end_block < day_start_block:
-            print(f"\nПредупреждение: Не удалось определить корректные блоки для даты {current_date}. Пропуск этого дня.")
-            current_date += timedelta(days=1)
-            processed_days += 1
-            if not progress_callback:
-                 day_iterator.update(1)
+    days = [start_date_dt.date() + timedelta(days=i) for i in range(total_days)]
+    now = datetime.now()
+
+    # 1. Границы дней: день N заканчивается там, где начинается день N+1. Точно (API или кеш)
+    #    определяются начало периода, начало последнего дня и его конец, остальные границы
+    #    интерполируются по индексу блоков (см. BlockIndex)
+    if progress_callback: progress_callback(0, "Определение номеров блоков для дней периода...")
+    boundary_times = [datetime.combine(day, dt_time.min) for day in days]
+    boundary_times.append(min(datetime.combine(days[-1], dt_time.max), now))
+    boundary_timestamps = [int(dt.timestamp()) for dt in boundary_times]
+    block_index = BlockIndex(
+        store, lambda dt: datetime_to_block(dt, api_key, closest="before", store=store), client
+    )
+    boundary_blocks = block_index.boundaries(boundary_timestamps, exact=[boundary_timestamps[-2]])
+    if boundary_blocks is None:
+        print(f"\nПредупреждение: Не удалось определить номера блоков для границ периода. Транзакции не получены.")
+        return
+    print(f"Границы {total_days} дней определены по {block_index.exact_count} точным номерам блоков.")
+    period_start_ts, period_end_ts = boundary_timestamps[0], boundary_timestamps[-1]
+
+    def mark_incomplete(day):
+        # Граница дня — оценка (BlockIndex), поэтому неполным может оказаться и соседний день
+        for incomplete_day in (day - timedelta(days=1), day, day + timedelta(days=1)):
+            if days[0] <= incomplete_day <= days[-1]:
+                days_with_10k_limit.append(incomplete_day)
+
+    days_to_fetch = []
+    for i, day in enumerate(days):
+        day_start_block = boundary_blocks[i]
+        day_end_block = boundary_blocks[i + 1] - 1 if i + 1 < total_days else boundary_blocks[-1]
+        if day_end_block >= day_start_block:
+            days_to_fetch.append((day, day_start_block, day_end_block))
+
+    # 2. Уже загруженные диапазоны отдаются из хранилища, недостающие ставятся в очередь к API.
+    #    Окончательными считаются только блоки не новее точно известного блока старше FINALITY_SECONDS
+    final_block = block_index.final_block(int((now - timedelta(seconds=FINALITY_SECONDS)).timestamp()))
+    ranges_to_fetch = []
+    for day, day_start_block, day_end_block in days_to_fetch:
+        if store is None:
+            ranges_to_fetch.append((day, day_start_block, day_end_block))
             continue
+        for start_block, end_block in store.missing_ranges(contract_address, day_start_block, day_end_block):
+            ranges_to_fetch.append((day, start_block, end_block))
+
+    cached_days = len(days_to_fetch) - len({day for day, _, _ in ranges_to_fetch})
+    print(f"Дней в локальном хранилище: {cached_days}; диапазонов блоков для загрузки из API: {len(ranges_to_fetch)}")
+
+    # 3. Параллельно загружаем недостающие диапазоны (задачи отправляются до чтения хранилища,
+    #    чтобы сеть работала, пока отдаются закешированные страницы). Диапазон, который не уместился
+    #    в окно Etherscan, делится пополам, и половины сразу ставятся в очередь
+    pending = {
+        client.submit(_fetch_block_range, contract_address, start_block, end_block, api_key): (day, start_block, end_block)
+        for day, start_block, end_block in ranges_to_fetch
+    }
 
-        page = 1
-        offset = 1000
-        daily_tx_count = 0
-        hit_limit_today = False
-
-        while True:
-            params = {
-                "module": "account", "action": "tokentx",
-                "contractaddress": contract_address,
-                "startblock": day_start_block, "endblock": day_end_block,
-                "page": page, "offset": offset, "sort": "asc"
-            }
-            transactions_page = etherscan_request(params, api_key)
-
-            if transactions_page == "10k_limit":
-                hit_limit_today = True
-                days_with_10k_limit.append(current_date)
-                print(f"-> Лимит 10k достигнут для {current_date} на странице {page}.")
-                break
-
-            if not transactions_page or not isinstance(transactions_page, list):
-                 break
-
-            page_added_count = 0
-            for tx in transactions_page:
-                 if isinstance(tx, dict) and tx.get("contractAddress", "").lower() == contract_address.lower():
-                    try:
-                        timestamp = int(tx["timeStamp"])
-                        tx_time = datetime.fromtimestamp(timestamp)
-                        if day_start_dt <= tx_time <= day_end_dt:
-                            all_transactions.append(tx)
-                            page_added_count += 1
-                            sender = tx.get("from")
-                            receiver = tx.get("to")
-                            if sender and sender != "0x0000000000000000000000000000000000000000":
-                                unique_addresses.add(sender)
-                            if receiver and receiver != "0x0000000000000000000000000000000000000000":
-                                unique_addresses.add(receiver)
-                    except (ValueError, TypeError, KeyError) as e:
-                         print(f"Предупреждение: Ошибка обработки транзакции {tx.get('hash', 'N/A')}: {e}. Пропуск.")
-                         continue
-
-            daily_tx_count += page_added_count
-
-            if len(transactions_page) < offset:
-                break #
-
-            page += 1
-            if page > 15:
-                print(f"\nПредупреждение: Достигнуто >15 страниц для дня {current_date}. Принудительный выход из пагинации дня.")
-                hit_limit_today = True # Считаем это как потенциальный лимит
-                if current_date not in days_with_10k_limit:
-                     days_with_10k_limit.append(current_date)
-                break
-
-        current_date += timedelta(days=1)
-        processed_days += 1
-        if not progress_callback:
-            day_iterator.update(1)
+    if store is not None:
+        for day, day_start_block, day_end_block in days_to_fetch:
+            for start_block, end_block in store.covered_ranges(contract_address, day_start_block, day_end_block):
+                for page in store.iter_transfer_tables(contract_address, start_block, end_block, interner):
+                    yield page.between(period_start_ts, period_end_ts)
+
+    progress_bar = tqdm(total=len(pending), desc="Обработка дней", unit=" диапазон") if not progress_callback else None
+    processed_ranges = 0
+    split_ranges = 0
+    failed_ranges = 0
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            day, start_block, end_block = pending.pop(future)
+            try:
+                range_transactions, next_block = future.result()
+                failed = False
+            except BlockRangeFetchError as e:
+                range_transactions, next_block, failed = [], None, True
+                print(f"-> Ошибка загрузки: {e} ({day}). Диапазон будет запрошен снова при следующем запуске.")
+            if store is not None and range_transactions:
+                store.add_transfers(contract_address, range_transactions)
+
+            subranges = []
+            if failed:
+                complete_end = None
+                failed_ranges += 1
+                mark_incomplete(day)
+            elif next_block is None:
+                complete_end = end_block
+            elif next_block == end_block and next_block == start_block:
+                # Один блок содержит больше переводов, чем позволяет окно Etherscan
+                complete_end = None
+                mark_incomplete(day)
+                print(f"-> Лимит 10k: блок {start_block} ({day}) содержит больше 10k переводов, данные неполные.")
+            else:
+                complete_end = next_block - 1
+                if next_block == start_block:
+                    # Окно заполнено одним начальным блоком: он запрашивается отдельно, остальное — следующим диапазоном
+                    subranges = [(day, start_block, start_block), (day, start_block + 1, end_block)]
+                elif next_block < end_block:
+                    middle = (next_block + end_block) // 2
+                    subranges = [(day, next_block, middle), (day, middle + 1, end_block)]
+                else:
+                    subranges = [(day, next_block, end_block)]
+                split_ranges += 1
+
+            if store is not None and complete_end is not None and complete_end >= start_block and final_block is not None and complete_end <= final_block:
+                store.mark_synced(contract_address, start_block, complete_end)
+            for sub_day, sub_start, sub_end in subranges:
+                pending[client.submit(_fetch_block_range, contract_address, sub_start, sub_end, api_key)] = (sub_day, sub_start, sub_end)
+
+            processed_ranges += 1
+            total_ranges = processed_ranges + len(pending)
+            if progress_bar is not None:
+                progress_bar.total = total_ranges
+                progress_bar.update(1)
+            else:
+                progress_percentage = int((processed_ranges / total_ranges) * 100)
+                progress_callback(progress_percentage, f"Загружены блоки {start_block}-{end_block} за {day.strftime('%Y-%m-%d')} ({processed_ranges}/{total_ranges})...")
 
-    if progress_callback:
-        progress_callback(100, "Завершение сбора транзакций...")
+            yield TransferTable.from_transactions(interner, range_transactions).between(period_start_ts, period_end_ts)
+
+    if progress_bar is not None:
+        progress_bar.close()
+    if split_ranges:
+        print(f"Диапазонов, разделенных из-за окна 10k результатов: {split_ranges}")
+    if failed_ranges:
+        print(f"Предупреждение: Не удалось загрузить диапазонов блоков: {failed_ranges}; данные за эти дни неполные.")
 
+def _print_fetch_summary(transaction_count, address_count, days_with_10k_limit):
     print(f"\n--- Завершено получение транзакций по дням. ---")
-    print(f"Всего найдено транзакций за период: {len(all_transactions)}")
-    print(f"Всего найдено уникальных адресов: {len(unique_addresses)}")
+    if transaction_count is not None:
+        print(f"Всего найдено транзакций за период: {transaction_count}")
+    print(f"Всего найдено уникальных адресов: {address_count}")
     if days_with_10k_limit:
-        print(f"Предупреждение: Лимит Etherscan в 10,000 транзакций был достигнут для следующих дат:")
+        print(f"Предупреждение: Данные неполные (блок больше окна Etherscan в 10,000 переводов или неудавшиеся запросы) для следующих дат:")
         unique_limit_dates = sorted(list(set(days_with_10k_limit))) # Убираем дубликаты
         for dt in unique_limit_dates:
             print(f"- {dt.strftime('%Y-%m-%d')}")
         print("Данные за эти дни могут быть неполными.")
     else:
-        print("Лимит Etherscan в 10,000 транзакций за день не был достигнут.")
+        print("Все диапазоны блоков получены полностью (с разбиением по окну 10k).")
 
-    return all_transactions, list(unique_addresses), days_with_10k_limit
+def fetch_transactions_daily_chunks(contract_address, start_date_dt, end_date_dt, api_key, progress_callback=None, store=None):
+    """
+    Получает переводы токена, разбивая период на дневные интервалы (см. iter_transaction_pages).
+    Загруженные переводы сохраняются в локальное хранилище (store, см. get_store): из API
+    запрашиваются только недостающие диапазоны блоков, общий граничный блок соседних дней
+    загружается один раз. store=False отключает сохранение между запусками.
+    Возвращает TransferTable всех переводов (по порядку блоков), список уникальных адресов
+    и список дат с достигнутым лимитом 10k.
+    """
+    print(f"\nПолучение транзакций токена {contract_address} по дням за период с {start_date_dt.date()} по {end_date_dt.date()}...")
+    days_with_10k_limit = []
+    interner = AddressInterner()
+    pages = list(iter_transaction_pages(contract_address, start_date_dt, end_date_dt, api_key, progress_callback, store, days_with_10k_limit, interner))
+    all_transactions = TransferTable.concat(interner, pages).sorted()
+    unique_addresses = all_transactions.participants()
 
-def fetch_token_balance(address, contract_address, api_key):
-    """Получает текущий баланс токена ERC-20 для адреса."""
+    if progress_callback:
+        progress_callback(100, "Завершение сбора транзакций...")
+
+    _print_fetch_summary(len(all_transactions), len(unique_addresses), days_with_10k_limit)
+    return all_transactions, unique_addresses, days_with_10k_limit
+
+def stream_wallet_metrics(contract_address, start_dt, end_dt, token_decimals, api_key, progress_callback=None, store=None, graph=None):
+    """
+    Потоковый режим: страницы транзакций сворачиваются в WalletMetricsAccumulator по мере
+    поступления и сразу отбрасываются. Пиковая память ограничена числом кошельков, а не переводов.
+    graph — необязательный TransferGraphBuilder, в который страницы передаются вместе с накопителем.
+    Возвращает накопитель (метрики без балансов) и список дат с достигнутым лимитом 10k.
+    """
+    print(f"\nПотоковый сбор транзакций токена {contract_address} за период с {start_dt.date()} по {end_dt.date()}...")
+    days_with_10k_limit = []
+    accumulator = WalletMetricsAccumulator(token_decimals, start_dt, end_dt, contract_address)
+    for page in iter_transaction_pages(contract_address, start_dt, end_dt, api_key, progress_callback, store, days_with_10k_limit, accumulator.interner):
+        accumulator.add_transactions(page)
+        if graph is not None:
+            graph.add_table(page)
+
+    if progress_callback:
+        progress_callback(100, "Завершение сбора транзакций...")
+
+    _print_fetch_summary(accumulator.transaction_count, len(accumulator.addresses), days_with_10k_limit)
+    return accumulator, days_with_10k_limit
+
+def _request_token_balance(address, contract_address, api_key, tag="latest"):
+    """Сырой баланс токена для адреса на блоке tag или None, если запрос не удался."""
     params = {
         "module": "account", "action": "tokenbalance",
-        "contractaddress": contract_address, "address": address, "tag": "latest"
+        "contractaddress": contract_address, "address": address, "tag": tag
     }
     result = etherscan_request(params, api_key)
     if result and result != "10k_limit":
         try:
             return int(result)
         except (ValueError, TypeError):
-             print(f"Предупреждение: Не удалось получить баланс для {address}. Результат: {result}. Возвращено 0.")
-             return 0
+             print(f"Предупреждение: Не удалось разобрать баланс для {address} (результат: {result}) — баланс не получен, не кэшируется.")
+             return None
     else:
-         print(f"Предупреждение: Запрос баланса для {address} не удался или достигнут лимит. Возвращено 0.")
-         return 0
-
-def calculate_period_metrics(address, all_period_transactions, token_decimals, start_dt, end_dt, contract_address, api_key):
+         print(f"Предупреждение: Запрос баланса для {address} не удался или достигнут лимит — баланс не получен, не кэшируется.")
+         return None
+
+def _contiguous_runs(days):
+    """Отсортированные даты -> список (первый день, последний день) непрерывных отрезков."""
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+def daily_wallet_metrics(contract_address, start_dt, end_dt, token_decimals, api_key, progress_callback=None, store=None):
     """
-    Рассчитывает метрики для ОДНОГО адреса на основе списка ВСЕХ транзакций за период.
-    Добавлен contract_address и api_key для получения баланса.
+    Метрики окна как слияние дневных агрегатов кошельков (WalletPartial).
+    Агрегаты дней, целиком попадающих в окно и старше FINALITY_SECONDS, берутся из хранилища;
+    остальные дни (края окна, новые дни) строятся по переводам (iter_transaction_pages), и полные
+    окончательные дни сохраняются. Сдвиг или расширение окна стоит O(дней × активных кошельков)
+    слияний вместо прохода по всем переводам.
+    Возвращает слитые агрегаты (WalletPartial) и список дат с достигнутым лимитом 10k.
     """
-    metrics = {
-        "address": address,
-        "period_total_tx_count": 0, "period_incoming_tx_count": 0, "period_outgoing_tx_count": 0,
-        "period_total_volume_in": 0.0, "period_total_volume_out": 0.0,
-        "period_avg_volume_in": 0.0, "period_avg_volume_out": 0.0,
-        "period_unique_counterparties": 0,
-        "period_first_tx_date": None, "period_last_tx_date": None, "period_active_days": 0,
-        "current_token_balance": 0.0
-    }
-
-    address_lower = address.lower()
-    contract_address_lower = contract_address.lower()
-    address_transactions = []
-    timestamps_for_address = []
-    incoming_volumes = []
-    outgoing_volumes = []
-    counterparties = set()
-
-    for tx in all_period_transactions:
-        if tx.get("contractAddress", "").lower() != contract_address_lower:
-            continue
-
-        sender = tx.get("from", "").lower()
-        receiver = tx.get("to", "").lower()
-
-        if sender == address_lower or receiver == address_lower:
-            try:
-                 timestamp = int(tx["timeStamp"])
-                 tx_time = datetime.fromtimestamp(timestamp)
-                 if start_dt <= tx_time <= end_dt:
-                     address_transactions.append(tx)
-                     timestamps_for_address.append(timestamp)
-            except (ValueError, TypeError, KeyError):
-                continue
-
-    metrics["period_total_tx_count"] = len(address_transactions)
+    store = get_store(store)
+    interner = AddressInterner()
+    days_with_10k_limit = []
+    total_days = (end_dt.date() - start_dt.date()).days + 1
+    days = [start_dt.date() + timedelta(days=i) for i in range(total_days)]
+    cutoff = datetime.now() - timedelta(seconds=FINALITY_SECONDS)
+    reusable = [
+        day for day in days
+        if start_dt <= datetime.combine(day, dt_time.min) and datetime.combine(day, dt_time.max) <= min(end_dt, cutoff)
+    ]
 
-    if not address_transactions:
-        raw_balance = fetch_token_balance(address, contract_address, api_key)
+    stored = store.get_daily_partials(contract_address, reusable, token_decimals) if store is not None else {}
+    partials = {day: WalletPartial.from_bytes(interner, data) for day, data in stored.items()}
+    partials = {day: partial for day, partial in partials.items() if partial is not None}
+    missing = [day for day in days if day not in partials]
+    print(f"\nДневных агрегатов в локальном хранилище: {len(partials)} из {total_days}; дней для расчета по переводам: {len(missing)}")
+
+    builder = DailyPartials(token_decimals, start_dt.timestamp(), end_dt.timestamp())
+    for run_start, run_end in _contiguous_runs(missing):
+        run_start_dt = max(start_dt, datetime.combine(run_start, dt_time.min))
+        run_end_dt = min(end_dt, datetime.combine(run_end, dt_time.max))
+        for page in iter_transaction_pages(contract_address, run_start_dt, run_end_dt, api_key, progress_callback, store, days_with_10k_limit, interner):
+            builder.add_table(page)
+
+    incomplete_days = set(days_with_10k_limit)
+    for day in missing:
+        partials[day] = builder.get(day) or WalletPartial.empty(interner)
+        if store is not None and day in reusable and day not in incomplete_days:
+            store.put_daily_partial(contract_address, day, token_decimals, partials[day].to_bytes())
+
+    window = WalletPartial.merge([partials[day] for day in days], interner)
+    if progress_callback:
+        progress_callback(100, "Завершение сбора транзакций...")
+    _print_fetch_summary(None, len(window), days_with_10k_limit)
+    return window, days_with_10k_limit
 
-        metrics["current_token_balance"] = raw_balance / (10 ** token_decimals) if token_decimals and raw_balance else 0.0
-        return metrics
+def fetch_token_balance(address, contract_address, api_key, tag="latest"):
+    """Получает текущий баланс токена ERC-20 для адреса."""
+    raw_balance = _request_token_balance(address, contract_address, api_key, tag)
+    return raw_balance if raw_balance is not None else 0
 
-    timestamps_for_address.sort()
-    metrics["period_first_tx_date"] = datetime.fromtimestamp(timestamps_for_address[0])
-    metrics["period_last_tx_date"] = datetime.fromtimestamp(timestamps_for_address[-1])
+def fetch_token_balances(addresses, contract_address, api_key, progress_callback=None, store=None, tag="latest", ttl=BALANCE_TTL_SECONDS):
+    """
+    Параллельно (под общим лимитером клиента) получает балансы токена для набора адресов.
+    Балансы кешируются в хранилище (store, см. get_store) по (контракт, адрес, tag) на ttl секунд:
+    повторный анализ того же токена в пределах ttl не делает запросов балансов.
+    Неудавшиеся запросы дают баланс 0 и не кешируются.
+    Возвращает словарь {адрес: сырой баланс (int)}.
+    """
+    client = get_client(api_key)
+    store = get_store(store)
+    addresses = list(addresses)
+    total_addresses = len(addresses)
+    balances = store.get_balances(contract_address, addresses, tag, ttl) if store is not None else {}
+    missing = [address for address in addresses if address not in balances]
+    cached_count = total_addresses - len(missing)
+    print(f"Балансов в локальном хранилище: {cached_count}; запросов к API: {len(missing)}")
+    if progress_callback and total_addresses:
+        progress_callback(int(cached_count / total_addresses * 100), f"Балансы из локального хранилища: {cached_count}/{total_addresses}")
+
+    completed = client.imap_unordered(
+        lambda address: _request_token_balance(address, contract_address, api_key, tag), missing
+    )
+    address_iterator = tqdm(completed, total=len(missing), desc="Получение балансов", unit=" кошелек") if not progress_callback else completed
+
+    fetched = {}
+    for processed_addresses, (address, raw_balance) in enumerate(address_iterator, start=cached_count + 1):
+        balances[address] = raw_balance if raw_balance is not None else 0
+        if raw_balance is not None:
+            fetched[address] = raw_balance
+        if store is not None and len(fetched) >= 1000:
+            store.put_balances(contract_address, fetched, tag)
+            fetched = {}
+        if progress_callback:
+            progress_percentage = int((processed_addresses / total_addresses) * 100)
+            progress_callback(progress_percentage, f"Получен баланс для адреса {address[:6]}...{address[-4:]} ({processed_addresses}/{total_addresses})")
 
-    unique_days = set(datetime.fromtimestamp(ts).date() for ts in timestamps_for_address)
-    metrics["period_active_days"] = len(unique_days)
+    if store is not None and fetched:
+        store.put_balances(contract_address, fetched, tag)
+    return balances
 
-    for tx in address_transactions:
-        try:
-            value_raw = int(tx.get("value", '0'))
-            value_adjusted = value_raw / (10 ** token_decimals) if token_decimals else 0.0
-        except (ValueError, TypeError):
-            value_adjusted = 0.0
-
-        sender = tx.get("from", "").lower()
-        receiver = tx.get("to", "").lower()
-
-        if sender == address_lower:
-            metrics["period_outgoing_tx_count"] += 1
-            outgoing_volumes.append(value_adjusted)
-            if receiver != address_lower and receiver != "0x0000000000000000000000000000000000000000":
-                 counterparties.add(receiver)
-        elif receiver == address_lower:
-            metrics["period_incoming_tx_count"] += 1
-            incoming_volumes.append(value_adjusted)
-            if sender != address_lower and sender != "0x0000000000000000000000000000000000000000":
-                counterparties.add(sender)
-
-    metrics["period_total_volume_in"] = sum(incoming_volumes)
-    metrics["period_total_volume_out"] = sum(outgoing_volumes)
-    metrics["period_avg_volume_in"] = metrics["period_total_volume_in"] / metrics["period_incoming_tx_count"] if metrics["period_incoming_tx_count"] > 0 else 0.0
-    metrics["period_avg_volume_out"] = metrics["period_total_volume_out"] / metrics["period_outgoing_tx_count"] if metrics["period_outgoing_tx_count"] > 0 else 0.0
-    metrics["period_unique_counterparties"] = len(counterparties)
-
-    # Получаем текущий баланс в конце
-    raw_balance = fetch_token_balance(address, contract_address, api_key)
-    metrics["current_token_balance"] = raw_balance / (10 ** token_decimals) if token_decimals and raw_balance else 0.0
+def ledger_token_balances(addresses, contract_address, api_key, transactions=None, store=None, sample_size=LEDGER_SAMPLE_SIZE, progress_callback=None, ttl=BALANCE_TTL_SECONDS):
+    """
+    Балансы без запроса по каждому адресу: переводы воспроизводятся в BalanceLedger от опорных точек.
+    История переводов — всё локальное хранилище контракта (store, см. get_store) или, без хранилища,
+    transactions (TransferTable периода). Значению леджера доверяют, только если история без пропусков
+    начинается с первого перевода токена или у адреса есть опорная точка; балансы остальных адресов
+    берутся из fetch_token_balances (с кешем на ttl секунд).
+    Для проверки у API запрашиваются балансы случайной выборки из sample_size адресов с доверенным
+    значением и всех адресов с отрицательным балансом по леджеру (признак неполной истории). Если
+    проверка не прошла, через fetch_token_balances запрашиваются балансы всех непроверенных адресов.
+    Проверенные балансы сохраняются в хранилище как опорные точки для следующих запусков — только если
+    после последнего воспроизведенного блока у токена нет переводов (иначе баланс "latest" не относится к этому блоку).
+    Возвращает словарь {адрес: сырой баланс (int)} или None, если истории переводов нет.
+    """
+    store = get_store(store)
+    if store is None and transactions is None:
+        return None
+    addresses = list(addresses)
+    checkpoints = store.get_checkpoints(contract_address) if store is not None else {}
+    ledger = BalanceLedger(transactions.interner if transactions is not None else None, checkpoints)
+
+    if progress_callback: progress_callback(0, "Воспроизведение истории переводов для балансов...")
+    if store is not None:
+        for page in store.iter_transfer_tables(contract_address, 0, np.iinfo(np.int64).max, ledger.interner):
+            ledger.add_transactions(page)
+    else:
+        ledger.add_transactions(transactions)
+    balances = ledger.balances(addresses)
+    print(f"Балансы восстановлены по {ledger.transfer_count} переводам (опорных точек: {len(checkpoints)}).")
+
+    complete = _history_from_first_transfer(contract_address, api_key, store, transactions, ledger.last_block)
+    trusted = {address for address in addresses if complete or address.lower() in checkpoints}
+    print(f"Балансов по леджеру с полной историей или опорной точкой: {len(trusted)} из {len(addresses)}.")
+
+    negative = [address for address in addresses if balances[address] < 0]
+    rng = np.random.default_rng()
+    candidates = [address for address in addresses if address in trusted and address.lower() not in checkpoints and balances[address] >= 0]
+    sample = [candidates[i] for i in rng.choice(len(candidates), min(sample_size, len(candidates)), replace=False)] if candidates else []
+    # Для опорных точек нужен баланс на момент последнего воспроизведенного блока, поэтому кеш балансов не используется,
+    # а неудавшиеся запросы не становятся опорными точками
+    completed = get_client(api_key).imap_unordered(
+        lambda address: _request_token_balance(address, contract_address, api_key), sample + negative
+    )
+    checked = {address: raw_balance for address, raw_balance in completed if raw_balance is not None}
+
+    matched = sum(1 for address in sample if checked.get(address) == balances[address])
+    print(f"Проверка леджера: совпало {matched} из {len(sample)} выборочных балансов; "
+          f"адресов с отрицательным балансом (неполная история): {len(negative)}.")
+    if sample and matched < len(sample):
+        print("Предупреждение: История переводов в хранилище неполная — балансы непроверенных адресов запрашиваются у API.")
+        unverified = [address for address in addresses if address not in checked]
+    else:
+        unverified = [address for address in addresses if address not in trusted and address not in checked]
+    balances.update(checked)
+    if unverified:
+        balances.update(fetch_token_balances(unverified, contract_address, api_key, progress_callback, store, ttl=ttl))
+    if store is not None and ledger.last_block is not None and checked:
+        # Баланс "latest" равен балансу на ledger.last_block, только если после него переводов не было;
+        # проверка идет после запросов балансов, поэтому переводы между ними тоже учитываются
+        if _has_transfers_after(contract_address, ledger.last_block, api_key) is False:
+            store.put_checkpoints(contract_address, {address: (ledger.last_block, balance) for address, balance in checked.items()})
+        else:
+            print(f"Опорные точки не сохранены: история в хранилище не доходит до текущего блока (последний блок {ledger.last_block}).")
+    return balances
+
+def _history_from_first_transfer(contract_address, api_key, store, transactions, last_block):
+    """Начинается ли воспроизводимая история с первого перевода токена и идет ли без пропусков до last_block."""
+    if last_block is None:
+        return False
+    params = {
+        "module": "account", "action": "tokentx",
+        "contractaddress": contract_address,
+        "page": 1, "offset": 1, "sort": "asc"
+    }
+    result = etherscan_request(params, api_key)
+    if not result or not isinstance(result, list):
+        return False
+    first_block = int(result[0]["blockNumber"])
+    if store is not None:
+        return not store.missing_ranges(contract_address, first_block, last_block)
+    return bool(len(transactions)) and int(transactions.block_number.min()) <= first_block
+
+def _has_transfers_after(contract_address, block_number, api_key):
+    """True, если у токена есть переводы новее блока block_number; None, если запрос не удался."""
+    params = {
+        "module": "account", "action": "tokentx",
+        "contractaddress": contract_address,
+        "startblock": block_number + 1, "endblock": 99999999,
+        "page": 1, "offset": 1, "sort": "asc"
+    }
+    result = etherscan_request(params, api_key)
+    if result is None or not isinstance(result, list):
+        return None
+    return len(result) > 0
 
+def calculate_period_metrics(address, all_period_transactions, token_decimals, start_dt, end_dt, contract_address, api_key):
+    """
+    Рассчитывает метрики для ОДНОГО адреса на основе списка ВСЕХ транзакций за период.
+    Добавлен contract_address и api_key для получения баланса.
+    Для множества адресов используйте compute_wallet_metrics — он считает всё за один проход.
+    """
+    balances = {address: fetch_token_balance(address, contract_address, api_key)}
+    df = compute_wallet_metrics(
+        all_period_transactions, [address], token_decimals, start_dt, end_dt, contract_address, balances
+    )
+    metrics = df.iloc[0].to_dict()
+    for key in ("period_first_tx_date", "period_last_tx_date"):
+        metrics[key] = metrics[key].to_pydatetime() if pd.notna(metrics[key]) else None
     return metrics
 
-def run_fetch_and_process(target_token_contract_address, days_back, api_key, progress_callback=None):
+def run_fetch_and_process(target_token_contract_address, days_back, api_key, progress_callback=None, store=None, stream=False, balance_ttl=BALANCE_TTL_SECONDS, balance_mode="api", daily=True, graph_features=False):
     """
     Основная функция для запуска сбора и обработки данных кошелька.
+    store — локальное хранилище переводов и балансов (см. fetch_transactions_daily_chunks);
+    balance_ttl — срок жизни закешированных балансов в секундах (см. fetch_token_balances).
+    balance_mode="ledger" — балансы восстанавливаются по истории переводов (см. ledger_token_balances)
+    вместо запроса по каждому адресу; без истории (потоковый режим без хранилища) — запрос к API.
+    Режим сбора метрик выбирается в порядке приоритета:
+    daily=True (только при наличии хранилища) — метрики собираются из дневных агрегатов (см. daily_wallet_metrics),
+    значение stream при этом не учитывается;
+    stream=True — потоковый режим (см. stream_wallet_metrics): список транзакций периода
+    не собирается в памяти, метрики накапливаются по мере загрузки страниц;
+    иначе — список всех транзакций периода (см. fetch_transactions_daily_chunks).
+    graph_features=True — к метрикам добавляются признаки графа контрагентов (GRAPH_COLUMNS, см. TransferGraph).
     Возвращает DataFrame с метриками или None в случае критической ошибки.
     Также возвращает список дат, где был достигнут лимит 10k.
     """
@@ -360,16 +614,41 @@ def run_fetch_and_process(target_token_contract_address, days_back, api_key, pro
     print("-" * 60)
 
     if progress_callback: progress_callback(0, "Получение параметров токена...")
-    token_decimals = fetch_token_decimals(target_token_contract_address, api_key)
+    token_decimals = fetch_token_decimals(target_token_contract_address, api_key, get_store(store))
     if token_decimals is None:
          print("Критическая ошибка: Не удалось определить десятичные знаки токена.")
          return None, []
     print(f"Используется {token_decimals} десятичных знаков для токена.")
     print("-" * 60)
 
-    all_transactions, unique_addresses, days_hit_limit = fetch_transactions_daily_chunks(
-        target_token_contract_address, start_date_dt, end_date_dt, api_key, progress_callback
-    )
+    all_transactions = None
+    graph = None
+    daily = daily and get_store(store) is not None
+    if daily:
+        window, days_hit_limit = daily_wallet_metrics(
+            target_token_contract_address, start_date_dt, end_date_dt, token_decimals, api_key, progress_callback, store
+        )
+        unique_addresses = window.addresses
+        if graph_features:
+            graph = TransferGraph.from_partial(window)
+    elif stream:
+        builder = TransferGraphBuilder(
+            token_decimals, start_date_dt.timestamp(), end_date_dt.timestamp()
+        ) if graph_features else None
+        accumulator, days_hit_limit = stream_wallet_metrics(
+            target_token_contract_address, start_date_dt, end_date_dt, token_decimals, api_key, progress_callback, store, builder
+        )
+        unique_addresses = accumulator.addresses
+        if builder is not None:
+            graph = builder.build()
+    else:
+        all_transactions, unique_addresses, days_hit_limit = fetch_transactions_daily_chunks(
+            target_token_contract_address, start_date_dt, end_date_dt, api_key, progress_callback, store
+        )
+        if graph_features:
+            graph = TransferGraph.from_table(
+                all_transactions, token_decimals, start_date_dt.timestamp(), end_date_dt.timestamp()
+            )
 
     if not unique_addresses:
         print("\nНе найдено адресов, взаимодействовавших с токеном в указанный период.")
@@ -379,44 +658,48 @@ def run_fetch_and_process(target_token_contract_address, days_back, api_key, pro
     addresses_to_process = unique_addresses
     print("-" * 60)
 
-    all_wallet_metrics = []
     total_addresses = len(addresses_to_process)
-    processed_addresses = 0
-    print(f"\n--- Расчет метрик для {total_addresses} адресов ---")
-
-    address_iterator = tqdm(addresses_to_process, desc="Обработка кошельков", unit=" кошелек") if not progress_callback else addresses_to_process
-
-    for address in address_iterator:
-         if progress_callback:
-             progress_percentage = int((processed_addresses / total_addresses) * 100)
-             progress_callback(progress_percentage, f"Расчет метрик для адреса {address[:6]}...{address[-4:]} ({processed_addresses+1}/{total_addresses})")
-
-         metrics = calculate_period_metrics(
-             address,
-             all_transactions,
-             token_decimals,
-             start_date_dt,
-             end_date_dt,
-             target_token_contract_address,
-             api_key
-         )
-         if metrics:
-             all_wallet_metrics.append(metrics)
-         processed_addresses += 1
-         if not progress_callback:
-             address_iterator.update(1)
+    print(f"\n--- Получение балансов для {total_addresses} адресов ---")
+
+    balances = None
+    if balance_mode == "ledger":
+        balances = ledger_token_balances(
+            addresses_to_process, target_token_contract_address, api_key,
+            all_transactions, store, progress_callback=progress_callback, ttl=balance_ttl
+        )
+        if balances is None:
+            print("Нет истории переводов для леджера (потоковый режим без хранилища) — балансы запрашиваются у API.")
+    if balances is None:
+        balances = fetch_token_balances(
+            addresses_to_process, target_token_contract_address, api_key, progress_callback, store, ttl=balance_ttl
+        )
 
     if progress_callback:
-        progress_callback(100, "Завершение расчета метрик...")
+        progress_callback(100, "Расчет метрик кошельков...")
+
+    print(f"\n--- Расчет метрик для {total_addresses} адресов ---")
+    if daily:
+        df = window.to_frame(token_decimals, balances)
+    elif stream:
+        df = accumulator.to_frame(balances)
+    else:
+        df = compute_wallet_metrics(
+            all_transactions,
+            addresses_to_process,
+            token_decimals,
+            start_date_dt,
+            end_date_dt,
+            target_token_contract_address,
+            balances
+        )
 
     print("\n--- Завершен расчет метрик ---")
     print("-" * 60)
 
-    if not all_wallet_metrics:
+    if df.empty:
         print("Нет данных для создания DataFrame.")
         return pd.DataFrame(), days_hit_limit
 
-    df = pd.DataFrame(all_wallet_metrics)
     column_order = [
         "address", "current_token_balance",
         "period_total_tx_count", "period_incoming_tx_count", "period_outgoing_tx_count",
@@ -427,13 +710,17 @@ def run_fetch_and_process(target_token_contract_address, days_back, api_key, pro
     existing_columns = [col for col in column_order if col in df.columns]
     df = df.reindex(columns=existing_columns)
 
+    if graph is not None:
+        print(f"\n--- Признаки графа контрагентов: {len(graph)} узлов, {graph.edge_count} ребер ---")
+        df = df.merge(graph.features(df["address"].tolist()), on="address", how="left")
+
     print(f"Сформирован DataFrame с {len(df)} строками.")
 
 
     if days_hit_limit:
         print("\n*** ВАЖНОЕ ПРЕДУПРЕЖДЕНИЕ (fetch_wallet) ***")
-        print("Из-за достижения лимита Etherscan в 10,000 транзакций для некоторых дней,")
-        print("общий список транзакций и рассчитанные метрики могут быть НЕПОЛНЫМИ.")
+        print("Из-за блоков, содержащих больше 10,000 переводов (лимит Etherscan на один запрос), или диапазонов,")
+        print("которые не удалось загрузить, общий список транзакций и рассчитанные метрики могут быть НЕПОЛНЫМИ.")
         print("Даты с потенциально неполными данными:")
         for dt in sorted(list(set(days_hit_limit))): print(f"- {dt.strftime('%Y-%m-%d')}")
         print("****************************")
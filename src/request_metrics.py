@@ -0,0 +1,153 @@
+import copy
+import json
+import threading
+import time
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # секунды, верхние границы корзин гистограммы
+
+
+def _empty_action():
+    return {
+        "requests": 0,            # HTTP-запросы (включая повторы)
+        "results": {},            # исходы: ok, empty, window, error, failed
+        "retries": {},            # повторы по причинам: rate_limited, invalid_key, query_timeout, network
+        "rate_limit_hits": 0,
+        "window_hits": 0,
+        "bytes_received": 0,
+        "limiter_wait_seconds": 0.0,  # ожидание свободного ключа/токена лимитера (сумма по потокам)
+        "retry_sleep_seconds": 0.0,   # паузы перед повторами
+        "latency_sum": 0.0,
+        "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1),  # последняя корзина — +Inf
+    }
+
+
+class RequestMetrics:
+    """
+    Потокобезопасные счетчики запросов клиента Etherscan по действиям (tokentx, getblocknobytime, tokenbalance...):
+    исходы, повторы по причинам, ответы о лимите и окне 10k, полученные байты, время ожидания
+    и гистограмма задержек HTTP-ответов. Экспорт — snapshot (dict), to_json и to_prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._actions = {}
+            self.started = time.monotonic()
+
+    def _action(self, action):
+        return self._actions.setdefault(action or "unknown", _empty_action())
+
+    def observe_response(self, action, seconds, nbytes):
+        """HTTP-ответ получен за seconds секунд, nbytes байт."""
+        with self._lock:
+            stats = self._action(action)
+            stats["requests"] += 1
+            stats["bytes_received"] += nbytes
+            stats["latency_sum"] += seconds
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            stats["latency_buckets"][bucket] += 1
+
+    def observe_failure(self, action, seconds):
+        """HTTP-запрос завершился сетевой ошибкой за seconds секунд."""
+        self.observe_response(action, seconds, 0)
+
+    def count_result(self, action, outcome):
+        with self._lock:
+            stats = self._action(action)
+            stats["results"][outcome] = stats["results"].get(outcome, 0) + 1
+            if outcome == "window":
+                stats["window_hits"] += 1
+
+    def count_retry(self, action, reason):
+        with self._lock:
+            stats = self._action(action)
+            stats["retries"][reason] = stats["retries"].get(reason, 0) + 1
+            if reason == "rate_limited":
+                stats["rate_limit_hits"] += 1
+
+    def add_wait(self, action, seconds, kind="limiter_wait_seconds"):
+        """Время, проведенное в ожидании: kind — limiter_wait_seconds или retry_sleep_seconds."""
+        with self._lock:
+            self._action(action)[kind] += seconds
+
+    def snapshot(self):
+        """Копия счетчиков: {"elapsed_seconds", "actions": {действие: счетчики}, "total": сумма по действиям}."""
+        with self._lock:
+            actions = copy.deepcopy(self._actions)
+            elapsed = time.monotonic() - self.started
+        total = _empty_action()
+        for stats in actions.values():
+            for key, value in stats.items():
+                if isinstance(value, dict):
+                    for reason, count in value.items():
+                        total[key][reason] = total[key].get(reason, 0) + count
+                elif isinstance(value, list):
+                    total[key] = [a + b for a, b in zip(total[key], value)]
+                else:
+                    total[key] += value
+        return {"elapsed_seconds": elapsed, "actions": actions, "total": total}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), ensure_ascii=False, **kwargs)
+
+    def to_prometheus(self, prefix="etherscan"):
+        """Счетчики в текстовом формате Prometheus (гистограмма задержек — с накопленными корзинами)."""
+        actions = self.snapshot()["actions"]
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}")
+
+        family("requests_total", "counter", "HTTP requests sent, including retries.",
+               [({"action": action}, stats["requests"]) for action, stats in actions.items()])
+        family("results_total", "counter", "Request outcomes.",
+               [({"action": action, "outcome": outcome}, count)
+                for action, stats in actions.items() for outcome, count in stats["results"].items()])
+        family("retries_total", "counter", "Retries by reason.",
+               [({"action": action, "reason": reason}, count)
+                for action, stats in actions.items() for reason, count in stats["retries"].items()])
+        family("rate_limit_hits_total", "counter", "Max rate limit responses.",
+               [({"action": action}, stats["rate_limit_hits"]) for action, stats in actions.items()])
+        family("window_hits_total", "counter", "Result window (10k) responses.",
+               [({"action": action}, stats["window_hits"]) for action, stats in actions.items()])
+        family("received_bytes_total", "counter", "Response bytes received.",
+               [({"action": action}, stats["bytes_received"]) for action, stats in actions.items()])
+        family("sleep_seconds_total", "counter", "Time spent waiting for the rate limiter or before retries.",
+               [({"action": action, "kind": kind.replace("_seconds", "")}, stats[kind])
+                for action, stats in actions.items() for kind in ("limiter_wait_seconds", "retry_sleep_seconds")])
+
+        lines.append(f"# HELP {prefix}_request_latency_seconds HTTP response latency.")
+        lines.append(f"# TYPE {prefix}_request_latency_seconds histogram")
+        for action, stats in actions.items():
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), stats["latency_buckets"]):
+                cumulative += count
+                lines.append(f'{prefix}_request_latency_seconds_bucket{{action="{action}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_request_latency_seconds_sum{{action="{action}"}} {stats["latency_sum"]}')
+            lines.append(f'{prefix}_request_latency_seconds_count{{action="{action}"}} {stats["requests"]}')
+        return "\n".join(lines) + "\n"
+
+    def summary_rows(self):
+        """Строки для таблицы (по одной на действие): запросы, повторы, ответы о лимите/окне, задержка, ожидание."""
+        rows = []
+        for action, stats in sorted(self.snapshot()["actions"].items()):
+            rows.append({
+                "action": action,
+                "requests": stats["requests"],
+                "ok": stats["results"].get("ok", 0),
+                "retries": sum(stats["retries"].values()),
+                "rate_limit_hits": stats["rate_limit_hits"],
+                "window_hits": stats["window_hits"],
+                "avg_latency_s": round(stats["latency_sum"] / stats["requests"], 3) if stats["requests"] else 0.0,
+                "limiter_wait_s": round(stats["limiter_wait_seconds"], 1),
+                "retry_sleep_s": round(stats["retry_sleep_seconds"], 1),
+                "MB_received": round(stats["bytes_received"] / 1e6, 2),
+            })
+        return rows
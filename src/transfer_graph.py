@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from src.transfer_table import AddressInterner
+
+GRAPH_COLUMNS = [
+    "graph_in_degree", "graph_out_degree",
+    "graph_weighted_in_degree", "graph_weighted_out_degree",
+    "graph_pagerank", "graph_clustering", "graph_component_size",
+]
+
+
+class TransferGraph:
+    """
+    Разреженный граф переводов адрес -> адрес (scipy.sparse CSR) по id из AddressInterner.
+    volume — суммарный объем переводов по ребру (в единицах токена), count — число переводов.
+    Нулевой адрес (mint/burn) и переводы самому себе в граф не входят.
+    """
+
+    def __init__(self, interner, node_ids, volume, count):
+        self.interner = interner
+        self.node_ids = node_ids
+        self.volume = volume
+        self.count = count
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self):
+        return self.count.nnz
+
+    @classmethod
+    def from_edges(cls, interner, senders, receivers, volumes, counts=None):
+        """Граф из массивов ребер (id отправителя, id получателя, объем[, число переводов]); повторы суммируются."""
+        senders, receivers = np.asarray(senders, dtype=np.int64), np.asarray(receivers, dtype=np.int64)
+        volumes = np.asarray(volumes, dtype=np.float64)
+        counts = np.ones(len(senders), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        mask = (senders > AddressInterner.ZERO_ID) & (receivers > AddressInterner.ZERO_ID) & (senders != receivers)
+        senders, receivers, volumes, counts = senders[mask], receivers[mask], volumes[mask], counts[mask]
+        node_ids, nodes = np.unique(np.concatenate([senders, receivers]), return_inverse=True)
+        rows, cols = nodes[:len(senders)], nodes[len(senders):]
+        shape = (len(node_ids), len(node_ids))
+        volume = sparse.csr_matrix((volumes, (rows, cols)), shape=shape)
+        count = sparse.csr_matrix((counts, (rows, cols)), shape=shape)
+        volume.sum_duplicates()
+        count.sum_duplicates()
+        return cls(interner, node_ids, volume, count)
+
+    @classmethod
+    def from_table(cls, table, token_decimals, start_timestamp=None, end_timestamp=None):
+        """Граф по TransferTable (только переводы в [start_timestamp, end_timestamp], если интервал задан)."""
+        if start_timestamp is not None:
+            table = table.between(start_timestamp, end_timestamp)
+        return cls.from_edges(table.interner, table.sender, table.receiver, table.token_values(token_decimals))
+
+    @classmethod
+    def from_partial(cls, partial):
+        """Граф по ребрам дневных агрегатов (WalletPartial)."""
+        return cls.from_edges(
+            partial.interner, partial.edge_pairs >> 32, partial.edge_pairs & 0xFFFFFFFF,
+            partial.edge_volume, partial.edge_count,
+        )
+
+    def _structure(self):
+        """Бинарная матрица смежности (ребро есть, если был хотя бы один перевод)."""
+        structure = self.count.copy()
+        structure.data = np.ones_like(structure.data, dtype=np.float64)
+        return structure
+
+    def pagerank(self, damping=0.85, tol=1e-10, max_iter=100):
+        """PageRank по объемам переводов; узлы без исходящего объема распределяют ранг равномерно."""
+        size = len(self)
+        if not size:
+            return np.zeros(0)
+        out_volume = np.asarray(self.volume.sum(axis=1)).ravel()
+        dangling = out_volume <= 0
+        inverse = np.where(dangling, 0.0, 1.0 / np.where(dangling, 1.0, out_volume))
+        transition = sparse.diags(inverse) @ self.volume  # строки нормированы по исходящему объему
+        transition_t = transition.T.tocsr()
+        rank = np.full(size, 1.0 / size)
+        for _ in range(max_iter):
+            updated = damping * (transition_t @ rank + rank[dangling].sum() / size) + (1.0 - damping) / size
+            converged = np.abs(updated - rank).sum() < tol
+            rank = updated
+            if converged:
+                break
+        return rank
+
+    def clustering(self):
+        """
+        Коэффициент кластеризации неориентированного невзвешенного графа.
+        Треугольники считаются по ориентации ребер от узла с меньшей степенью к большей:
+        каждый треугольник (u -> v -> w, u -> w) встречается ровно один раз, и произведения матриц
+        не разрастаются на узлах-хабах.
+        """
+        size = len(self)
+        if not size:
+            return np.zeros(0)
+        undirected = self._structure()
+        undirected = ((undirected + undirected.T) > 0).astype(np.float64).tocsr()
+        degree = np.asarray(undirected.sum(axis=1)).ravel()
+
+        coo = undirected.tocoo()
+        rank = np.lexsort((np.arange(size), degree))
+        order = np.empty(size, dtype=np.int64)
+        order[rank] = np.arange(size)
+        forward = order[coo.row] < order[coo.col]
+        oriented = sparse.csr_matrix(
+            (np.ones(int(forward.sum())), (coo.row[forward], coo.col[forward])), shape=(size, size)
+        )
+        closing = (oriented @ oriented).multiply(oriented)        # (u, w): число v с u -> v -> w
+        middle = oriented.multiply(oriented.T @ oriented)          # (v, w): число u с u -> v, u -> w
+        triangles = (
+            np.asarray(closing.sum(axis=1)).ravel()
+            + np.asarray(closing.sum(axis=0)).ravel()
+            + np.asarray(middle.sum(axis=1)).ravel()
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(degree > 1, 2.0 * triangles / (degree * (degree - 1)), 0.0)
+
+    def component_sizes(self):
+        """Размер слабо связной компоненты для каждого узла."""
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+        _, labels = connected_components(self.count, directed=True, connection="weak")
+        return np.bincount(labels)[labels]
+
+    def features(self, addresses=None):
+        """
+        DataFrame признаков (address + GRAPH_COLUMNS) для addresses (по умолчанию — все узлы графа).
+        Адреса вне графа получают нулевые признаки и компоненту размера 1.
+        """
+        structure = self._structure()
+        columns = {
+            "graph_in_degree": np.asarray(structure.sum(axis=0)).ravel(),
+            "graph_out_degree": np.asarray(structure.sum(axis=1)).ravel(),
+            "graph_weighted_in_degree": np.asarray(self.volume.sum(axis=0)).ravel(),
+            "graph_weighted_out_degree": np.asarray(self.volume.sum(axis=1)).ravel(),
+            "graph_pagerank": self.pagerank(),
+            "graph_clustering": self.clustering(),
+            "graph_component_size": self.component_sizes(),
+        }
+        if addresses is None:
+            addresses = [self.interner.address(node_id) for node_id in self.node_ids]
+        ids = np.array([self.interner.lookup(address) for address in addresses], dtype=np.int64)
+        position = np.minimum(np.searchsorted(self.node_ids, ids), max(len(self) - 1, 0))
+        found = self.node_ids[position] == ids if len(self) else np.zeros(len(ids), dtype=bool)
+        frame = {"address": list(addresses)}
+        for name in GRAPH_COLUMNS:
+            default = 1 if name == "graph_component_size" else 0
+            frame[name] = np.where(found, columns[name][position], default) if len(self) else np.full(len(ids), default)
+        return pd.DataFrame(frame, columns=["address"] + GRAPH_COLUMNS)
+
+
+class TransferGraphBuilder:
+    """
+    Потоковое построение графа: ребра страниц (TransferTable) копятся и периодически
+    сворачиваются в разреженную матрицу, так что память растет с числом ребер, а не переводов.
+    """
+
+    def __init__(self, token_decimals, start_timestamp=None, end_timestamp=None, compact_every=1_000_000):
+        self.token_decimals = token_decimals
+        self.start_timestamp = start_timestamp
+        self.end_timestamp = end_timestamp
+        self.compact_every = compact_every
+        self.interner = None
+        self._edges = []
+        self._pending = 0
+
+    def add_table(self, table):
+        if self.interner is None:
+            self.interner = table.interner
+        elif table.interner is not self.interner:
+            raise ValueError("Таблица переводов построена с другим словарем адресов.")
+        if self.start_timestamp is not None:
+            table = table.between(self.start_timestamp, self.end_timestamp)
+        if not len(table):
+            return
+        self._edges.append((table.sender.astype(np.int64), table.receiver.astype(np.int64),
+                            table.token_values(self.token_decimals), np.ones(len(table), dtype=np.int64)))
+        self._pending += len(table)
+        if self._pending >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        graph = self.build()
+        volume, count = graph.volume.tocoo(), graph.count.tocoo()
+        # volume и count построены из одних и тех же ребер, поэтому их разреженная структура совпадает
+        self._edges = [(graph.node_ids[count.row], graph.node_ids[count.col], volume.data, count.data)]
+        self._pending = 0
+
+    def build(self):
+        interner = self.interner or AddressInterner()
+        if not self._edges:
+            return TransferGraph.from_edges(interner, [], [], [])
+        return TransferGraph.from_edges(interner, *(np.concatenate(column) for column in zip(*self._edges)))
@@ -0,0 +1,367 @@
+import os
+import sqlite3
+import threading
+import time
+
+from src.transfer_table import TransferTable
+
+DEFAULT_STORE_PATH = os.getenv("TRANSFER_STORE_PATH", os.path.join("data", "transfers.sqlite"))
+BALANCE_TTL_SECONDS = int(os.getenv("BALANCE_TTL_SECONDS", 6 * 3600))  # балансы "latest" старше этого запрашиваются заново
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    contract TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    time_stamp INTEGER NOT NULL,
+    from_address TEXT NOT NULL,
+    to_address TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (contract, tx_hash, log_index)
+);
+CREATE INDEX IF NOT EXISTS transfers_by_block ON transfers (contract, block_number);
+CREATE TABLE IF NOT EXISTS synced_ranges (
+    contract TEXT NOT NULL,
+    start_block INTEGER NOT NULL,
+    end_block INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS synced_ranges_by_contract ON synced_ranges (contract, start_block);
+CREATE TABLE IF NOT EXISTS block_times (
+    time_stamp INTEGER NOT NULL,
+    closest TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    PRIMARY KEY (time_stamp, closest)
+);
+CREATE TABLE IF NOT EXISTS token_meta (
+    contract TEXT PRIMARY KEY,
+    decimals INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS token_balances (
+    contract TEXT NOT NULL,
+    address TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    balance TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (contract, address, tag)
+);
+CREATE TABLE IF NOT EXISTS daily_partials (
+    contract TEXT NOT NULL,
+    day TEXT NOT NULL,
+    decimals INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (contract, day, decimals)
+);
+CREATE TABLE IF NOT EXISTS balance_checkpoints (
+    contract TEXT NOT NULL,
+    address TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    balance TEXT NOT NULL,
+    PRIMARY KEY (contract, address)
+);
+"""
+
+
+def _log_indexes(transactions):
+    """
+    logIndex для каждой транзакции. Если Etherscan его не вернул — порядковый номер перевода
+    внутри tx hash (ответы отсортированы по блоку, поэтому номер стабилен между запросами).
+    """
+    seen = {}
+    for tx in transactions:
+        tx_hash = tx.get("hash", "")
+        ordinal = seen.get(tx_hash, 0)
+        seen[tx_hash] = ordinal + 1
+        log_index = tx.get("logIndex")
+        try:
+            yield int(log_index) if log_index not in (None, "") else ordinal
+        except (ValueError, TypeError):
+            yield ordinal
+
+
+class TransferStore:
+    """
+    Локальное хранилище переводов токенов в SQLite.
+    Переводы уникальны по (контракт, tx hash, log index); synced_ranges хранит полностью
+    загруженные диапазоны блоков, чтобы повторные запуски запрашивали у API только недостающее.
+    Также кеширует номера блоков по времени, десятичные знаки токенов, балансы адресов
+    опорные точки балансов для леджера (см. BalanceLedger) и дневные агрегаты кошельков (см. WalletPartial).
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    # --- Переводы ---
+
+    def add_transfers(self, contract, transactions):
+        """Сохраняет транзакции (словари tokentx); дубликаты по (tx hash, log index) игнорируются."""
+        contract = contract.lower()
+        rows = []
+        for tx, log_index in zip(transactions, _log_indexes(transactions)):
+            try:
+                rows.append((
+                    contract, int(tx["blockNumber"]), tx["hash"], log_index, int(tx["timeStamp"]),
+                    tx.get("from", "").lower(), tx.get("to", "").lower(), str(tx.get("value", "0")),
+                ))
+            except (ValueError, TypeError, KeyError) as e:
+                print(f"Предупреждение: Транзакция {tx.get('hash', 'N/A')} не сохранена в хранилище: {e}.")
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO transfers VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def iter_transfers(self, contract, start_block, end_block, page_size=10000):
+        """
+        Переводы в диапазоне блоков [start_block, end_block] в формате словарей tokentx,
+        страницами по page_size (порядок — по блоку и log index), без загрузки всего диапазона в память.
+        """
+        contract = contract.lower()
+        # log index уникален только вместе с tx hash (см. _log_indexes), поэтому он входит в ключ страницы
+        last_key = (start_block, -1, "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT block_number, time_stamp, tx_hash, log_index, from_address, to_address, value "
+                    "FROM transfers WHERE contract = ? AND (block_number, log_index, tx_hash) > (?, ?, ?) AND block_number <= ? "
+                    "ORDER BY block_number, log_index, tx_hash LIMIT ?",
+                    (contract, *last_key, end_block, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [
+                {
+                    "blockNumber": str(block), "timeStamp": str(ts), "hash": tx_hash, "logIndex": str(log_index),
+                    "from": sender, "to": receiver, "value": value, "contractAddress": contract,
+                }
+                for block, ts, tx_hash, log_index, sender, receiver, value in rows
+            ]
+            last_key = (rows[-1][0], rows[-1][3], rows[-1][2])
+
+    def iter_transfer_tables(self, contract, start_block, end_block, interner, page_size=10000):
+        """То же, что iter_transfers, но страницами TransferTable (адреса интернируются в interner)."""
+        contract = contract.lower()
+        last_key = (start_block, -1, "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT block_number, log_index, time_stamp, tx_hash, from_address, to_address, value "
+                    "FROM transfers WHERE contract = ? AND (block_number, log_index, tx_hash) > (?, ?, ?) AND block_number <= ? "
+                    "ORDER BY block_number, log_index, tx_hash LIMIT ?",
+                    (contract, *last_key, end_block, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield TransferTable.from_rows(interner, rows)
+            last_key = (rows[-1][0], rows[-1][1], rows[-1][3])
+
+    def load_transfers(self, contract, start_block, end_block):
+        """Переводы в диапазоне блоков [start_block, end_block] в формате словарей tokentx."""
+        return [tx for page in self.iter_transfers(contract, start_block, end_block) for tx in page]
+
+    # --- Загруженные диапазоны блоков ---
+
+    def _synced(self, contract):
+        return self._conn.execute(
+            "SELECT start_block, end_block FROM synced_ranges WHERE contract = ? ORDER BY start_block",
+            (contract,)
+        ).fetchall()
+
+    def mark_synced(self, contract, start_block, end_block):
+        """Отмечает диапазон блоков как полностью загруженный (с объединением соседних диапазонов)."""
+        contract = contract.lower()
+        with self._lock:
+            merged_start, merged_end = start_block, end_block
+            overlapping = []
+            for start, end in self._synced(contract):
+                if start <= merged_end + 1 and end >= merged_start - 1:
+                    overlapping.append(start)
+                    merged_start, merged_end = min(merged_start, start), max(merged_end, end)
+            if overlapping:
+                self._conn.executemany(
+                    "DELETE FROM synced_ranges WHERE contract = ? AND start_block = ?",
+                    [(contract, start) for start in overlapping]
+                )
+            self._conn.execute(
+                "INSERT INTO synced_ranges VALUES (?, ?, ?)", (contract, merged_start, merged_end)
+            )
+            self._conn.commit()
+
+    def missing_ranges(self, contract, start_block, end_block):
+        """Части диапазона [start_block, end_block], которые еще не загружены из API."""
+        contract = contract.lower()
+        with self._lock:
+            synced = self._synced(contract)
+        missing = []
+        cursor = start_block
+        for start, end in synced:
+            if end < cursor:
+                continue
+            if start > end_block:
+                break
+            if start > cursor:
+                missing.append((cursor, start - 1))
+            cursor = max(cursor, end + 1)
+            if cursor > end_block:
+                break
+        if cursor <= end_block:
+            missing.append((cursor, end_block))
+        return missing
+
+    def covered_ranges(self, contract, start_block, end_block):
+        """Части диапазона [start_block, end_block], уже полностью загруженные в хранилище."""
+        covered = []
+        cursor = start_block
+        for missing_start, missing_end in self.missing_ranges(contract, start_block, end_block):
+            if missing_start > cursor:
+                covered.append((cursor, missing_start - 1))
+            cursor = missing_end + 1
+        if cursor <= end_block:
+            covered.append((cursor, end_block))
+        return covered
+
+    # --- Номера блоков и параметры токена ---
+
+    def get_block(self, timestamp, closest):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT block_number FROM block_times WHERE time_stamp = ? AND closest = ?", (timestamp, closest)
+            ).fetchone()
+        return row[0] if row else None
+
+    def block_anchors(self, start_timestamp, end_timestamp, closest="before"):
+        """Известные пары (timestamp, блок) в интервале времени, по возрастанию времени."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT time_stamp, block_number FROM block_times "
+                "WHERE closest = ? AND time_stamp BETWEEN ? AND ? ORDER BY time_stamp",
+                (closest, start_timestamp, end_timestamp)
+            ).fetchall()
+
+    def put_block(self, timestamp, closest, block_number):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO block_times VALUES (?, ?, ?)", (timestamp, closest, block_number)
+            )
+            self._conn.commit()
+
+    def get_decimals(self, contract):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT decimals FROM token_meta WHERE contract = ?", (contract.lower(),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_decimals(self, contract, decimals):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO token_meta VALUES (?, ?)", (contract.lower(), decimals))
+            self._conn.commit()
+
+    # --- Дневные агрегаты ---
+
+    def get_daily_partials(self, contract, days, decimals):
+        """Сериализованные агрегаты {день (date): bytes} для дней, по которым они сохранены."""
+        keys = {day.isoformat(): day for day in days}
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, data FROM daily_partials WHERE contract = ? AND decimals = ? AND day BETWEEN ? AND ?",
+                (contract.lower(), decimals, min(keys), max(keys))
+            ).fetchall()
+        return {keys[day]: data for day, data in rows if day in keys}
+
+    def put_daily_partial(self, contract, day, decimals, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO daily_partials VALUES (?, ?, ?, ?)",
+                (contract.lower(), day.isoformat(), decimals, sqlite3.Binary(data))
+            )
+            self._conn.commit()
+
+    # --- Балансы ---
+
+    def get_balances(self, contract, addresses, tag="latest", ttl=BALANCE_TTL_SECONDS):
+        """
+        Закешированные балансы {адрес: сырой баланс (int)} для (контракт, адрес, тег блока).
+        Записи старше ttl секунд не возвращаются (ttl=None — без ограничения срока).
+        """
+        contract = contract.lower()
+        min_fetched_at = time.time() - ttl if ttl is not None else float("-inf")
+        keys = {address.lower(): address for address in addresses}
+        balances = {}
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS balance_lookup (address TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM balance_lookup")
+            self._conn.executemany("INSERT OR IGNORE INTO balance_lookup VALUES (?)", [(key,) for key in keys])
+            rows = self._conn.execute(
+                "SELECT b.address, b.balance FROM token_balances b JOIN balance_lookup l ON b.address = l.address "
+                "WHERE b.contract = ? AND b.tag = ? AND b.fetched_at >= ?",
+                (contract, tag, min_fetched_at)
+            ).fetchall()
+            self._conn.execute("DELETE FROM balance_lookup")
+            self._conn.commit()
+        for address, balance in rows:
+            balances[keys[address]] = int(balance)
+        return balances
+
+    def put_balances(self, contract, balances, tag="latest"):
+        """Сохраняет балансы {адрес: сырой баланс (int)} с текущим временем получения."""
+        contract = contract.lower()
+        fetched_at = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO token_balances VALUES (?, ?, ?, ?, ?)",
+                [(contract, address.lower(), tag, str(balance), fetched_at) for address, balance in balances.items()]
+            )
+            self._conn.commit()
+
+    def get_checkpoints(self, contract):
+        """Опорные точки леджера {адрес: (номер блока, сырой баланс)} для контракта."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT address, block_number, balance FROM balance_checkpoints WHERE contract = ?", (contract.lower(),)
+            ).fetchall()
+        return {address: (block_number, int(balance)) for address, block_number, balance in rows}
+
+    def put_checkpoints(self, contract, checkpoints):
+        """Сохраняет опорные точки {адрес: (номер блока, сырой баланс)} (более новые заменяют старые)."""
+        contract = contract.lower()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO balance_checkpoints VALUES (?, ?, ?, ?)",
+                [(contract, address.lower(), block_number, str(balance)) for address, (block_number, balance) in checkpoints.items()]
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(store=None):
+    """
+    Возвращает хранилище переводов.
+    None — общее хранилище по пути DEFAULT_STORE_PATH, строка — путь к файлу, TransferStore — он сам.
+    False — без хранилища (возвращает None): всё запрашивается из API и ничего не сохраняется.
+    """
+    if isinstance(store, TransferStore):
+        return store
+    if store is False:
+        return None
+    path = store or DEFAULT_STORE_PATH
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TransferStore(path)
+        return _stores[path]
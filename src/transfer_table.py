@@ -0,0 +1,213 @@
+import numpy as np
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+VALUE_LIMBS = 4  # uint256 = 4 x uint64 (младший limb первый)
+_LIMB_BITS = 64
+_LIMB_MASK = (1 << _LIMB_BITS) - 1
+_MAX_VALUE = 1 << (_LIMB_BITS * VALUE_LIMBS)
+_EXACT_FLOAT_LIMIT = 1 << 53  # целые меньше 2**53 представимы в float64 точно
+_EXACT_POWER_OF_TEN = 22      # 10**22 — наибольшая степень десяти, точно представимая в float64
+
+
+class AddressInterner:
+    """
+    Словарь адресов: адрес (в нижнем регистре) -> целочисленный id.
+    Id 0 зарезервирован за пустым адресом, id 1 — за нулевым адресом (mint/burn).
+    Таблицы переводов хранят только id, поэтому группировка по адресу — операция над целыми числами.
+    """
+
+    EMPTY_ID = 0
+    ZERO_ID = 1
+
+    def __init__(self):
+        self.addresses = []
+        self._ids = {}
+        self.intern("")
+        self.intern(ZERO_ADDRESS)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def intern(self, address):
+        """Id адреса (адрес регистрируется при первом обращении)."""
+        address_id = self._ids.get(address)
+        if address_id is None:
+            key = (address or "").lower()
+            address_id = self._ids.get(key)
+            if address_id is None:
+                address_id = len(self.addresses)
+                self.addresses.append(key)
+                self._ids[key] = address_id
+            # Исходное написание тоже запоминается, чтобы не вызывать lower() повторно
+            self._ids[address] = address_id
+        return address_id
+
+    def lookup(self, address):
+        """Id уже известного адреса или -1."""
+        address_id = self._ids.get(address)
+        if address_id is None:
+            address_id = self._ids.get((address or "").lower(), -1)
+        return address_id
+
+    def address(self, address_id):
+        return self.addresses[address_id]
+
+
+def encode_value(value):
+    """Сырое значение value (строка или int) -> кортеж из VALUE_LIMBS limbs uint64. Некорректные значения -> 0."""
+    try:
+        value = int(value if value is not None else 0)
+    except (ValueError, TypeError):
+        return (0,) * VALUE_LIMBS
+    if 0 <= value <= _LIMB_MASK:
+        return (value, 0, 0, 0)
+    if value < 0 or value >= _MAX_VALUE:
+        return (0,) * VALUE_LIMBS
+    return tuple((value >> (_LIMB_BITS * i)) & _LIMB_MASK for i in range(VALUE_LIMBS))
+
+
+def decode_value(limbs):
+    """Обратное к encode_value: limbs -> int."""
+    value = 0
+    for i, limb in enumerate(limbs):
+        value |= int(limb) << (_LIMB_BITS * i)
+    return value
+
+
+def _hash_bytes(tx_hash):
+    try:
+        return bytes.fromhex(tx_hash[2:] if tx_hash.startswith("0x") else tx_hash)
+    except (ValueError, AttributeError):
+        return str(tx_hash).encode()[:32]
+
+
+class TransferTable:
+    """
+    Колоночная таблица переводов одного токена.
+    block_number, log_index, time_stamp — int64; sender, receiver — int32 id из AddressInterner;
+    tx_hash — 32 байта; value — точное значение uint256 в виде VALUE_LIMBS колонок uint64.
+    96 байт на перевод против ~900 байт у словаря tokentx со строками.
+    """
+
+    COLUMNS = ("block_number", "log_index", "time_stamp", "sender", "receiver", "tx_hash", "value")
+
+    def __init__(self, interner, block_number=None, log_index=None, time_stamp=None,
+                 sender=None, receiver=None, tx_hash=None, value=None):
+        self.interner = interner
+        self.block_number = np.asarray(block_number if block_number is not None else [], dtype=np.int64)
+        self.log_index = np.asarray(log_index if log_index is not None else [], dtype=np.int64)
+        self.time_stamp = np.asarray(time_stamp if time_stamp is not None else [], dtype=np.int64)
+        self.sender = np.asarray(sender if sender is not None else [], dtype=np.int32)
+        self.receiver = np.asarray(receiver if receiver is not None else [], dtype=np.int32)
+        self.tx_hash = np.asarray(tx_hash if tx_hash is not None else [], dtype="S32")
+        value = np.asarray(value if value is not None else [], dtype=np.uint64)
+        self.value = value.reshape(-1, VALUE_LIMBS)
+
+    def __len__(self):
+        return len(self.block_number)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, column).nbytes for column in self.COLUMNS)
+
+    @classmethod
+    def from_rows(cls, interner, rows):
+        """
+        Строит таблицу из кортежей (block, log_index, timestamp, tx_hash, from, to, value).
+        Адреса интернируются, значения кодируются в limbs.
+        """
+        if not rows:
+            return cls(interner)
+        intern = interner.intern
+        block_number, log_index, time_stamp, tx_hash, senders, receivers, values = zip(*rows)
+        return cls(
+            interner, block_number, log_index, time_stamp,
+            [intern(address) for address in senders],
+            [intern(address) for address in receivers],
+            [_hash_bytes(value) for value in tx_hash],
+            [encode_value(value) for value in values],
+        )
+
+    @classmethod
+    def from_transactions(cls, interner, transactions, contract_address=None):
+        """
+        Строит таблицу из словарей tokentx. Если передан contract_address — переводы других
+        контрактов отбрасываются. Транзакции без корректных blockNumber/timeStamp пропускаются.
+        logIndex, если его нет, заменяется порядковым номером перевода внутри tx hash.
+        """
+        contract = contract_address.lower() if contract_address else None
+        rows = []
+        ordinals = {}
+        for tx in transactions:
+            if not isinstance(tx, dict):
+                continue
+            if contract is not None and tx.get("contractAddress", "").lower() != contract:
+                continue
+            tx_hash = tx.get("hash", "")
+            ordinal = ordinals.get(tx_hash, 0)
+            ordinals[tx_hash] = ordinal + 1
+            try:
+                log_index = tx.get("logIndex")
+                log_index = int(log_index) if log_index not in (None, "") else ordinal
+            except (ValueError, TypeError):
+                log_index = ordinal
+            try:
+                rows.append((
+                    int(tx.get("blockNumber", 0)), log_index, int(tx["timeStamp"]), tx_hash,
+                    tx.get("from") or "", tx.get("to") or "", tx.get("value"),
+                ))
+            except (ValueError, TypeError, KeyError) as e:
+                print(f"Предупреждение: Ошибка обработки транзакции {tx_hash or 'N/A'}: {e}. Пропуск.")
+        return cls.from_rows(interner, rows)
+
+    @classmethod
+    def concat(cls, interner, tables):
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls(interner)
+        return cls(interner, *(np.concatenate([getattr(table, column) for table in tables]) for column in cls.COLUMNS))
+
+    def take(self, index):
+        """Подтаблица по булевой маске или массиву индексов."""
+        return TransferTable(self.interner, *(getattr(self, column)[index] for column in self.COLUMNS))
+
+    def between(self, start_timestamp, end_timestamp):
+        """Переводы с временем в интервале [start_timestamp, end_timestamp]."""
+        return self.take((self.time_stamp >= start_timestamp) & (self.time_stamp <= end_timestamp))
+
+    def sorted(self):
+        """Таблица, упорядоченная по блоку и log index (устойчивая сортировка)."""
+        return self.take(np.lexsort((self.log_index, self.block_number)))
+
+    def participant_ids(self):
+        """Уникальные id отправителей и получателей, кроме пустого и нулевого адресов."""
+        ids = np.unique(np.concatenate([self.sender, self.receiver]))
+        return ids[ids > AddressInterner.ZERO_ID]
+
+    def participants(self):
+        """Адреса участников переводов (без пустого и нулевого адресов)."""
+        return [self.interner.addresses[address_id] for address_id in self.participant_ids()]
+
+    def raw_values(self):
+        """Точные значения value как список int."""
+        return [decode_value(limbs) for limbs in self.value]
+
+    def token_values(self, token_decimals):
+        """
+        Значения в единицах токена (float64) — те же, что int(value) / 10**decimals.
+        Значения меньше 2**53 делятся векторно (при decimals <= 22 результат совпадает
+        с точным делением int / int), остальные — через Python int.
+        """
+        if not token_decimals:
+            return np.zeros(len(self), dtype=np.float64)
+        result = np.empty(len(self), dtype=np.float64)
+        if token_decimals <= _EXACT_POWER_OF_TEN:
+            small = (self.value[:, 1:] == 0).all(axis=1) & (self.value[:, 0] < _EXACT_FLOAT_LIMIT)
+        else:
+            small = np.zeros(len(self), dtype=bool)
+        result[small] = self.value[small, 0].astype(np.float64) / float(10 ** token_decimals)
+        divisor = 10 ** token_decimals
+        for i in np.flatnonzero(~small):
+            result[i] = decode_value(self.value[i]) / divisor
+        return result
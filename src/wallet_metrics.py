@@ -0,0 +1,270 @@
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from src.transfer_table import AddressInterner, TransferTable
+
+METRIC_COLUMNS = [
+    "address",
+    "period_total_tx_count", "period_incoming_tx_count", "period_outgoing_tx_count",
+    "period_total_volume_in", "period_total_volume_out",
+    "period_avg_volume_in", "period_avg_volume_out",
+    "period_unique_counterparties",
+    "period_first_tx_date", "period_last_tx_date", "period_active_days",
+    "current_token_balance",
+]
+
+
+@lru_cache(maxsize=1 << 16)
+def _local_day_ordinal(timestamp):
+    return datetime.fromtimestamp(timestamp).toordinal()
+
+
+def _local_day_ordinals(timestamps):
+    """Локальная дата (ordinal) для каждого timestamp; datetime.fromtimestamp вызывается только для уникальных значений."""
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64)
+    unique_ts, inverse = np.unique(timestamps, return_inverse=True)
+    unique_days = np.fromiter(
+        (_local_day_ordinal(int(ts)) for ts in unique_ts),
+        dtype=np.int64, count=len(unique_ts)
+    )
+    return unique_days[inverse]
+
+
+def as_transfer_table(transactions, contract_address, interner=None):
+    """TransferTable как есть или таблица, построенная из списка словарей tokentx (с фильтром по контракту)."""
+    if isinstance(transactions, TransferTable):
+        return transactions
+    return TransferTable.from_transactions(interner or AddressInterner(), transactions, contract_address)
+
+
+def explode_transfers(table, values):
+    """
+    Разворачивает переводы в строки (id адреса, id контрагента, timestamp, значение, входящий ли).
+    Транзакция самому себе учитывается только как исходящая, как и в исходном расчете.
+    """
+    incoming_mask = table.receiver != table.sender
+    return (
+        np.concatenate([table.sender, table.receiver[incoming_mask]]),
+        np.concatenate([table.receiver, table.sender[incoming_mask]]),
+        np.concatenate([table.time_stamp, table.time_stamp[incoming_mask]]),
+        np.concatenate([values, values[incoming_mask]]),
+        np.concatenate([np.zeros(len(table), dtype=bool), np.ones(int(incoming_mask.sum()), dtype=bool)]),
+    )
+
+
+def _unique_pair_counts(codes, keys, n_groups):
+    """Число уникальных keys для каждого кода группы (пары кодируются одним int64)."""
+    if len(codes) == 0:
+        return np.zeros(n_groups, dtype=np.int64)
+    keys = keys.astype(np.int64)
+    offset = keys.min()
+    span = int(keys.max() - offset) + 1
+    pairs = np.unique(codes.astype(np.int64) * span + (keys - offset))
+    return np.bincount(pairs // span, minlength=n_groups)
+
+
+def _balance_to_tokens(raw_balance, token_decimals):
+    return raw_balance / (10 ** token_decimals) if token_decimals and raw_balance else 0.0
+
+
+def compute_wallet_metrics(transactions, addresses, token_decimals, start_dt, end_dt, contract_address, balances=None):
+    """
+    Рассчитывает метрики для ВСЕХ адресов за несколько групповых проходов по развернутой таблице переводов.
+    transactions — TransferTable или список словарей tokentx; группировка идет по целочисленным id адресов.
+    Результат совпадает с построчным вызовом calculate_period_metrics для каждого адреса.
+    balances: словарь {адрес: сырой баланс (int)}; отсутствующие адреса получают баланс 0.
+    Возвращает DataFrame со строками в порядке addresses.
+    """
+    balances = balances or {}
+    addresses = list(addresses)
+    table = as_transfer_table(transactions, contract_address)
+    table = table.between(start_dt.timestamp(), end_dt.timestamp())
+    interner = table.interner
+
+    # Группы — уникальные адреса из addresses; id адреса -> номер группы через массив
+    address_ids = np.array([interner.lookup(address) for address in addresses], dtype=np.int64)
+    known_ids = np.unique(address_ids[address_ids > AddressInterner.EMPTY_ID])
+    n_groups = len(known_ids)
+    group_of_id = np.full(len(interner), -1, dtype=np.int64)
+    group_of_id[known_ids] = np.arange(n_groups)
+
+    address_col, counterparties, timestamps, values, is_incoming = explode_transfers(
+        table, table.token_values(token_decimals)
+    )
+    codes = group_of_id[address_col]
+    selected = codes >= 0
+    codes, address_col, counterparties = codes[selected], address_col[selected], counterparties[selected]
+    timestamps, values, is_incoming = timestamps[selected], values[selected], is_incoming[selected]
+
+    # Счетчики и объемы: np.bincount суммирует последовательно в порядке транзакций
+    incoming_count = np.bincount(codes[is_incoming], minlength=n_groups)
+    outgoing_count = np.bincount(codes[~is_incoming], minlength=n_groups)
+    volume_in = np.bincount(codes[is_incoming], weights=values[is_incoming], minlength=n_groups)
+    volume_out = np.bincount(codes[~is_incoming], weights=values[~is_incoming], minlength=n_groups)
+    total_count = incoming_count + outgoing_count
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_in = np.where(incoming_count > 0, volume_in / np.maximum(incoming_count, 1), 0.0)
+        avg_out = np.where(outgoing_count > 0, volume_out / np.maximum(outgoing_count, 1), 0.0)
+
+    # Уникальные контрагенты (без нулевого адреса и самого адреса) и активные дни по локальной дате
+    cp_mask = (counterparties != AddressInterner.ZERO_ID) & (counterparties != address_col)
+    unique_counterparties = _unique_pair_counts(codes[cp_mask], counterparties[cp_mask], n_groups)
+    active_days = _unique_pair_counts(codes, _local_day_ordinals(timestamps), n_groups)
+
+    first_ts = np.full(n_groups, np.iinfo(np.int64).max, dtype=np.int64)
+    last_ts = np.full(n_groups, np.iinfo(np.int64).min, dtype=np.int64)
+    np.minimum.at(first_ts, codes, timestamps)
+    np.maximum.at(last_ts, codes, timestamps)
+
+    # Адреса без переводов получают нулевые метрики (дополнительная пустая группа)
+    empty_group = n_groups
+    total_count, incoming_count, outgoing_count, unique_counterparties, active_days = (
+        np.append(column, 0) for column in (total_count, incoming_count, outgoing_count, unique_counterparties, active_days)
+    )
+    volume_in, volume_out, avg_in, avg_out = (np.append(column, 0.0) for column in (volume_in, volume_out, avg_in, avg_out))
+    first_ts, last_ts = np.append(first_ts, 0), np.append(last_ts, 0)
+    row = np.where(address_ids > AddressInterner.EMPTY_ID, group_of_id[np.maximum(address_ids, 0)], empty_group)
+    row[row < 0] = empty_group
+    has_tx = total_count[row] > 0
+    first_dates = [datetime.fromtimestamp(int(first_ts[r])) if active else None for r, active in zip(row, has_tx)]
+    last_dates = [datetime.fromtimestamp(int(last_ts[r])) if active else None for r, active in zip(row, has_tx)]
+
+    return pd.DataFrame({
+        "address": addresses,
+        "period_total_tx_count": total_count[row].astype(np.int64),
+        "period_incoming_tx_count": incoming_count[row].astype(np.int64),
+        "period_outgoing_tx_count": outgoing_count[row].astype(np.int64),
+        "period_total_volume_in": volume_in[row],
+        "period_total_volume_out": volume_out[row],
+        "period_avg_volume_in": avg_in[row],
+        "period_avg_volume_out": avg_out[row],
+        "period_unique_counterparties": unique_counterparties[row].astype(np.int64),
+        "period_first_tx_date": first_dates,
+        "period_last_tx_date": last_dates,
+        "period_active_days": active_days[row].astype(np.int64),
+        "current_token_balance": [
+            _balance_to_tokens(balances.get(address, 0), token_decimals) for address in addresses
+        ],
+    }, columns=METRIC_COLUMNS)
+
+
+class WalletMetricsAccumulator:
+    """
+    Накопитель метрик кошельков для потоковой обработки: страницы переводов (TransferTable)
+    сворачиваются в агрегаты по id адресов сразу по мере поступления, сами переводы не хранятся.
+    Память растет с числом кошельков (и их контрагентов/активных дней), а не с числом переводов.
+    Итог совпадает с compute_wallet_metrics (объемы — с точностью до порядка суммирования).
+    """
+
+    def __init__(self, token_decimals, start_dt, end_dt, contract_address, interner=None):
+        self.token_decimals = token_decimals
+        self.start_ts = start_dt.timestamp()
+        self.end_ts = end_dt.timestamp()
+        self.contract_address = contract_address.lower()
+        self.interner = interner or AddressInterner()
+        self.transaction_count = 0
+        # Колонки по id адреса (растут вместе со словарем адресов)
+        self._seen = np.zeros(0, dtype=bool)
+        self._incoming = np.zeros(0, dtype=np.int64)
+        self._outgoing = np.zeros(0, dtype=np.int64)
+        self._volume_in = np.zeros(0, dtype=np.float64)
+        self._volume_out = np.zeros(0, dtype=np.float64)
+        self._first_ts = np.zeros(0, dtype=np.int64)
+        self._last_ts = np.zeros(0, dtype=np.int64)
+        # Пары (id адреса, id контрагента) и (id адреса, локальный день), закодированные в int
+        self._counterparty_pairs = set()
+        self._day_pairs = set()
+
+    def _grow(self, size):
+        extra = size - len(self._seen)
+        self._seen = np.append(self._seen, np.zeros(extra, dtype=bool))
+        self._incoming = np.append(self._incoming, np.zeros(extra, dtype=np.int64))
+        self._outgoing = np.append(self._outgoing, np.zeros(extra, dtype=np.int64))
+        self._volume_in = np.append(self._volume_in, np.zeros(extra))
+        self._volume_out = np.append(self._volume_out, np.zeros(extra))
+        self._first_ts = np.append(self._first_ts, np.full(extra, np.iinfo(np.int64).max, dtype=np.int64))
+        self._last_ts = np.append(self._last_ts, np.full(extra, np.iinfo(np.int64).min, dtype=np.int64))
+
+    def add_transactions(self, transactions):
+        """Сворачивает страницу переводов (TransferTable или список словарей tokentx) в агрегаты по адресам."""
+        table = as_transfer_table(transactions, self.contract_address, self.interner)
+        if table.interner is not self.interner:
+            raise ValueError("Таблица переводов построена с другим словарем адресов.")
+        if len(self.interner) > len(self._seen):
+            self._grow(max(len(self.interner), 2 * len(self._seen)))
+
+        # Адреса регистрируются для всех полученных переводов (как unique_addresses при сборе)
+        self._seen[table.participant_ids()] = True
+        table = table.between(self.start_ts, self.end_ts)
+        if not len(table):
+            return
+        self.transaction_count += len(table)
+
+        address_col, counterparties, timestamps, values, is_incoming = explode_transfers(
+            table, table.token_values(self.token_decimals)
+        )
+        participant = address_col > AddressInterner.ZERO_ID
+        address_col, counterparties = address_col[participant], counterparties[participant]
+        timestamps, values, is_incoming = timestamps[participant], values[participant], is_incoming[participant]
+        size = len(self._seen)
+
+        self._incoming += np.bincount(address_col[is_incoming], minlength=size)
+        self._outgoing += np.bincount(address_col[~is_incoming], minlength=size)
+        self._volume_in += np.bincount(address_col[is_incoming], weights=values[is_incoming], minlength=size)
+        self._volume_out += np.bincount(address_col[~is_incoming], weights=values[~is_incoming], minlength=size)
+        np.minimum.at(self._first_ts, address_col, timestamps)
+        np.maximum.at(self._last_ts, address_col, timestamps)
+
+        address_key = address_col.astype(np.int64) << 32
+        cp_mask = (counterparties != AddressInterner.ZERO_ID) & (counterparties != address_col)
+        self._counterparty_pairs.update(np.unique(address_key[cp_mask] | counterparties[cp_mask]).tolist())
+        self._day_pairs.update(np.unique(address_key | _local_day_ordinals(timestamps)).tolist())
+
+    @property
+    def addresses(self):
+        """Адреса, встретившиеся в свернутых переводах."""
+        return [self.interner.addresses[address_id] for address_id in np.flatnonzero(self._seen)]
+
+    def to_frame(self, balances=None):
+        """DataFrame метрик в том же формате, что и compute_wallet_metrics."""
+        balances = balances or {}
+        ids = np.flatnonzero(self._seen)
+        size = len(self._seen)
+        unique_counterparties = np.bincount(
+            np.fromiter((pair >> 32 for pair in self._counterparty_pairs), dtype=np.int64, count=len(self._counterparty_pairs)),
+            minlength=size
+        )
+        active_days = np.bincount(
+            np.fromiter((pair >> 32 for pair in self._day_pairs), dtype=np.int64, count=len(self._day_pairs)),
+            minlength=size
+        )
+        incoming, outgoing = self._incoming[ids], self._outgoing[ids]
+        volume_in, volume_out = self._volume_in[ids], self._volume_out[ids]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_in = np.where(incoming > 0, volume_in / np.maximum(incoming, 1), 0.0)
+            avg_out = np.where(outgoing > 0, volume_out / np.maximum(outgoing, 1), 0.0)
+        has_tx = (incoming + outgoing) > 0
+        addresses = [self.interner.addresses[address_id] for address_id in ids]
+
+        return pd.DataFrame({
+            "address": addresses,
+            "period_total_tx_count": incoming + outgoing,
+            "period_incoming_tx_count": incoming,
+            "period_outgoing_tx_count": outgoing,
+            "period_total_volume_in": volume_in,
+            "period_total_volume_out": volume_out,
+            "period_avg_volume_in": avg_in,
+            "period_avg_volume_out": avg_out,
+            "period_unique_counterparties": unique_counterparties[ids],
+            "period_first_tx_date": [datetime.fromtimestamp(int(ts)) if active else None for ts, active in zip(self._first_ts[ids], has_tx)],
+            "period_last_tx_date": [datetime.fromtimestamp(int(ts)) if active else None for ts, active in zip(self._last_ts[ids], has_tx)],
+            "period_active_days": active_days[ids],
+            "current_token_balance": [
+                _balance_to_tokens(balances.get(address, 0), self.token_decimals) for address in addresses
+            ],
+        }, columns=METRIC_COLUMNS)
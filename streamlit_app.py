@@ -1,18 +1,32 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
+import os
 import re
+import time
 
 from utils.preprocessing import load_data, preprocess_data
-from utils.clustering import find_optimal_clusters, perform_clustering
+from utils.clustering import (
+    MINIBATCH_BATCH_SIZE,
+    MINIBATCH_MIN_ROWS,
+    SILHOUETTE_DRAWS,
+    SILHOUETTE_SAMPLE_SIZE,
+    WalletClusterModel,
+    find_optimal_clusters,
+    fit_kmeans
+)
 from utils.plots import (
     plot_elbow_method,
     plot_silhouette,
     plot_davies_bouldin,
+    plot_stability,
     plot_pca_clusters
 )
+from utils.clustering_cache import ClusteringCache
+from utils.stability import cluster_stability
 from utils.eda import generate_eda_plots
 from utils.gigachat_api import get_ai_description_from_stats
+from src.etherscan_client import get_client
 from src.fetch_wallet import run_fetch_and_process
 
 
@@ -27,13 +41,23 @@ default_session_state = {
     'original_data': None,
     'processed_data': None,
     'scaled_features': None,
+    'graph_features': False,
+    'preprocessor': None,
+    'cluster_model': None,
     'cluster_metrics': None,
+    'cluster_stability': None,
     'cluster_description': None,
     'displayed_stats': None
 }
 for key, default in default_session_state.items():
     if key not in st.session_state:
         st.session_state[key] = default
+if 'clustering_cache' not in st.session_state:
+    # Обученные модели перебора k (в памяти сессии и, если задан CLUSTERING_CACHE_DIR, на диске)
+    st.session_state.clustering_cache = ClusteringCache(os.getenv("CLUSTERING_CACHE_DIR"))
+if 'eda_cache' not in st.session_state:
+    # Рассчитанные и отрисованные EDA по отпечатку данных: повторные запуски скрипта их не пересчитывают
+    st.session_state.eda_cache = {}
 
 st.set_page_config(
     page_title="Wallet Clustering Analysis",
@@ -51,6 +75,22 @@ data_source_option = st.sidebar.radio(
     key='data_source_choice'
 )
 
+st.sidebar.title("Кластеризация")
+engine_labels = {
+    "auto": f"Авто (MiniBatchKMeans при > {MINIBATCH_MIN_ROWS:,} строк)",
+    "kmeans": "KMeans (полный)",
+    "minibatch": "MiniBatchKMeans",
+}
+clustering_engine = st.sidebar.selectbox(
+    "Алгоритм", list(engine_labels), format_func=engine_labels.get, key="clustering_engine"
+)
+minibatch_size = st.sidebar.number_input(
+    "Размер мини-батча", min_value=256, max_value=262144, value=MINIBATCH_BATCH_SIZE, step=256,
+    key="minibatch_size", disabled=clustering_engine == "kmeans"
+)
+clustering_float32 = st.sidebar.checkbox("Считать во float32 (меньше памяти)", value=False, key="clustering_float32")
+engine_params = {"engine": clustering_engine, "batch_size": int(minibatch_size), "float32": clustering_float32}
+
 # Обновляем состояние при выборе
 if data_source_option == 'Загрузить CSV':
     st.session_state.data_source = 'csv'
@@ -60,30 +100,38 @@ elif data_source_option == 'Собрать через API Etherscan':
 st.markdown("### 1. Загрузка или Сбор данных")
 
 if st.session_state.data_source == 'csv':
-    uploaded_file = st.file_uploader("Выберите CSV файл", type=["csv"], key="csv_uploader")
+    uploaded_file = st.file_uploader(
+        "Выберите файл с метриками (CSV, Parquet или Arrow IPC)",
+        type=["csv", "parquet", "pq", "arrow", "feather", "ipc"],
+        key="csv_uploader"
+    )
     if uploaded_file is not None and not st.session_state.data_loaded:
         try:
-            with st.spinner("Загрузка и предобработка данных из CSV..."):
+            with st.spinner("Загрузка и предобработка данных из файла..."):
                 data = load_data(uploaded_file)
                 st.session_state.original_data = data
                 # Предобработка сразу после загрузки
-                scaled_features, processed_data = preprocess_data(data)
+                scaled_features, processed_data, preprocessor = preprocess_data(data)
+                st.session_state.graph_features = False
+                st.session_state.preprocessor = preprocessor
                 st.session_state.scaled_features = scaled_features
                 st.session_state.processed_data = processed_data
                 st.session_state.data_loaded = True
                 st.session_state.fetch_error = None #
-                st.success("Данные из CSV успешно загружены и обработаны!")
+                st.success("Данные из файла успешно загружены и обработаны!")
                 st.rerun()
         except Exception as e:
-            st.error(f"Ошибка при загрузке или обработке CSV: {str(e)}")
+            st.error(f"Ошибка при загрузке или обработке файла: {str(e)}")
             st.session_state.data_loaded = False
             st.session_state.original_data = None
             st.session_state.processed_data = None
             st.session_state.scaled_features = None
+            st.session_state.preprocessor = None
 
 elif st.session_state.data_source == 'api':
     st.subheader("Параметры для сбора данных через API")
-    etherscan_api_key = st.secrets.get("ETHERSCAN_API_KEY")
+    # Несколько ключей (ETHERSCAN_API_KEYS) распределяют нагрузку и суммируют лимиты запросов
+    etherscan_api_key = st.secrets.get("ETHERSCAN_API_KEYS") or st.secrets.get("ETHERSCAN_API_KEY")
 
     if not etherscan_api_key:
         st.warning("""
@@ -91,6 +139,7 @@ elif st.session_state.data_source == 'api':
 
             Пожалуйста, убедитесь, что вы добавили строку
             `ETHERSCAN_API_KEY = "ВАШ_КЛЮЧ"`
+            (или список `ETHERSCAN_API_KEYS = ["КЛЮЧ_1", "КЛЮЧ_2"]`)
             в ваш файл секретов `.streamlit/secrets.toml`.
 
             Без ключа API сбор данных через Etherscan невозможен.
@@ -113,6 +162,28 @@ elif st.session_state.data_source == 'api':
         step=1,
         key="api_days"
     )
+    api_daily = st.checkbox(
+        "Дневные агрегаты из локального хранилища (повторный анализ пересчитывает только новые дни)",
+        value=True,
+        key="api_daily"
+    )
+    api_stream = st.checkbox(
+        "Потоковая обработка (метрики считаются по мере загрузки, меньше памяти)",
+        value=True,
+        disabled=api_daily,
+        help="Используется, когда дневные агрегаты отключены.",
+        key="api_stream"
+    )
+    api_ledger_balances = st.checkbox(
+        "Балансы по истории переводов (без запроса баланса для каждого адреса, с выборочной проверкой)",
+        value=False,
+        key="api_ledger_balances"
+    )
+    api_graph_features = st.checkbox(
+        "Признаки графа контрагентов (степени, PageRank, кластеризация, размер компоненты)",
+        value=False,
+        key="api_graph_features"
+    )
 
     if st.button("Начать сбор данных", key="start_api_fetch"):
         if not re.match(r'^0x[a-fA-F0-9]{40}$', api_address):
@@ -126,14 +197,23 @@ elif st.session_state.data_source == 'api':
             st.session_state.original_data = None
             st.session_state.processed_data = None
             st.session_state.scaled_features = None
+            st.session_state.preprocessor = None
 
             st.info(f"Запуск сбора данных для токена {api_address} за последние {api_days} дней...")
             progress_bar = st.progress(0)
             status_text = st.empty()
+            metrics_table = st.empty()
+            etherscan_client = get_client(etherscan_api_key)
+            etherscan_client.metrics.reset()
+            last_metrics_update = [0.0]
 
             def update_progress(percent_complete, message):
                 progress_bar.progress(percent_complete / 100.0)
                 status_text.info(message)
+                # Счетчики запросов по действиям (не чаще раза в секунду, чтобы не тормозить перерисовкой)
+                if time.monotonic() - last_metrics_update[0] >= 1.0 or percent_complete >= 100:
+                    last_metrics_update[0] = time.monotonic()
+                    metrics_table.dataframe(pd.DataFrame(etherscan_client.metrics.summary_rows()), hide_index=True)
 
             try:
                 # Вызов функции из fetch_wallet с передачей callback
@@ -141,11 +221,20 @@ elif st.session_state.data_source == 'api':
                     target_token_contract_address=api_address,
                     days_back=api_days,
                     api_key=etherscan_api_key,
-                    progress_callback=update_progress
+                    progress_callback=update_progress,
+                    stream=api_stream,
+                    daily=api_daily,
+                    balance_mode="ledger" if api_ledger_balances else "api",
+                    graph_features=api_graph_features
                 )
 
                 status_text.empty()
                 progress_bar.empty()
+                metrics_table.empty()
+                with st.expander("Статистика запросов к Etherscan"):
+                    st.dataframe(pd.DataFrame(etherscan_client.metrics.summary_rows()), hide_index=True)
+                    st.download_button("Скачать (JSON)", etherscan_client.metrics.to_json(indent=2), "etherscan_metrics.json")
+                    st.download_button("Скачать (Prometheus)", etherscan_client.metrics.to_prometheus(), "etherscan_metrics.prom")
 
                 if df_result is not None:
                     if not df_result.empty:
@@ -155,7 +244,9 @@ elif st.session_state.data_source == 'api':
 
                         # Запускаем предобработку сразу после сбора
                         with st.spinner("Предобработка собранных данных..."):
-                            scaled_features, processed_data = preprocess_data(df_result)
+                            scaled_features, processed_data, preprocessor = preprocess_data(df_result, graph_features=api_graph_features)
+                            st.session_state.graph_features = api_graph_features
+                            st.session_state.preprocessor = preprocessor
                             st.session_state.scaled_features = scaled_features
                             st.session_state.processed_data = processed_data
                             st.session_state.data_loaded = True # Устанавливаем флаг успешной загрузки/сбора
@@ -188,10 +279,10 @@ elif not st.session_state.data_source:
 
 if st.session_state.data_loaded and st.session_state.original_data is not None:
 
-    # Отображение предупреждений о лимите 10k, если они были при сборе через API
+    # Отображение предупреждений о неполных днях (лимит 10k или ошибки загрузки), если они были при сборе через API
     if st.session_state.data_source == 'api' and st.session_state.fetch_warnings:
         st.warning("**Предупреждение о неполных данных:**")
-        warning_message = "Из-за достижения лимита Etherscan в 10,000 транзакций для следующих дат, данные и результаты анализа могут быть неполными:\n"
+        warning_message = "Для следующих дат найдены блоки, содержащие больше 10,000 переводов токена (лимит Etherscan на один запрос), или диапазоны блоков, которые не удалось загрузить (они будут запрошены снова при следующем сборе), поэтому данные и результаты анализа могут быть неполными:\n"
         for dt in sorted(list(set(st.session_state.fetch_warnings))): # Уникальные даты
             warning_message += f"- {dt.strftime('%Y-%m-%d')}\n"
         st.markdown(warning_message)
@@ -205,26 +296,29 @@ if st.session_state.data_loaded and st.session_state.original_data is not None:
     st.subheader("Первые 5 строк данных")
     st.dataframe(data.head())
 
-    st.subheader("Основная статистика")
-    # Исключаем нечисловые колонки перед describe
+    # Статистика и распределения считаются и рисуются один раз для каждого набора данных (кеш по отпечатку)
     numeric_cols = data.select_dtypes(include=np.number).columns.tolist()
+    eda_plots = None
     if numeric_cols:
-        st.dataframe(data[numeric_cols].describe())
+        try:
+            eda_plots = generate_eda_plots(data[numeric_cols], cache=st.session_state.eda_cache)
+        except Exception as e:
+            st.error(f"Ошибка при генерации EDA графиков: {e}")
+            st.info("Возможно, в данных отсутствуют необходимые числовые колонки.")
+
+    st.subheader("Основная статистика")
+    if eda_plots is not None:
+        st.dataframe(eda_plots['stats'])
     else:
         st.info("Нет числовых колонок для отображения статистики.")
 
 
     st.subheader("Распределения данных")
-    try:
-        # Передаем только числовые колонки в generate_eda_plots
-        eda_plots = generate_eda_plots(data[numeric_cols])
+    if eda_plots is not None:
         st.subheader("Распределения исходных числовых данных")
-        st.pyplot(eda_plots['original_plots'])
+        st.image(eda_plots['original_plots'], use_container_width=True)
         st.subheader("Распределения после log1p-преобразования")
-        st.pyplot(eda_plots['log_plots'])
-    except Exception as e:
-        st.error(f"Ошибка при генерации EDA графиков: {e}")
-        st.info("Возможно, в данных отсутствуют необходимые числовые колонки.")
+        st.image(eda_plots['log_plots'], use_container_width=True)
 
 
     # === Секция 3: Определение кластеров ===
@@ -233,15 +327,57 @@ if st.session_state.data_loaded and st.session_state.original_data is not None:
 
     if st.session_state.scaled_features is not None:
         max_k = st.slider("Максимальное k для анализа", 2, 20, 10, key="max_k_slider")
+        compute_stability = st.checkbox(
+            "Оценить стабильность кластеров (повторное обучение на подвыборках)", value=False, key="compute_stability"
+        )
 
         if st.button("Рассчитать метрики кластеризации", key="calc_metrics_btn"):
              with st.spinner("Расчет метрик кластеризации..."):
                 try:
+                    # k считаются параллельно; графики дорисовываются по мере готовности каждого k
+                    partial_metrics = {}
+                    partial_col1, partial_col2 = st.columns(2)
+                    elbow_placeholder, silhouette_placeholder = partial_col1.empty(), partial_col2.empty()
+
+                    def show_partial_metrics(k, scores):
+                        partial_metrics[k] = scores
+                        ks = sorted(partial_metrics)
+                        elbow_placeholder.pyplot(plot_elbow_method([partial_metrics[i]['inertia'] for i in ks], ks))
+                        silhouette_ci = [partial_metrics[i]['silhouette_ci'] for i in ks]
+                        silhouette_placeholder.pyplot(plot_silhouette(
+                            [partial_metrics[i]['silhouette'] for i in ks], ks,
+                            silhouette_ci if silhouette_ci[0] is not None else None
+                        ))
+
                     metrics = find_optimal_clusters(
                         st.session_state.scaled_features,
-                        max_k
+                        max_k,
+                        on_result=show_partial_metrics,
+                        cache=st.session_state.clustering_cache,
+                        **engine_params
                     )
+                    elbow_placeholder.empty()
+                    silhouette_placeholder.empty()
                     st.session_state.cluster_metrics = metrics
+                    st.session_state.cluster_stability = None
+                    if compute_stability:
+                        # Эталонные модели берутся из кеша перебора k, заново обучаются только подвыборки
+                        stability_progress = st.progress(0.0, text="Оценка стабильности кластеров...")
+                        done_k = []
+
+                        def show_stability_progress(k, scores):
+                            done_k.append(k)
+                            stability_progress.progress(len(done_k) / len(metrics['K_range']),
+                                                        text=f"Стабильность: k={k} оценено по {scores['resamples']} подвыборкам")
+
+                        st.session_state.cluster_stability = cluster_stability(
+                            st.session_state.scaled_features,
+                            metrics['K_range'],
+                            on_result=show_stability_progress,
+                            cache=st.session_state.clustering_cache,
+                            **engine_params
+                        )
+                        stability_progress.empty()
                     st.success("Расчет метрик завершен.")
                 except Exception as e:
                     st.error(f"Ошибка при расчете метрик: {e}")
@@ -258,12 +394,33 @@ if st.session_state.data_loaded and st.session_state.original_data is not None:
             with col2:
                 st.pyplot(plot_silhouette(
                     st.session_state.cluster_metrics['silhouette'],
+                    st.session_state.cluster_metrics['K_range'],
+                    st.session_state.cluster_metrics.get('silhouette_ci')
+                ))
+            if st.session_state.cluster_metrics.get('silhouette_ci'):
+                st.caption(
+                    f"Silhouette оценен по {SILHOUETTE_DRAWS} стратифицированным выборкам "
+                    f"по {SILHOUETTE_SAMPLE_SIZE} кошельков (закрашено — 95% доверительный интервал): "
+                    f"точный расчет для {len(st.session_state.scaled_features)} строк слишком долгий."
+                )
+            stability = st.session_state.cluster_stability
+            col3, col4 = st.columns(2)
+            with col3:
+                st.pyplot(plot_davies_bouldin(
+                    st.session_state.cluster_metrics['davies_bouldin'],
                     st.session_state.cluster_metrics['K_range']
                 ))
-            st.pyplot(plot_davies_bouldin(
-                st.session_state.cluster_metrics['davies_bouldin'],
-                st.session_state.cluster_metrics['K_range']
-            ))
+            if stability and stability['K_range'] == st.session_state.cluster_metrics['K_range']:
+                with col4:
+                    st.pyplot(plot_stability(
+                        stability['ari'], stability['jaccard'], stability['K_range'],
+                        stability['ari_ci'], stability['jaccard_ci']
+                    ))
+                    st.caption(
+                        "Совпадение разбиений на подвыборках с разбиением всех данных (1 — кластеры воспроизводятся "
+                        "при любой подвыборке); закрашено — 95% доверительный интервал. "
+                        f"Подвыборок по k: {', '.join(f'{k}: {n}' for k, n in zip(stability['K_range'], stability['resamples']))}."
+                    )
 
             # Рекомендации по k
             try:
@@ -291,6 +448,17 @@ if st.session_state.data_loaded and st.session_state.original_data is not None:
                     - Silhouette Score: **{k_range[silhouette_k_index]}** (максимальный скор)
                     - Davies-Bouldin: **{k_range[db_k_index]}** (минимальный индекс)
                 """)
+                if stability and stability['K_range'] == k_range:
+                    stable_k_index = int(np.argmax(stability['ari']))
+                    st.caption(f"Наиболее стабильное разбиение: k={k_range[stable_k_index]} (ARI {stability['ari'][stable_k_index]:.2f}).")
+                silhouette_ci = st.session_state.cluster_metrics.get('silhouette_ci')
+                if silhouette_ci:
+                    # k, чей интервал пересекается с интервалом лучшего k, по выборкам от него не отличимы
+                    best_low = silhouette_ci[silhouette_k_index][0]
+                    close_k = [k for k, (_, high) in zip(k_range, silhouette_ci)
+                               if high >= best_low and k != k_range[silhouette_k_index]]
+                    if close_k:
+                        st.caption(f"По silhouette k={k_range[silhouette_k_index]} статистически не отличается от k = {', '.join(map(str, close_k))}.")
                 st.markdown("""
                        **Примечание:** Это рекомендации. Выберите 'k', которое наилучшим образом
                        соответствует вашим целям анализа и интерпретируемости кластеров.
@@ -319,9 +487,16 @@ if st.session_state.data_loaded and st.session_state.original_data is not None:
             if st.button("Запустить кластеризацию", key="run_clustering_btn"):
                  with st.spinner(f"Выполнение KMeans с k={selected_k}..."):
                     try:
-                        labels = perform_clustering(
+                        kmeans = fit_kmeans(
                             st.session_state.scaled_features,
-                            selected_k
+                            selected_k,
+                            cache=st.session_state.clustering_cache,
+                            **engine_params
+                        )
+                        labels = kmeans.labels_
+                        # Обученная модель (предобработка + центроиды) для разметки новых кошельков без переобучения
+                        st.session_state.cluster_model = WalletClusterModel(
+                            st.session_state.preprocessor, kmeans.cluster_centers_
                         )
                         # Добавляем метки кластеров к обработанным данным
                         processed_data_copy = st.session_state.processed_data.copy()
@@ -397,6 +572,14 @@ if st.session_state.data_loaded and st.session_state.original_data is not None:
         st.subheader("Распределение записей по кластерам")
         st.bar_chart(st.session_state.original_data['cluster'].value_counts())
 
+        if st.session_state.cluster_model is not None:
+            st.download_button(
+                "Скачать модель кластеризации (npz)",
+                st.session_state.cluster_model.to_bytes(),
+                "wallet_cluster_model.npz",
+                help="WalletClusterModel.load(путь).score(df) относит новые кошельки к кластерам без переобучения"
+            )
+
         # === Секция 5: Описание кластеров GigaChat ===
         st.markdown("---")
         st.markdown("### 5. Описание кластеров с помощью AI (GigaChat)")
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from utils.preprocessing import graph_log_columns, graph_raw_columns, metric_columns
+
+
+def make_wallets(n=300, graph=False, seed=0):
+    """Таблица метрик кошельков как у run_fetch_and_process: три группы с разным масштабом активности."""
+    rng = np.random.default_rng(seed)
+    scale = np.repeat([1.0, 20.0, 400.0], -(-n // 3))[:n, None]
+    data = pd.DataFrame(rng.gamma(2.0, 1.0, (n, len(metric_columns))) * scale, columns=metric_columns)
+    if graph:
+        for col in graph_log_columns:
+            data[col] = rng.gamma(2.0, 3.0, n)
+        for col in graph_raw_columns:
+            data[col] = rng.random(n)
+    data["address"] = [f"0x{i:040x}" for i in range(n)]
+    first = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 10, n), unit="D")
+    data["period_first_tx_date"] = first
+    data["period_last_tx_date"] = first + pd.to_timedelta(rng.integers(0, 5, n), unit="D")
+    return data
@@ -0,0 +1,62 @@
+from src.block_index import BlockIndex
+from src.transfer_store import TransferStore
+
+DAY = 86400
+START = 1_700_000_000
+
+
+def _true_block(timestamp):
+    # Неравномерная цепь: первые 10 дней блок раз в 12 секунд, дальше — раз в 6
+    offset = timestamp - START
+    return offset // 12 if offset <= 10 * DAY else 10 * DAY // 12 + (offset - 10 * DAY) // 6
+
+
+class Resolver:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, dt):
+        timestamp = int(dt.timestamp())
+        self.calls.append(timestamp)
+        return _true_block(timestamp)
+
+
+def test_boundaries_are_exact_at_requested_points_and_bounded_between_anchors():
+    resolver = Resolver()
+    index = BlockIndex(None, resolver, max_anchor_gap=4 * DAY)
+    timestamps = [START + i * DAY for i in range(21)]
+    blocks = index.boundaries(timestamps, exact=[timestamps[-2]])
+
+    for ts in (timestamps[0], timestamps[-2], timestamps[-1]):
+        assert blocks[timestamps.index(ts)] == _true_block(ts)
+    assert blocks == sorted(blocks)
+    # Интервалы между опорными точками сужены до max_anchor_gap, и каждая оценка лежит между соседними точками
+    anchors = sorted(index._anchors)
+    assert all(high - low <= 4 * DAY for low, high in zip(anchors, anchors[1:]))
+    assert len(resolver.calls) < len(timestamps)
+    for ts, block in zip(timestamps, blocks):
+        low = max(anchor for anchor in anchors if anchor <= ts)
+        high = min(anchor for anchor in anchors if anchor >= ts)
+        assert _true_block(low) <= block <= _true_block(high)
+
+
+def test_linear_chain_is_interpolated_exactly():
+    index = BlockIndex(None, lambda dt: (int(dt.timestamp()) - START) // 12)
+    timestamps = [START + i * DAY for i in range(15)]
+    assert index.boundaries(timestamps) == [(ts - START) // 12 for ts in timestamps]
+    assert index.exact_count == 2
+
+
+def test_unresolved_edge_returns_none_and_stored_anchors_are_reused(tmp_path):
+    timestamps = [START + i * DAY for i in range(5)]
+    assert BlockIndex(None, lambda dt: None).boundaries(timestamps) is None
+
+    store = TransferStore(str(tmp_path / "transfers.sqlite"))
+    for ts in (timestamps[0], timestamps[-1]):
+        store.put_block(ts, "before", _true_block(ts))
+    resolver = Resolver()
+    index = BlockIndex(store, resolver)
+    blocks = index.boundaries(timestamps)
+    assert resolver.calls == []
+    assert blocks[0] == _true_block(timestamps[0]) and blocks[-1] == _true_block(timestamps[-1])
+    assert index.final_block(timestamps[-2]) == _true_block(timestamps[0])
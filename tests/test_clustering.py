@@ -0,0 +1,65 @@
+import numpy as np
+from sklearn.metrics import silhouette_score
+
+from tests.helpers import make_wallets
+from utils import clustering
+from utils.clustering import (
+    CachedFit, WalletClusterModel, assign_clusters, find_optimal_clusters, fit_kmeans, sampled_silhouette,
+)
+from utils.clustering_cache import ClusteringCache
+
+
+def test_cluster_model_save_load_round_trip(tmp_path):
+    data = make_wallets(graph=True)
+    model = WalletClusterModel.fit(data, 3, graph_features=True, engine="kmeans")
+    path = tmp_path / "model.npz"
+    model.save(str(path))
+
+    loaded = WalletClusterModel.load(str(path))
+    assert loaded.preprocessor.columns == model.preprocessor.columns
+    np.testing.assert_array_equal(loaded.centroids, model.centroids)
+    np.testing.assert_array_equal(loaded.transform(data), model.transform(data))
+    np.testing.assert_array_equal(loaded.score(data), model.labels)
+    assert (WalletClusterModel.from_bytes(model.to_bytes()).score(data) == model.labels).all()
+
+
+def _blobs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0.0, 0.0], [6.0, 0.0], [0.0, 6.0]])
+    labels = rng.integers(0, 3, n)
+    return centers[labels] + rng.normal(size=(n, 2)), labels
+
+
+def test_sampled_silhouette_is_close_to_exact():
+    X, labels = _blobs(4000)
+    exact = silhouette_score(X, labels)
+    score, (low, high) = sampled_silhouette(X, labels, sample_size=1000, n_draws=5)
+    assert low <= score <= high
+    assert abs(score - exact) < 0.01
+    assert low - 0.01 <= exact <= high + 0.01
+
+
+def test_sampled_silhouette_on_small_data_is_exact():
+    X, labels = _blobs(500)
+    score, ci = sampled_silhouette(X, labels, sample_size=1000)
+    assert score == silhouette_score(X, labels)
+    assert ci == (score, score)
+
+
+def _no_fits(*args, **kwargs):
+    raise AssertionError("KMeans обучается повторно, хотя результат есть в кеше")
+
+
+def test_cluster_cache_reuses_sweep_fits(tmp_path, monkeypatch):
+    X, _ = _blobs(600)
+    cache = ClusteringCache(str(tmp_path / "cache"))
+    first = find_optimal_clusters(X, max_k=4, n_jobs=1, engine="kmeans", cache=cache)
+
+    monkeypatch.setattr(clustering, "make_kmeans", _no_fits)
+    # Повторный перебор и финальное обучение — из кеша в памяти, затем из каталога кеша
+    for reused_cache in (cache, ClusteringCache(str(tmp_path / "cache"))):
+        assert find_optimal_clusters(X, max_k=4, n_jobs=1, engine="kmeans", cache=reused_cache) == first
+        fit = fit_kmeans(X, 3, engine="kmeans", cache=reused_cache)
+        assert isinstance(fit, CachedFit)
+        assert fit.inertia_ == first["inertia"][1]
+        np.testing.assert_array_equal(fit.labels_, assign_clusters(X, fit.cluster_centers_))
@@ -0,0 +1,92 @@
+import multiprocessing
+import time
+
+import pytest
+
+from src.etherscan_client import ApiKeyPool, EtherscanClient, get_client, shared_limiters
+from src.etherscan_stub import ChainData, EtherscanStub, StubServer
+
+
+def test_get_client_attaches_limiters_to_existing_client():
+    client = get_client("get-client-key-1")
+    limiters = shared_limiters("get-client-key-1", 5, multiprocessing.get_context("spawn"))
+    assert get_client("get-client-key-1", limiters=limiters) is client
+    assert client.key_pool.limiters["get-client-key-1"] is limiters["get-client-key-1"]
+
+
+def test_get_client_rejects_different_options_for_existing_client():
+    client = get_client("get-client-key-2", calls_per_second=5)
+    assert get_client("get-client-key-2") is client
+    assert get_client("get-client-key-2", calls_per_second=5) is client
+    with pytest.raises(ValueError):
+        get_client("get-client-key-2", calls_per_second=10)
+
+
+class KeyLimitedStub(EtherscanStub):
+    """Заглушка, отвечающая "Max rate limit reached" на каждый запрос с ключом limited_key."""
+
+    limited_key = None
+
+    def handle(self, params):
+        if params.get("apikey") == self.limited_key:
+            self._count("rate_limited")
+            return {"status": "0", "message": "NOTOK", "result": "Max rate limit reached"}
+        return super().handle(params)
+
+
+@pytest.fixture
+def stub_url():
+    servers = []
+
+    def start(stub):
+        server = StubServer(stub).start()
+        servers.append(server)
+        return server.url
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def _balance_params(chain, i):
+    return {"module": "account", "action": "tokenbalance", "contractaddress": chain.contract,
+            "address": chain.addresses[1 + i % 10], "tag": "latest"}
+
+
+def test_invalid_key_is_benched_and_requests_fail_over(stub_url):
+    chain = ChainData.synthetic(days=1, transfers_per_day=100, wallets=10)
+    url = stub_url(EtherscanStub(chain, calls_per_second=None, api_keys=["good-key"]))
+    client = EtherscanClient(["bad-key", "good-key"], calls_per_second=1000, base_url=url, retry_delay=0)
+
+    # Последовательно: ключ отстраняется до следующего запроса
+    params_list = [_balance_params(chain, i) for i in range(20)]
+    assert [client.request(params) for params in params_list] == [str(chain.balance(params["address"])) for params in params_list]
+    stats = client.key_pool.stats
+    assert stats["bad-key"]["invalid"] == 1
+    assert stats["bad-key"]["requests"] == 1
+    assert stats["good-key"]["requests"] == 20
+
+
+def test_rate_limited_key_is_benched(stub_url):
+    chain = ChainData.synthetic(days=1, transfers_per_day=100, wallets=10)
+    stub = KeyLimitedStub(chain, calls_per_second=None)
+    stub.limited_key = "busy-key"
+    client = EtherscanClient(["busy-key", "free-key"], calls_per_second=1000, base_url=stub_url(stub), retry_delay=0)
+
+    assert all(client.request(_balance_params(chain, i)) is not None for i in range(20))
+    stats = client.key_pool.stats
+    assert stats["busy-key"]["rate_limited"] == stats["busy-key"]["requests"] == 1
+    assert stats["busy-key"]["benched_until"] > time.monotonic()
+    assert client.metrics.snapshot()["actions"]["tokenbalance"]["retries"]["rate_limited"] == 1
+
+
+def test_key_pool_round_robin_and_all_keys_benched():
+    pool = ApiKeyPool(["k1", "k2", "k3"], calls_per_second=1000)
+    assert [pool.acquire() for _ in range(6)] == ["k1", "k2", "k3", "k1", "k2", "k3"]
+    pool.bench("k2", 60, "rate_limited")
+    assert [pool.acquire() for _ in range(4)] == ["k1", "k3", "k1", "k3"]
+    pool.bench("k1", 60, "invalid")
+    pool.bench("k3", 60, "invalid")
+    assert pool.acquire(max_wait=1) is None
+    pool.report_success("k1")
+    assert pool.strikes("k1") == 0 and pool.strikes("k2") == 1
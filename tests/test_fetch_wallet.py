@@ -0,0 +1,210 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.block_index import BlockIndex
+from src.etherscan_client import EtherscanClient
+from src.etherscan_stub import BLOCK_SECONDS, BLOCKS_PER_DAY, ChainData, EtherscanStub, StubServer
+from src.fetch_wallet import (
+    daily_wallet_metrics, fetch_transactions_daily_chunks, iter_transaction_pages, ledger_token_balances,
+    stream_wallet_metrics,
+)
+from src.transfer_store import TransferStore
+from src.transfer_table import ZERO_ADDRESS, AddressInterner, TransferTable
+from src.wallet_metrics import compute_wallet_metrics
+
+
+class FlakyStub(EtherscanStub):
+    """Заглушка, отвечающая "Query Timeout" на запросы tokentx, пока fail_tokentx=True."""
+
+    fail_tokentx = False
+
+    def handle(self, params):
+        if self.fail_tokentx and params.get("action") == "tokentx":
+            return {"status": "0", "message": "NOTOK", "result": "Query Timeout occured. Please select a smaller result dataset"}
+        return super().handle(params)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(stub):
+        server = StubServer(stub).start()
+        servers.append(server)
+        return EtherscanClient("test-key", calls_per_second=1000, base_url=server.url, max_retries=2, retry_delay=0)
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def _fetch(client, chain, start_dt, end_dt, store):
+    days_incomplete = []
+    pages = list(iter_transaction_pages(chain.contract, start_dt, end_dt, client, store=store,
+                                        days_with_10k_limit=days_incomplete, interner=AddressInterner()))
+    return TransferTable.concat(pages[0].interner if pages else AddressInterner(), pages), days_incomplete
+
+
+def test_failed_range_is_not_marked_synced_and_is_refetched(serve, tmp_path):
+    chain = ChainData.synthetic(days=3, transfers_per_day=2000, wallets=200)
+    stub = FlakyStub(chain, calls_per_second=None)
+    client = serve(stub)
+    store = TransferStore(str(tmp_path / "transfers.sqlite"))
+    end_dt = datetime.now() - timedelta(hours=1)
+    start_dt = end_dt - timedelta(days=1)
+
+    expected, _ = _fetch(client, chain, start_dt, end_dt, store=False)
+
+    stub.fail_tokentx = True
+    failed, days_incomplete = _fetch(client, chain, start_dt, end_dt, store)
+    assert len(failed) == 0
+    assert days_incomplete
+    assert not store.covered_ranges(chain.contract, 0, chain.latest_block)
+
+    stub.fail_tokentx = False
+    refetched, days_incomplete = _fetch(client, chain, start_dt, end_dt, store)
+    assert not days_incomplete
+    assert len(refetched) == len(expected) > 0
+
+    assert store.covered_ranges(chain.contract, 0, chain.latest_block)
+    cached, _ = _fetch(client, chain, start_dt, end_dt, store)
+    assert len(cached) == len(expected)
+
+
+def test_block_larger_than_result_window_is_yielded_once(serve):
+    now = int(datetime.now().timestamp())
+    latest_block = 3 * BLOCKS_PER_DAY
+    genesis = now - latest_block * BLOCK_SECONDS
+    # 425 переводов в соседних блоках и один блок с 10 500 переводами
+    small = np.arange(latest_block - 1000, latest_block - 575, dtype=np.int64)
+    big = np.full(10500, latest_block - 400, dtype=np.int64)
+    block_number = np.concatenate([small, big])
+    log_index = np.concatenate([np.zeros(len(small), dtype=np.int64), np.arange(len(big), dtype=np.int64)])
+    addresses = [ZERO_ADDRESS] + [f"0x{i:040x}" for i in range(1, 11)]
+    rng = np.random.default_rng(0)
+    chain = ChainData(
+        "0x" + "ab" * 20, addresses, block_number, genesis + block_number * BLOCK_SECONDS, log_index,
+        rng.integers(1, 11, len(block_number)), rng.integers(1, 11, len(block_number)),
+        np.full(len(block_number), 10 ** 18, dtype=np.int64), latest_block=latest_block, genesis=genesis,
+    )
+    client = serve(EtherscanStub(chain, calls_per_second=None))
+    start_dt = datetime.fromtimestamp(now) - timedelta(days=1)
+
+    table, days_incomplete = _fetch(client, chain, start_dt, datetime.fromtimestamp(now), store=False)
+    pairs = set(zip(table.tx_hash.tolist(), table.log_index.tolist()))
+    assert len(pairs) == len(table)
+    assert len(table) == len(small) + 10000
+    assert days_incomplete
+
+
+def test_ledger_checkpoints_only_when_history_reaches_head(serve, tmp_path):
+    chain = ChainData.synthetic(days=2, transfers_per_day=500, wallets=50)
+    client = serve(EtherscanStub(chain, calls_per_second=None))
+    store = TransferStore(str(tmp_path / "transfers.sqlite"))
+    addresses = [address for address in chain.addresses if address != ZERO_ADDRESS]
+
+    half = len(chain) // 2
+    store.add_transfers(chain.contract, [chain.transfer(i) for i in range(half)])
+    store.mark_synced(chain.contract, 0, int(chain.block_number[half - 1]))
+    ledger_token_balances(addresses, chain.contract, client, store=store, sample_size=10)
+    assert not store.get_checkpoints(chain.contract)
+
+    store.add_transfers(chain.contract, [chain.transfer(i) for i in range(half, len(chain))])
+    store.mark_synced(chain.contract, 0, chain.latest_block)
+    balances = ledger_token_balances(addresses, chain.contract, client, store=store, sample_size=10)
+    checkpoints = store.get_checkpoints(chain.contract)
+    assert checkpoints
+    assert all(block == chain.block_number[-1] and balances[address] == balance
+               for address, (block, balance) in checkpoints.items())
+
+
+def test_ledger_without_full_history_uses_api_balances(serve, tmp_path):
+    chain = ChainData.synthetic(days=2, transfers_per_day=500, wallets=50)
+    stub = EtherscanStub(chain, calls_per_second=None)
+    client = serve(stub)
+    store = TransferStore(str(tmp_path / "transfers.sqlite"))
+    addresses = [address for address in chain.addresses if address != ZERO_ADDRESS]
+
+    # В хранилище только вторая половина истории: значения леджера — чистый поток за окно, а не баланс
+    half = len(chain) // 2
+    store.add_transfers(chain.contract, [chain.transfer(i) for i in range(half, len(chain))])
+    store.mark_synced(chain.contract, int(chain.block_number[half]), chain.latest_block)
+    balances = ledger_token_balances(addresses, chain.contract, client, store=store, sample_size=10, ttl=0)
+    assert balances == {address: chain.balance(address) for address in addresses}
+    assert stub.stats["actions"]["tokenbalance"] >= len(addresses)
+
+
+class BlockFailStub(EtherscanStub):
+    """Заглушка, отвечающая "Query Timeout" на tokentx по диапазонам, содержащим блок fail_block."""
+
+    fail_block = None
+
+    def handle(self, params):
+        if (self.fail_block is not None and params.get("action") == "tokentx"
+                and int(params.get("startblock", 0)) <= self.fail_block <= int(params.get("endblock", 0))):
+            return {"status": "0", "message": "NOTOK", "result": "Query Timeout occured. Please select a smaller result dataset"}
+        return super().handle(params)
+
+
+def _sorted_frame(df):
+    return df.sort_values("address").reset_index(drop=True)
+
+
+def test_failed_range_near_midnight_keeps_neighbouring_day_unsaved(serve, tmp_path, monkeypatch):
+    chain = ChainData.synthetic(days=5, transfers_per_day=2000, wallets=200)
+    stub = BlockFailStub(chain, calls_per_second=None)
+    client = serve(stub)
+    store = TransferStore(str(tmp_path / "transfers.sqlite"))
+    end_dt = datetime.now()
+    start_dt = datetime.combine(end_dt.date() - timedelta(days=4), datetime.min.time())
+    day = end_dt.date() - timedelta(days=2)
+    midnight = int(datetime.combine(day, datetime.min.time()).timestamp())
+    midnight_block = chain.block_at(midnight, closest="after")
+
+    # Оценка границы дня на 300 блоков позже настоящей: начало дня day попадает в диапазон предыдущего дня
+    boundaries = BlockIndex.boundaries
+
+    def late_boundaries(self, timestamps, exact=()):
+        blocks = boundaries(self, timestamps, exact)
+        return [block + 300 if ts == midnight else block for ts, block in zip(timestamps, blocks)]
+
+    monkeypatch.setattr(BlockIndex, "boundaries", late_boundaries)
+    first, last = chain.transfer_range(midnight_block, midnight_block + 299)
+    assert last > first
+
+    stub.fail_block = midnight_block + 100
+    _, days_incomplete = daily_wallet_metrics(chain.contract, start_dt, end_dt, 18, client, store=store)
+    assert {day - timedelta(days=1), day} <= set(days_incomplete)
+    saved = store.get_daily_partials(chain.contract, [day - timedelta(days=1), day], 18)
+    assert not saved
+
+    stub.fail_block = None
+    window, days_incomplete = daily_wallet_metrics(chain.contract, start_dt, end_dt, 18, client, store=store)
+    assert not days_incomplete
+    table, addresses, _ = fetch_transactions_daily_chunks(chain.contract, start_dt, end_dt, client, store=False)
+    expected = compute_wallet_metrics(table, addresses, 18, start_dt, end_dt, chain.contract, {})
+    pd.testing.assert_frame_equal(_sorted_frame(window.to_frame(18, {})), _sorted_frame(expected), check_like=True)
+
+
+def test_daily_partials_merge_to_list_mode_metrics(serve, tmp_path):
+    chain = ChainData.synthetic(days=5, transfers_per_day=2000, wallets=200)
+    client = serve(EtherscanStub(chain, calls_per_second=None))
+    store = TransferStore(str(tmp_path / "transfers.sqlite"))
+    end_dt = datetime.now() - timedelta(hours=1)
+    start_dt = end_dt - timedelta(days=3, hours=5)
+    balances = {address: 10 ** 18 for address in chain.addresses[1:20]}
+
+    table, addresses, _ = fetch_transactions_daily_chunks(chain.contract, start_dt, end_dt, client, store=False)
+    expected = _sorted_frame(compute_wallet_metrics(table, addresses, 18, start_dt, end_dt, chain.contract, balances))
+    accumulator, _ = stream_wallet_metrics(chain.contract, start_dt, end_dt, 18, client, store=False)
+    pd.testing.assert_frame_equal(_sorted_frame(accumulator.to_frame(balances)), expected, check_like=True)
+
+    # Первый запуск строит и сохраняет дневные агрегаты, второй собирает окно из сохраненных
+    for _ in range(2):
+        window, days_incomplete = daily_wallet_metrics(chain.contract, start_dt, end_dt, 18, client, store=store)
+        assert not days_incomplete
+        pd.testing.assert_frame_equal(_sorted_frame(window.to_frame(18, balances)), expected, check_like=True)
+    assert store.get_daily_partials(chain.contract, [start_dt.date() + timedelta(days=1)], 18)
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from tests.helpers import make_wallets
+from utils.online_clustering import OnlineClusterModel
+from utils.preprocessing import metric_columns
+
+
+def _assert_centroids_are_cluster_means(online):
+    X = online.model.transform(online.data)
+    labels = online.labels.loc[online.data.index].to_numpy()
+    for cluster in range(online.n_clusters):
+        members = labels == cluster
+        assert online.counts[cluster] == members.sum()
+        if members.any():
+            np.testing.assert_allclose(online.model.centroids[cluster], X[members].mean(axis=0), atol=1e-9)
+
+
+def test_update_keeps_centroids_equal_to_cluster_means():
+    data = make_wallets(300)
+    online = OnlineClusterModel.fit(data, 3, drift_threshold=np.inf, engine="kmeans")
+    previous_labels = online.labels.copy()
+
+    changed = make_wallets(60, seed=1)
+    changed["address"] = list(data["address"][:40]) + [f"0x{i:040x}" for i in range(1000, 1020)]
+    removed = list(data["address"][250:260])
+    summary = online.update(changed, removed)
+
+    assert (summary["updated"], summary["new"], summary["removed"], summary["refit"]) == (40, 20, 10, False)
+    assert len(online.data) == 300 + 20 - 10
+    assert online.data.index.is_unique
+    assert not online.data.index.isin(removed).any()
+    untouched = data["address"][40:250]
+    pd.testing.assert_series_equal(online.labels.loc[untouched], previous_labels.loc[untouched], check_names=False)
+    _assert_centroids_are_cluster_means(online)
+
+
+def test_refresh_detects_changes_and_keeps_wallets_with_empty_dates():
+    data = make_wallets(300)
+    data.loc[:19, ["period_first_tx_date", "period_last_tx_date"]] = pd.NaT
+    online = OnlineClusterModel.fit(data, 3, drift_threshold=np.inf, engine="kmeans")
+    assert len(online.data) == 300
+
+    current = data.copy()
+    current.loc[100:109, metric_columns[0]] *= 50
+    summary = online.refresh(current)
+    assert (summary["updated"], summary["new"], summary["removed"]) == (10, 0, 0)
+    _assert_centroids_are_cluster_means(online)
+
+
+def test_drift_beyond_threshold_triggers_refit():
+    data = make_wallets(300)
+    online = OnlineClusterModel.fit(data, 3, drift_threshold=0.01, engine="kmeans")
+    shifted = data.copy()
+    shifted[metric_columns] *= 1000
+    summary = online.refresh(shifted)
+    assert summary["refit"]
+    assert online.drift == 0
+    _assert_centroids_are_cluster_means(online)
@@ -0,0 +1,15 @@
+from tests.helpers import make_wallets
+from utils.clustering import WalletClusterModel, fit_kmeans
+from utils.preprocessing import metric_columns, preprocess_data
+
+
+def test_preprocess_data_returns_the_preprocessor_of_its_features():
+    # Колонки графа в файле без graph_features не попадают ни в признаки, ни в модель
+    data = make_wallets(graph=True)
+    scaled_features, _, preprocessor = preprocess_data(data)
+    assert preprocessor.columns == metric_columns
+    assert scaled_features.shape[1] == len(preprocessor.columns)
+
+    kmeans = fit_kmeans(scaled_features, 3, engine="kmeans")
+    model = WalletClusterModel(preprocessor, kmeans.cluster_centers_)
+    assert (model.score(data) == kmeans.labels_).all()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from src.transfer_graph import TransferGraph, TransferGraphBuilder
+from src.transfer_table import ZERO_ADDRESS, AddressInterner, TransferTable
+
+A, B, C, D, E = (f"0x{i:040x}" for i in range(1, 6))
+# (отправитель, получатель, объем в токенах); mint и перевод самому себе в граф не входят
+TRANSFERS = [(A, B, 2), (B, C, 1), (C, A, 1), (A, B, 3), (C, D, 4), (ZERO_ADDRESS, A, 7), (E, E, 5)]
+
+
+def _table(transfers, interner):
+    return TransferTable.from_transactions(interner, [
+        {"blockNumber": str(i + 1), "timeStamp": str(1_700_000_000 + i), "hash": f"0x{i:064x}", "logIndex": "0",
+         "from": sender, "to": receiver, "value": str(volume * 10 ** 18)}
+        for i, (sender, receiver, volume) in enumerate(transfers)
+    ])
+
+
+def _reference_pagerank(volume, damping=0.85):
+    size = len(volume)
+    out_volume = volume.sum(axis=1)
+    dangling = out_volume == 0
+    transition = np.divide(volume, out_volume[:, None], out=np.zeros_like(volume), where=~dangling[:, None])
+    rank = np.full(size, 1.0 / size)
+    for _ in range(1000):
+        rank = damping * (transition.T @ rank + rank[dangling].sum() / size) + (1.0 - damping) / size
+    return rank
+
+
+def test_graph_features_on_a_fixed_graph():
+    graph = TransferGraph.from_table(_table(TRANSFERS, AddressInterner()), 18)
+    assert len(graph) == 4 and graph.edge_count == 4
+
+    features = graph.features([A, B, C, D, E]).set_index("address")
+    expected = pd.DataFrame({
+        "graph_in_degree": [1, 1, 1, 1, 0],
+        "graph_out_degree": [1, 1, 2, 0, 0],
+        "graph_weighted_in_degree": [1.0, 5.0, 1.0, 4.0, 0.0],
+        "graph_weighted_out_degree": [5.0, 1.0, 5.0, 0.0, 0.0],
+        "graph_clustering": [1.0, 1.0, 1 / 3, 0.0, 0.0],
+        "graph_component_size": [4, 4, 4, 4, 1],
+    }, index=[A, B, C, D, E])
+    for column in expected.columns:
+        np.testing.assert_allclose(features[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                   err_msg=column)
+
+    volume = np.array([[0, 5, 0, 0], [0, 0, 1, 0], [1, 0, 0, 4], [0, 0, 0, 0]], dtype=float)
+    np.testing.assert_allclose(features["graph_pagerank"].to_numpy()[:4], _reference_pagerank(volume), atol=1e-9)
+    assert features.loc[E, "graph_pagerank"] == 0
+
+
+def test_streaming_builder_matches_graph_from_table():
+    rng = np.random.default_rng(0)
+    wallets = [f"0x{i:040x}" for i in range(1, 30)]
+    transfers = [(wallets[s], wallets[r], int(v)) for s, r, v in zip(
+        rng.integers(0, 29, 500), rng.integers(0, 29, 500), rng.integers(1, 100, 500))]
+    interner = AddressInterner()
+    table = _table(transfers, interner)
+
+    builder = TransferGraphBuilder(18, compact_every=64)
+    for start in range(0, len(table), 37):
+        builder.add_table(table.take(np.arange(start, min(start + 37, len(table)))))
+    expected = TransferGraph.from_table(table, 18).features(wallets)
+    pd.testing.assert_frame_equal(builder.build().features(wallets), expected)
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.etherscan_stub import ChainData
+from src.transfer_table import ZERO_ADDRESS
+from src.wallet_metrics import WalletMetricsAccumulator, compute_wallet_metrics
+
+DECIMALS = 18
+
+
+def _reference_metrics(address, transactions, token_decimals, start_dt, end_dt, contract_address, raw_balance):
+    """Построчный расчет метрик одного адреса, как в исходной calculate_period_metrics."""
+    address = address.lower()
+    selected = [
+        tx for tx in transactions
+        if tx["contractAddress"].lower() == contract_address.lower()
+        and address in (tx["from"].lower(), tx["to"].lower())
+        and start_dt <= datetime.fromtimestamp(int(tx["timeStamp"])) <= end_dt
+    ]
+    timestamps = sorted(int(tx["timeStamp"]) for tx in selected)
+    incoming, outgoing, counterparties = [], [], set()
+    for tx in selected:
+        value = int(tx["value"]) / 10 ** token_decimals
+        sender, receiver = tx["from"].lower(), tx["to"].lower()
+        if sender == address:
+            outgoing.append(value)
+            if receiver not in (address, ZERO_ADDRESS):
+                counterparties.add(receiver)
+        else:
+            incoming.append(value)
+            if sender not in (address, ZERO_ADDRESS):
+                counterparties.add(sender)
+    return {
+        "address": address,
+        "current_token_balance": raw_balance / 10 ** token_decimals if raw_balance else 0.0,
+        "period_total_tx_count": len(selected),
+        "period_incoming_tx_count": len(incoming),
+        "period_outgoing_tx_count": len(outgoing),
+        "period_total_volume_in": sum(incoming),
+        "period_total_volume_out": sum(outgoing),
+        "period_avg_volume_in": sum(incoming) / len(incoming) if incoming else 0.0,
+        "period_avg_volume_out": sum(outgoing) / len(outgoing) if outgoing else 0.0,
+        "period_unique_counterparties": len(counterparties),
+        "period_active_days": len({datetime.fromtimestamp(ts).date() for ts in timestamps}),
+        "period_first_tx_date": datetime.fromtimestamp(timestamps[0]) if timestamps else None,
+        "period_last_tx_date": datetime.fromtimestamp(timestamps[-1]) if timestamps else None,
+    }
+
+
+@pytest.fixture
+def transfers():
+    chain = ChainData.synthetic(days=3, transfers_per_day=400, wallets=40, now=1_700_000_000)
+    transactions = [chain.transfer(i) for i in range(len(chain))]
+    wallet = chain.addresses[1]
+    last = transactions[-1]
+    # Перевод самому себе, перевод другого токена и перевод вне окна
+    transactions.append(dict(last, hash="0x" + "01" * 32, **{"from": wallet, "to": wallet}))
+    transactions.append(dict(last, hash="0x" + "02" * 32, contractAddress="0x" + "cd" * 20))
+    transactions.insert(0, dict(transactions[0], hash="0x" + "03" * 32, timeStamp=str(int(chain.time_stamp[0]) - 86400)))
+    end_dt = datetime.fromtimestamp(int(chain.time_stamp[-1]))
+    start_dt = end_dt - timedelta(days=2)
+    balances = {address: 10 ** 18 * (i + 1) for i, address in enumerate(chain.addresses[1:10])}
+    return chain, transactions, start_dt, end_dt, balances
+
+
+def _expected(chain, transactions, start_dt, end_dt, balances, addresses):
+    return pd.DataFrame([
+        _reference_metrics(address, transactions, DECIMALS, start_dt, end_dt, chain.contract, balances.get(address, 0))
+        for address in addresses
+    ])
+
+
+def _assert_same(actual, expected):
+    actual = actual.set_index("address").sort_index()
+    expected = expected.set_index("address").sort_index()
+    assert list(actual.index) == list(expected.index)
+    for column in expected.columns:
+        if column in ("period_first_tx_date", "period_last_tx_date"):
+            assert (pd.to_datetime(actual[column]).tolist() == pd.to_datetime(expected[column]).tolist()), column
+        else:
+            np.testing.assert_allclose(actual[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                       rtol=1e-9, err_msg=column)
+
+
+def test_compute_wallet_metrics_matches_per_address_reference(transfers):
+    chain, transactions, start_dt, end_dt, balances = transfers
+    addresses = [address for address in chain.addresses if address != ZERO_ADDRESS] + ["0x" + "ef" * 20]
+    actual = compute_wallet_metrics(transactions, addresses, DECIMALS, start_dt, end_dt, chain.contract, balances)
+    assert list(actual["address"]) == addresses
+    _assert_same(actual, _expected(chain, transactions, start_dt, end_dt, balances, addresses))
+
+
+def test_streaming_accumulator_matches_per_address_reference(transfers):
+    chain, transactions, start_dt, end_dt, balances = transfers
+    accumulator = WalletMetricsAccumulator(DECIMALS, start_dt, end_dt, chain.contract)
+    for start in range(0, len(transactions), 97):
+        accumulator.add_transactions(transactions[start:start + 97])
+    actual = accumulator.to_frame(balances)
+    _assert_same(actual, _expected(chain, transactions, start_dt, end_dt, balances, accumulator.addresses))
@@ -1,27 +1,290 @@
-from sklearn.cluster import KMeans
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from scipy import stats
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score, davies_bouldin_score
+from threadpoolctl import threadpool_limits
+
+from utils.clustering_cache import fingerprint, fit_key, score_key
+from utils.preprocessing import WalletPreprocessor
+from utils.shared_array import SharedArray, attach
+
+MODEL_FORMAT_VERSION = 1
+PARALLEL_MIN_ROWS = 5000  # на меньших данных запуск процессов дороже самого перебора k
+SILHOUETTE_EXACT_MAX_ROWS = 50000  # выше — silhouette по выборкам (точный расчет O(n²) по времени и памяти)
+SILHOUETTE_SAMPLE_SIZE = 10000
+SILHOUETTE_DRAWS = 5
+ENGINES = ("auto", "kmeans", "minibatch")
+MINIBATCH_MIN_ROWS = 200_000  # engine="auto": выше — MiniBatchKMeans
+MINIBATCH_BATCH_SIZE = 4096
+
+
+_worker_features = None
+
+
+def _init_sweep_worker(descriptor, threads):
+    global _worker_features
+    _worker_features = attach(descriptor)
+    # Процессы пула делят ядра: потоки OpenMP/BLAS внутри KMeans ограничиваются своей долей
+    threadpool_limits(threads)
+
+
+def _stratified_sample(labels, sample_size, rng):
+    # Доля каждого кластера в выборке — как в данных, но не меньше двух точек (если они есть)
+    clusters, counts = np.unique(labels, return_counts=True)
+    quotas = np.minimum(counts, np.maximum(2, np.round(sample_size * counts / len(labels)).astype(int)))
+    members = np.argsort(labels, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return np.concatenate([
+        rng.choice(members[start:start + count], quota, replace=False)
+        for start, count, quota in zip(starts, counts, quotas)
+    ])
+
+
+def sampled_silhouette(scaled_features, labels, sample_size=SILHOUETTE_SAMPLE_SIZE, n_draws=SILHOUETTE_DRAWS,
+                       confidence=0.95, random_state=42):
+    """
+    Оценка silhouette по n_draws стратифицированным (по кластерам) выборкам размера sample_size:
+    O(n_draws · sample_size²) вместо O(n²). Возвращает (среднее, (нижняя, верхняя) граница
+    доверительного интервала по t-распределению). Если строк не больше sample_size, silhouette
+    считается точно по всем данным, и интервал вырождается в точку.
+    """
+    if len(labels) <= sample_size:
+        score = float(silhouette_score(scaled_features, labels))
+        return score, (score, score)
+    rng = np.random.default_rng(random_state)
+    scores = np.array([
+        silhouette_score(scaled_features[np.sort(sample)], labels[np.sort(sample)])
+        for sample in (_stratified_sample(labels, sample_size, rng) for _ in range(n_draws))
+    ])
+    mean = float(scores.mean())
+    if n_draws < 2:
+        return mean, (mean, mean)
+    half_width = float(stats.t.ppf(0.5 + confidence / 2, n_draws - 1) * scores.std(ddof=1) / np.sqrt(n_draws))
+    return mean, (mean - half_width, mean + half_width)
+
+
+def _use_sampled_silhouette(silhouette, n_rows):
+    if silhouette not in ("auto", "exact", "sampled"):
+        raise ValueError(f"Неизвестный режим silhouette: {silhouette}")
+    return silhouette == "sampled" or (silhouette == "auto" and n_rows > SILHOUETTE_EXACT_MAX_ROWS)
+
+
+def resolve_engine(engine, n_rows):
+    """Алгоритм кластеризации: "kmeans" (полный KMeans), "minibatch" (MiniBatchKMeans) или "auto" — по числу строк."""
+    if engine not in ENGINES:
+        raise ValueError(f"Неизвестный алгоритм кластеризации: {engine}")
+    if engine == "auto":
+        return "minibatch" if n_rows > MINIBATCH_MIN_ROWS else "kmeans"
+    return engine
+
+
+def make_kmeans(n_clusters, engine="kmeans", batch_size=MINIBATCH_BATCH_SIZE, random_state=42):
+    if engine == "minibatch":
+        return MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, n_init=3, random_state=random_state)
+    return KMeans(n_clusters=n_clusters, random_state=random_state)
+
+
+def _engine_features(scaled_features, float32):
+    # float32 вдвое уменьшает объем данных, проходящих через память на каждой итерации KMeans
+    return np.asarray(scaled_features, dtype=np.float32) if float32 else scaled_features
+
+
+def _evaluate_k(k, scaled_features=None, sampled=False, sample_size=SILHOUETTE_SAMPLE_SIZE, n_draws=SILHOUETTE_DRAWS,
+                engine="kmeans", batch_size=MINIBATCH_BATCH_SIZE, float32=False):
+    scaled_features = _worker_features if scaled_features is None else scaled_features
+    scaled_features = _engine_features(scaled_features, float32)
+    kmeans = make_kmeans(k, engine, batch_size)
+    labels = kmeans.fit_predict(scaled_features)
+    if sampled:
+        silhouette, silhouette_ci = sampled_silhouette(scaled_features, labels, sample_size, n_draws)
+    else:
+        silhouette, silhouette_ci = silhouette_score(scaled_features, labels), None
+    return k, {
+        'inertia': float(kmeans.inertia_),
+        'silhouette': float(silhouette),
+        'silhouette_ci': silhouette_ci,
+        'davies_bouldin': float(davies_bouldin_score(scaled_features, labels)),
+        'centroids': kmeans.cluster_centers_,
+    }
 
-def find_optimal_clusters(scaled_features, max_k=10):
-    inertia = []
-    silhouette_scores = []
-    davies_bouldin_scores = []
+
+def assign_clusters(features, centroids, chunk_rows=1 << 20):
+    """Номер ближайшего центроида для каждой строки (порциями, чтобы не материализовать memmap целиком)."""
+    centroids = np.asarray(centroids, dtype=np.float64)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(features), dtype=np.int32)
+    for start in range(0, len(features), chunk_rows):
+        X = np.asarray(features[start:start + chunk_rows], dtype=np.float64)
+        # argmin ||x - c||^2 = argmin (||c||^2 - 2 x·c): одно матричное умножение на порцию
+        labels[start:start + chunk_rows] = np.argmin(centroid_norms - 2.0 * (X @ centroids.T), axis=1)
+    return labels
+
+
+class CachedFit:
+    """Обучение из ClusteringCache с атрибутами обученного KMeans: cluster_centers_, labels_, inertia_."""
+
+    def __init__(self, centroids, inertia, labels):
+        self.cluster_centers_ = centroids
+        self.inertia_ = inertia
+        self.labels_ = labels
+        self.n_clusters = len(centroids)
+
+    def predict(self, X):
+        return assign_clusters(X, self.cluster_centers_)
+
+
+def find_optimal_clusters(scaled_features, max_k=10, n_jobs=None, on_result=None, silhouette="auto",
+                          sample_size=SILHOUETTE_SAMPLE_SIZE, n_draws=SILHOUETTE_DRAWS,
+                          engine="auto", batch_size=MINIBATCH_BATCH_SIZE, float32=False, cache=None):
+    """
+    Метрики KMeans для k = 2..max_k. Каждое k считается в отдельном процессе (n_jobs — число процессов,
+    по умолчанию — по числу k, не больше числа CPU, а при строк меньше PARALLEL_MIN_ROWS — 1;
+    n_jobs=1 — последовательно в текущем процессе). Процессы запускаются через spawn: Streamlit
+    выполняет скрипт в потоке, а fork многопоточного процесса небезопасен.
+    Признаки передаются процессам через общую память (SharedArray), а не копией в каждое задание.
+    on_result(k, scores) вызывается по мере готовности каждого k (порядок завершения произвольный).
+    silhouette: "exact" — точный silhouette_score, "sampled" — оценка по выборкам (sampled_silhouette)
+    с доверительным интервалом в 'silhouette_ci', "auto" — выборки при строк больше SILHOUETTE_EXACT_MAX_ROWS.
+    engine, batch_size, float32 — алгоритм кластеризации (см. resolve_engine, make_kmeans).
+    cache — ClusteringCache: уже посчитанные k берутся из него, и считаются только новые k.
+    """
     K_range = range(2, max_k+1)
+    sampled = _use_sampled_silhouette(silhouette, len(scaled_features))
+    engine = resolve_engine(engine, len(scaled_features))
+    results = {}
+
+    keys = {}
+    if cache is not None:
+        features_fingerprint = fingerprint(scaled_features)
+        scores_key = score_key(sampled, sample_size, n_draws)
+        for k in K_range:
+            keys[k] = fit_key(features_fingerprint, k, engine, batch_size, float32)
+            fit, scores = cache.get_fit(keys[k]), cache.get_scores(keys[k], scores_key)
+            if fit is not None and scores is not None:
+                results[k] = dict(scores, inertia=fit[1], centroids=fit[0])
+                if on_result:
+                    on_result(k, results[k])
+
+    def collect(k, result):
+        results[k] = result
+        if cache is not None:
+            cache.put_fit(keys[k], result['centroids'], result['inertia'])
+            cache.put_scores(keys[k], scores_key, {
+                name: result[name] for name in ('silhouette', 'silhouette_ci', 'davies_bouldin')
+            })
+        if on_result:
+            on_result(k, result)
 
-    for k in K_range:
-        kmeans = KMeans(n_clusters=k, random_state=42)
-        labels = kmeans.fit_predict(scaled_features)
-        inertia.append(kmeans.inertia_)
-        silhouette_scores.append(silhouette_score(scaled_features, labels))
-        davies_bouldin_scores.append(davies_bouldin_score(scaled_features, labels))
+    pending = [k for k in K_range if k not in results]
+    if n_jobs is None:
+        n_jobs = min(len(pending), os.cpu_count() or 1) if len(scaled_features) >= PARALLEL_MIN_ROWS else 1
+
+    if pending and n_jobs <= 1:
+        for k in pending:
+            collect(*_evaluate_k(k, scaled_features, sampled, sample_size, n_draws, engine, batch_size, float32))
+    elif pending:
+        threads = max(1, (os.cpu_count() or 1) // n_jobs)
+        with SharedArray(scaled_features) as shared, ProcessPoolExecutor(
+            max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_sweep_worker, initargs=(shared.descriptor, threads)
+        ) as executor:
+            # Большие k обычно считаются дольше, поэтому запускаются первыми
+            futures = [
+                executor.submit(_evaluate_k, k, None, sampled, sample_size, n_draws, engine, batch_size, float32)
+                for k in sorted(pending, reverse=True)
+            ]
+            for future in as_completed(futures):
+                collect(*future.result())
 
     return {
-        'inertia': inertia,
-        'silhouette': silhouette_scores,
-        'davies_bouldin': davies_bouldin_scores,
+        'inertia': [results[k]['inertia'] for k in K_range],
+        'silhouette': [results[k]['silhouette'] for k in K_range],
+        'silhouette_ci': [results[k]['silhouette_ci'] for k in K_range] if sampled else None,
+        'davies_bouldin': [results[k]['davies_bouldin'] for k in K_range],
         'K_range': list(K_range)
     }
 
-def perform_clustering(scaled_features, n_clusters):
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    cluster_labels = kmeans.fit_predict(scaled_features)
-    return cluster_labels
\ No newline at end of file
+def fit_kmeans(scaled_features, n_clusters, engine="auto", batch_size=MINIBATCH_BATCH_SIZE, float32=False, cache=None):
+    """
+    Обученный KMeans/MiniBatchKMeans. С cache обучение, уже выполненное при переборе k
+    (find_optimal_clusters с теми же параметрами), не повторяется: возвращается CachedFit.
+    """
+    engine = resolve_engine(engine, len(scaled_features))
+    if cache is not None:
+        key = fit_key(fingerprint(scaled_features), n_clusters, engine, batch_size, float32)
+        fit = cache.get_fit(key)
+        if fit is not None:
+            return CachedFit(fit[0], fit[1], assign_clusters(scaled_features, fit[0]))
+    kmeans = make_kmeans(n_clusters, engine, batch_size).fit(_engine_features(scaled_features, float32))
+    if cache is not None:
+        cache.put_fit(key, kmeans.cluster_centers_, kmeans.inertia_)
+    return kmeans
+
+def perform_clustering(scaled_features, n_clusters, engine="auto", batch_size=MINIBATCH_BATCH_SIZE, float32=False,
+                       cache=None):
+    return fit_kmeans(scaled_features, n_clusters, engine, batch_size, float32, cache).labels_
+
+
+class WalletClusterModel:
+    """
+    Обученная модель кластеризации: предобработка (WalletPreprocessor) и центроиды KMeans.
+    score(df) относит новые кошельки к ближайшему центроиду без переобучения;
+    save/load — файл npz (или байты для скачивания из Streamlit).
+    """
+
+    def __init__(self, preprocessor, centroids):
+        self.preprocessor = preprocessor
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    @classmethod
+    def fit(cls, data, n_clusters, graph_features=False, engine="auto", batch_size=MINIBATCH_BATCH_SIZE, float32=False):
+        """Обучение на DataFrame метрик; метки обучающих кошельков — в model.labels."""
+        preprocessor = WalletPreprocessor.fit(data, graph_features)
+        kmeans = fit_kmeans(preprocessor.transform(data), n_clusters, engine, batch_size, float32)
+        model = cls(preprocessor, kmeans.cluster_centers_)
+        model.labels = kmeans.labels_
+        return model
+
+    def transform(self, data):
+        return self.preprocessor.transform(data)
+
+    def score(self, data):
+        """
+        Номер ближайшего центроида для каждой строки data (DataFrame с колонками метрик).
+        Строки с пропусками в признаках получают -1.
+        """
+        X = self.transform(data).astype(np.float64, copy=False)
+        labels = assign_clusters(X, self.centroids)
+        labels[~np.isfinite(X).all(axis=1)] = -1
+        return labels
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, version=np.array(MODEL_FORMAT_VERSION), centroids=self.centroids,
+                 **self.preprocessor.to_arrays())
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        arrays = np.load(io.BytesIO(data))
+        if "version" not in arrays or int(arrays["version"]) != MODEL_FORMAT_VERSION:
+            raise ValueError("Неподдерживаемая версия файла модели.")
+        return cls(WalletPreprocessor.from_arrays(arrays), arrays["centroids"])
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
@@ -0,0 +1,98 @@
+import hashlib
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+_HASH_CHUNK_ROWS = 1 << 20
+
+
+def fingerprint(scaled_features):
+    """Отпечаток матрицы признаков (форма, тип и содержимое; memory-mapped массив читается порциями)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((scaled_features.shape, np.dtype(scaled_features.dtype).str)).encode())
+    for start in range(0, len(scaled_features), _HASH_CHUNK_ROWS):
+        digest.update(np.ascontiguousarray(scaled_features[start:start + _HASH_CHUNK_ROWS]).data)
+    return digest.hexdigest()
+
+
+def fit_key(features_fingerprint, k, engine, batch_size, float32):
+    """Ключ обучения: признаки, k и параметры алгоритма (batch_size влияет только на MiniBatchKMeans)."""
+    return f"{features_fingerprint}-k{k}-{engine}-b{batch_size if engine == 'minibatch' else 0}-{'f32' if float32 else 'f64'}"
+
+
+def score_key(sampled, sample_size, n_draws):
+    return f"sampled-{sample_size}-{n_draws}" if sampled else "exact"
+
+
+class ClusteringCache:
+    """
+    Кеш обученных моделей перебора k: по fit_key хранятся центроиды и инерция, а для каждого
+    режима silhouette (score_key) — метрики. Метки не хранятся: они восстанавливаются отнесением
+    строк к ближайшему центроиду. directory — необязательное хранение на диске (файл npz на обучение),
+    чтобы кеш переживал перезапуск приложения.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._entries = {}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _load(self, key):
+        entry = self._entries.get(key)
+        if entry is None and self.directory and os.path.exists(self._path(key)):
+            with np.load(self._path(key)) as arrays:
+                entry = {
+                    "centroids": arrays["centroids"],
+                    "inertia": float(arrays["inertia"]),
+                    "scores": json.loads(str(arrays["scores"])),
+                }
+            self._entries[key] = entry
+        return entry
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        if self.directory:
+            buffer = io.BytesIO()
+            np.savez(buffer, centroids=entry["centroids"], inertia=np.array(entry["inertia"]),
+                     scores=np.array(json.dumps(entry["scores"])))
+            # Запись через временный файл: параллельные процессы не увидят недописанный npz
+            temporary = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(temporary, self._path(key))
+
+    def get_fit(self, key):
+        """(центроиды, инерция) или None."""
+        with self._lock:
+            entry = self._load(key)
+        return None if entry is None else (entry["centroids"], entry["inertia"])
+
+    def put_fit(self, key, centroids, inertia):
+        with self._lock:
+            entry = self._load(key)
+            if entry is None or not np.array_equal(entry["centroids"], centroids):
+                self._store(key, {"centroids": np.asarray(centroids), "inertia": float(inertia), "scores": {}})
+
+    def get_scores(self, key, scores_key):
+        with self._lock:
+            entry = self._load(key)
+        return None if entry is None else entry["scores"].get(scores_key)
+
+    def put_scores(self, key, scores_key, scores):
+        with self._lock:
+            entry = self._load(key)
+            if entry is not None:
+                entry["scores"][scores_key] = scores
+                self._store(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,31 +1,145 @@
+import io
+
 import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
+import pandas as pd
+
+from utils.clustering_cache import fingerprint
+
+EDA_BINS = 30
+EDA_PANELS = 12
+EDA_KDE_SAMPLE = 20000  # KDE считается по случайной выборке строк: O(выборка · точки сетки) вместо O(n)
+EDA_KDE_POINTS = 200
+EDA_CACHE_SIZE = 4
+_HIST_CHUNK_ROWS = 1 << 18
+
+
+def data_fingerprint(data):
+    """Отпечаток DataFrame: имена и типы колонок и содержимое (числовые колонки хешируются без копирования)."""
+    parts = [repr((list(data.columns), [str(dtype) for dtype in data.dtypes], len(data)))]
+    for column in data.columns:
+        values = data[column].to_numpy()
+        if values.dtype.kind not in "biuf":
+            values = pd.util.hash_pandas_object(data[column], index=False).to_numpy()
+        parts.append(fingerprint(values))
+    return fingerprint(np.frombuffer("|".join(parts).encode(), dtype=np.uint8))
+
+
+def histograms(X, bins=EDA_BINS):
+    """
+    Гистограммы всех колонок X за один проход: номер корзины каждой колонки сдвигается на
+    колонка · bins, и все корзины считаются одним np.bincount. Пропуски и бесконечности не учитываются.
+    Возвращает (границы корзин (колонки × (bins + 1)), число строк (колонки × bins)).
+    """
+    finite = np.isfinite(X)
+    low = np.where(finite, X, np.inf).min(axis=0)
+    high = np.where(finite, X, -np.inf).max(axis=0)
+    empty = ~np.isfinite(low)
+    low, high = np.where(empty, 0.0, low), np.where(empty, 1.0, high)
+    # Колонка из одного значения — корзины на отрезке [значение - 0.5, значение + 0.5], как в np.histogram
+    same = high <= low
+    low, high = np.where(same, low - 0.5, low), np.where(same, high + 0.5, high)
+    width = (high - low) / bins
+    offsets = np.arange(X.shape[1]) * bins
+    counts = np.zeros(X.shape[1] * bins, dtype=np.int64)
+    for start in range(0, len(X), _HIST_CHUNK_ROWS):
+        chunk, valid = X[start:start + _HIST_CHUNK_ROWS], finite[start:start + _HIST_CHUNK_ROWS]
+        with np.errstate(invalid="ignore"):
+            index = np.clip(((chunk - low) / width).astype(np.int64), 0, bins - 1) + offsets
+        counts += np.bincount(index[valid], minlength=len(counts))
+    edges = low[:, None] + width[:, None] * np.arange(bins + 1)
+    return edges, counts.reshape(X.shape[1], bins)
 
 
-def generate_eda_plots(data):
-    info = data.info()
+def gaussian_kde(sample, grid):
+    """Гауссово ядро с шириной по правилу Скотта (как scipy.stats.gaussian_kde); плотность в точках grid."""
+    sample = sample[np.isfinite(sample)]
+    if len(sample) < 2 or sample.std() == 0:
+        return None
+    bandwidth = sample.std(ddof=1) * len(sample) ** (-1 / 5)
+    z = (grid[:, None] - sample[None, :]) / bandwidth
+    return np.exp(-0.5 * z ** 2).sum(axis=1) / (len(sample) * bandwidth * np.sqrt(2 * np.pi))
 
-    stats = data.describe()
 
-    numeric_cols = data.select_dtypes(include='number').columns.tolist()
-    fig1, axes = plt.subplots(nrows=3, ncols=4, figsize=(20, 15))
-    for i, col in enumerate(numeric_cols[:12]):
-        sns.histplot(data[col], kde=True, bins=30, ax=axes[i // 4][i % 4])
-        axes[i // 4][i % 4].set_title(f'Distribution of {col}')
-    fig1.tight_layout()
+def distributions(X, bins=EDA_BINS, kde_rows=None):
+    """Гистограммы колонок X и KDE по строкам kde_rows, отмасштабированная к числу строк (как у seaborn)."""
+    edges, counts = histograms(X, bins)
+    sample = X if kde_rows is None else X[kde_rows]
+    panels = []
+    for i in range(X.shape[1]):
+        grid = np.linspace(edges[i, 0], edges[i, -1], EDA_KDE_POINTS)
+        density = gaussian_kde(sample[:, i], grid)
+        scale = counts[i].sum() * (edges[i, 1] - edges[i, 0])
+        panels.append({
+            "edges": edges[i], "counts": counts[i],
+            "kde_x": grid, "kde_y": None if density is None else density * scale,
+        })
+    return panels
 
-    # Log1p преобразование
-    log_data = np.log1p(data[numeric_cols])
-    fig2, axes = plt.subplots(nrows=3, ncols=4, figsize=(20, 15))
-    for i, col in enumerate(log_data.columns[:12]):
-        sns.histplot(log_data[col], kde=True, bins=30, ax=axes[i // 4][i % 4])
-        axes[i // 4][i % 4].set_title(f'Log-transformed {col}')
-    fig2.tight_layout()
 
+def compute_eda(data, bins=EDA_BINS, kde_sample=EDA_KDE_SAMPLE, random_state=42):
+    """
+    Все данные раздела EDA по DataFrame: сводка по колонкам (вместо data.info()), describe()
+    и гистограммы с KDE для исходных и log1p-значений числовых колонок.
+    """
+    numeric = data.select_dtypes(include="number")
+    X = numeric.to_numpy(dtype=np.float64)
+    kde_rows = None
+    if len(X) > kde_sample:
+        kde_rows = np.sort(np.random.default_rng(random_state).choice(len(X), kde_sample, replace=False))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_X = np.log1p(X)
     return {
-        'info': info,
-        'stats': stats,
-        'original_plots': fig1,
-        'log_plots': fig2
-    }
\ No newline at end of file
+        "columns": numeric.columns.tolist(),
+        "info": pd.DataFrame({
+            "dtype": data.dtypes.astype(str),
+            "non_null": data.notna().sum(),
+            "memory_bytes": data.memory_usage(index=False, deep=True),
+        }),
+        "stats": numeric.describe(),
+        "original": distributions(X, bins, kde_rows),
+        "log": distributions(log_X, bins, kde_rows),
+    }
+
+
+def plot_distributions(columns, panels, title):
+    fig, axes = plt.subplots(nrows=3, ncols=4, figsize=(20, 15))
+    for ax in axes.ravel()[len(panels):]:
+        ax.set_visible(False)
+    for ax, column, panel in zip(axes.ravel(), columns, panels):
+        edges = panel["edges"]
+        ax.bar(edges[:-1], panel["counts"], width=np.diff(edges), align="edge", alpha=0.6, edgecolor="white")
+        if panel["kde_y"] is not None:
+            ax.plot(panel["kde_x"], panel["kde_y"])
+        ax.set_title(f"{title} {column}")
+        ax.set_ylabel("Count")
+    fig.tight_layout()
+    return fig
+
+
+def _png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def generate_eda_plots(data, cache=None):
+    """
+    Результаты EDA для DataFrame: 'info', 'stats' и PNG-изображения 'original_plots' / 'log_plots'
+    (первые EDA_PANELS числовых колонок). cache — словарь (например, в st.session_state):
+    все расчеты и отрисовка выполняются один раз для каждого отпечатка данных, а на повторных
+    запусках скрипта берутся готовые.
+    """
+    key = data_fingerprint(data) if cache is not None else None
+    if key is not None and key in cache:
+        return cache[key]
+    eda = compute_eda(data)
+    columns = eda["columns"][:EDA_PANELS]
+    eda["original_plots"] = _png(plot_distributions(columns, eda["original"][:EDA_PANELS], "Distribution of"))
+    eda["log_plots"] = _png(plot_distributions(columns, eda["log"][:EDA_PANELS], "Log-transformed"))
+    if key is not None:
+        while len(cache) >= EDA_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+        cache[key] = eda
+    return eda
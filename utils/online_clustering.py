@@ -0,0 +1,156 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.clustering import MINIBATCH_BATCH_SIZE, WalletClusterModel, assign_clusters
+from utils.preprocessing import WalletPreprocessor
+
+DRIFT_THRESHOLD = 0.25  # сдвиг центроида в долях среднеквадратичного радиуса кластеров при последнем обучении
+
+
+class OnlineClusterModel:
+    """
+    Поддержка кластеров по мере поступления новых дней без полного переобучения.
+    Хранит модель (WalletClusterModel с замороженной предобработкой), метрики и метки всех кошельков
+    и число кошельков в каждом кластере. update() убирает из центроидов прежний вклад изменившихся
+    и выбывших кошельков, относит изменившиеся кошельки к ближайшему центроиду и добавляет их вклад
+    (шаг как у MiniBatchKMeans.partial_fit, но с точным пересчетом среднего). Метки остальных кошельков
+    не меняются. Когда центроиды уходят от последнего полного обучения дальше drift_threshold,
+    модель переобучается на всех текущих кошельках.
+    """
+
+    def __init__(self, model, data, labels, n_clusters, graph_features=False, drift_threshold=DRIFT_THRESHOLD,
+                 engine="auto", batch_size=MINIBATCH_BATCH_SIZE, float32=False):
+        self.model = model
+        self.data = data
+        self.labels = labels
+        self.n_clusters = n_clusters
+        self.graph_features = graph_features
+        self.drift_threshold = drift_threshold
+        self.engine_params = {"engine": engine, "batch_size": batch_size, "float32": float32}
+        self._reset_reference()
+
+    @classmethod
+    def fit(cls, data, n_clusters, graph_features=False, drift_threshold=DRIFT_THRESHOLD, engine="auto",
+            batch_size=MINIBATCH_BATCH_SIZE, float32=False):
+        """Полное обучение на DataFrame метрик кошельков (с колонкой address)."""
+        online = cls.__new__(cls)
+        online.n_clusters = n_clusters
+        online.graph_features = graph_features
+        online.drift_threshold = drift_threshold
+        online.engine_params = {"engine": engine, "batch_size": batch_size, "float32": float32}
+        online._refit(_by_address(data, WalletPreprocessor._unfitted(data, graph_features).columns))
+        return online
+
+    def _refit(self, data):
+        self.model = WalletClusterModel.fit(data, self.n_clusters, self.graph_features, **self.engine_params)
+        self.data = data
+        self.labels = pd.Series(self.model.labels, index=data.index)
+        self._reset_reference()
+
+    def _reset_reference(self):
+        self.counts = np.bincount(self.labels.to_numpy(), minlength=self.n_clusters).astype(np.int64)
+        self.reference_centroids = self.model.centroids.copy()
+        X = self.model.transform(self.data).astype(np.float64, copy=False)
+        inertia = ((X - self.model.centroids[self.labels.to_numpy()]) ** 2).sum()
+        self.reference_rms = float(np.sqrt(inertia / max(len(X), 1))) or 1.0
+
+    @property
+    def drift(self):
+        """Наибольший сдвиг центроида от последнего полного обучения в долях reference_rms."""
+        shift = np.sqrt(((self.model.centroids - self.reference_centroids) ** 2).sum(axis=1))
+        return float(shift.max() / self.reference_rms)
+
+    def _move(self, X, labels, sign):
+        # Точный пересчет средних: центроид = сумма признаков кошельков кластера / их число
+        sums = np.zeros_like(self.model.centroids)
+        np.add.at(sums, labels, X)
+        moved = np.bincount(labels, minlength=self.n_clusters)
+        counts = self.counts + sign * moved
+        totals = self.counts[:, None] * self.model.centroids + sign * sums
+        self.model.centroids = np.where(counts[:, None] > 0, totals / np.maximum(counts, 1)[:, None], self.model.centroids)
+        self.counts = counts
+
+    def update(self, changed, removed=()):
+        """
+        changed — метрики кошельков, изменившихся за новый день (новые и существующие), removed — адреса,
+        выбывшие из окна. Возвращает сводку: число обновленных, новых, выбывших и сменивших кластер
+        кошельков, дрейф и было ли полное переобучение.
+        """
+        changed = _by_address(changed, self.model.preprocessor.columns)
+        removed = self.data.index.intersection(pd.Index(removed)).difference(changed.index)
+        existing = self.data.index.intersection(changed.index)
+        leaving = existing.append(removed)
+        previous_labels = self.labels.loc[existing]
+
+        if len(leaving):
+            self._move(self.model.transform(self.data.loc[leaving]).astype(np.float64, copy=False),
+                       self.labels.loc[leaving].to_numpy(), -1)
+        X = self.model.transform(changed).astype(np.float64, copy=False)
+        labels = assign_clusters(X, self.model.centroids)
+        self._move(X, labels, 1)
+
+        self.data = pd.concat([self.data.drop(index=leaving), changed[self.data.columns]])
+        self.labels = pd.concat([self.labels.drop(index=leaving), pd.Series(labels, index=changed.index)])
+
+        summary = {
+            "updated": len(existing), "new": len(changed) - len(existing), "removed": len(removed),
+            "relabelled": int((self.labels.loc[existing] != previous_labels).sum()),
+            "drift": self.drift, "refit": False,
+        }
+        if summary["drift"] > self.drift_threshold:
+            self._refit(self.data)
+            summary["refit"] = True
+        return summary
+
+    def refresh(self, current):
+        """
+        Обновление по полному DataFrame метрик текущего окна: изменившимися считаются новые кошельки и
+        кошельки с другими значениями признаков, выбывшими — отсутствующие в current.
+        """
+        columns = self.model.preprocessor.columns
+        current = _by_address(current, columns)
+        common = current.index.intersection(self.data.index)
+        differs = ~np.isclose(
+            current.loc[common, columns].to_numpy(dtype=np.float64),
+            self.data.loc[common, columns].to_numpy(dtype=np.float64),
+            rtol=1e-6, equal_nan=True,
+        ).all(axis=1)
+        changed = common[differs].append(current.index.difference(self.data.index))
+        return self.update(current.loc[changed], self.data.index.difference(current.index))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.model.save(os.path.join(directory, "model.npz"))
+        self.data.assign(cluster=self.labels).reset_index().to_parquet(os.path.join(directory, "wallets.parquet"))
+        np.savez(
+            os.path.join(directory, "state.npz"),
+            reference_centroids=self.reference_centroids, reference_rms=np.array(self.reference_rms),
+            params=np.array(json.dumps({
+                "n_clusters": self.n_clusters, "graph_features": self.graph_features,
+                "drift_threshold": self.drift_threshold, **self.engine_params,
+            })),
+        )
+
+    @classmethod
+    def load(cls, directory):
+        model = WalletClusterModel.load(os.path.join(directory, "model.npz"))
+        wallets = pd.read_parquet(os.path.join(directory, "wallets.parquet")).set_index("address")
+        with np.load(os.path.join(directory, "state.npz")) as state:
+            params = json.loads(str(state["params"]))
+            online = cls(model, wallets.drop(columns=["cluster"]), wallets["cluster"], **params)
+            # Точка отсчета дрейфа — последнее полное обучение, а не момент сохранения
+            online.reference_centroids = state["reference_centroids"]
+            online.reference_rms = float(state["reference_rms"])
+        return online
+
+
+def _by_address(data, columns):
+    # Пропуски проверяются только в признаках модели (как в WalletClusterModel.fit): кошелек с пустой
+    # датой (NaT) остается в кластеризации
+    data = data.dropna(subset=columns)
+    if "address" in data.columns:
+        data = data.drop_duplicates("address").set_index("address")
+    return data
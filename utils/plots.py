@@ -12,9 +12,13 @@ def plot_elbow_method(inertia, K_range):
     return fig
 
 
-def plot_silhouette(silhouette_scores, K_range):
+def plot_silhouette(silhouette_scores, K_range, silhouette_ci=None):
     fig, ax = plt.subplots(figsize=(8, 5))
     ax.plot(K_range, silhouette_scores, marker='o', linestyle='--', color='green')
+    if silhouette_ci is not None:
+        # Доверительный интервал оценки по выборкам
+        ax.fill_between(K_range, [low for low, _ in silhouette_ci], [high for _, high in silhouette_ci],
+                        color='green', alpha=0.2)
     ax.set_xlabel('Number of clusters (k)')
     ax.set_ylabel('Silhouette Score')
     ax.set_title('Silhouette Analysis')
@@ -30,6 +34,20 @@ def plot_davies_bouldin(davies_bouldin_scores, K_range):
     return fig
 
 
+def plot_stability(ari, jaccard, K_range, ari_ci=None, jaccard_ci=None):
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for values, ci, color, label in ((ari, ari_ci, 'purple', 'Adjusted Rand'), (jaccard, jaccard_ci, 'brown', 'Jaccard')):
+        ax.plot(K_range, values, marker='o', linestyle='--', color=color, label=label)
+        if ci is not None:
+            ax.fill_between(K_range, [low for low, _ in ci], [high for _, high in ci], color=color, alpha=0.2)
+    ax.set_xlabel('Number of clusters (k)')
+    ax.set_ylabel('Stability')
+    ax.set_ylim(0, 1.05)
+    ax.set_title('Cluster Stability (resampling)')
+    ax.legend()
+    return fig
+
+
 def plot_pca_clusters(scaled_features, cluster_labels):
     pca = PCA(n_components=2)
     pca_result = pca.fit_transform(scaled_features)
@@ -1,33 +1,235 @@
+import itertools
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
 from sklearn.preprocessing import StandardScaler
 import numpy as np
 
 
-def load_data(file_path):
-    data = pd.read_csv(file_path)
+metric_columns = [
+    "current_token_balance",
+    "period_total_tx_count",
+    "period_incoming_tx_count",
+    "period_outgoing_tx_count",
+    "period_total_volume_in",
+    "period_total_volume_out",
+    "period_avg_volume_in",
+    "period_avg_volume_out",
+    "period_unique_counterparties",
+    "period_active_days"
+]
+date_columns = ["period_first_tx_date", "period_last_tx_date"]
+
+# Признаки графа контрагентов (src.transfer_graph.GRAPH_COLUMNS): счетчики и объемы логарифмируются,
+# PageRank и коэффициент кластеризации берутся как есть.
+graph_log_columns = [
+    "graph_in_degree",
+    "graph_out_degree",
+    "graph_weighted_in_degree",
+    "graph_weighted_out_degree",
+    "graph_component_size"
+]
+graph_raw_columns = ["graph_pagerank", "graph_clustering"]
+
+
+def _file_format(file_path):
+    # file_path — путь или загруженный файл (у UploadedFile Streamlit есть name)
+    name = str(getattr(file_path, "name", file_path)).lower()
+    if name.endswith((".parquet", ".pq")):
+        return "parquet"
+    if name.endswith((".arrow", ".feather", ".ipc")):
+        return "arrow"
+    return "csv"
+
+
+def _read_arrow(file_path):
+    # Arrow IPC: файловый формат (в т.ч. Feather v2) или потоковый
+    try:
+        return pa_ipc.open_file(file_path).read_all()
+    except pa.ArrowInvalid:
+        if hasattr(file_path, "seek"):
+            file_path.seek(0)
+        return pa_ipc.open_stream(file_path).read_all()
+
+
+def _compact_table(table):
+    # Признаки — float32, даты — timestamp, адрес — строка Arrow вместо Python-объектов
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if name in date_columns and not pa.types.is_timestamp(column.type):
+            column = pc.cast(column, pa.timestamp("us")) if pa.types.is_string(column.type) else column
+        elif (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)) and name not in date_columns:
+            column = pc.cast(column, pa.float32())
+        columns.append(column)
+    return pa.Table.from_arrays(columns, names=table.column_names)
+
+
+def _csv_convert_options():
+    # Явная схема: CSV разбирается многопоточным парсером Arrow сразу в итоговые типы.
+    # Даты — в микросекундах: при timestamp("s") строки с долями секунды ("...22:13:20.000005") не разбираются
+    column_types = {col: pa.float32() for col in metric_columns + graph_log_columns + graph_raw_columns}
+    column_types.update({col: pa.timestamp("us") for col in date_columns})
+    column_types["address"] = pa.string()
+    return pa_csv.ConvertOptions(column_types=column_types, timestamp_parsers=[pa_csv.ISO8601])
+
+
+def _to_frame(table):
+    data = _compact_table(table).to_pandas(
+        types_mapper={pa.string(): pd.StringDtype("pyarrow"), pa.large_string(): pd.StringDtype("pyarrow")}.get
+    )
     data.dropna(inplace=True)
-    return data
-
-
-def preprocess_data(data):
-    selected_columns = [
-        "current_token_balance",
-        "period_total_tx_count",
-        "period_incoming_tx_count",
-        "period_outgoing_tx_count",
-        "period_total_volume_in",
-        "period_total_volume_out",
-        "period_avg_volume_in",
-        "period_avg_volume_out",
-        "period_unique_counterparties",
-        "period_active_days"
-    ]
-
-    X = data[selected_columns + ['period_first_tx_date', 'period_last_tx_date', 'address']].copy()
-    X_log = np.log1p(X[selected_columns])
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X_log)
-    X_scaled_df = pd.DataFrame(X_scaled, columns=selected_columns)
+    return data.reset_index(drop=True)
+
+
+def load_data(file_path):
+    file_format = _file_format(file_path)
+    if file_format == "parquet":
+        table = pq.read_table(file_path)
+    elif file_format == "arrow":
+        table = _read_arrow(file_path)
+    else:
+        table = pa_csv.read_csv(file_path, convert_options=_csv_convert_options())
+    return _to_frame(table)
+
+
+def _iter_record_batches(file_path, batch_size):
+    file_format = _file_format(file_path)
+    if file_format == "parquet":
+        yield from pq.ParquetFile(file_path).iter_batches(batch_size=batch_size)
+    elif file_format == "arrow":
+        try:
+            reader = pa_ipc.open_file(file_path)
+        except pa.ArrowInvalid:
+            yield from pa_ipc.open_stream(file_path)
+            return
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+    else:
+        # Arrow разбирает блоки CSV с упреждением, поэтому память ограничивает размер блока, а не batch_size;
+        # мелкие блоки собираются в порции нужного размера в iter_wallet_batches
+        read_options = pa_csv.ReadOptions(block_size=4 << 20)
+        yield from pa_csv.open_csv(file_path, read_options=read_options, convert_options=_csv_convert_options())
+
+
+def iter_wallet_batches(file_path, batch_size=1_000_000, columns=None):
+    """
+    Таблица кошельков по частям (DataFrame на каждую порцию строк файла) с теми же типами и
+    удалением пропусков, что у load_data. columns — только эти колонки (отсутствующие в файле пропускаются);
+    пропуски тогда проверяются только в них.
+    """
+    pending, pending_rows = [], 0
+    batches = _iter_record_batches(file_path, batch_size)
+    for batch in itertools.chain(batches, [None]):
+        if batch is not None:
+            if columns is not None:
+                batch = batch.select([col for col in columns if col in batch.schema.names])
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows < batch_size:
+                continue
+        if not pending:
+            break
+        data = _to_frame(pa.Table.from_batches(pending))
+        pending, pending_rows = [], 0
+        if len(data):
+            yield data
+
+
+class WalletPreprocessor:
+    """
+    Обученная предобработка признаков кошельков: log1p для счетчиков и объемов, затем два
+    StandardScaler подряд (как в preprocess_data). Параметры хранятся массивами numpy,
+    поэтому transform — несколько векторных операций без sklearn.
+    """
+
+    def __init__(self, log_columns, raw_columns, log_mean, log_scale, mean, scale):
+        self.log_columns = list(log_columns)
+        self.raw_columns = list(raw_columns)
+        self.log_mean, self.log_scale = np.asarray(log_mean), np.asarray(log_scale)
+        self.mean, self.scale = np.asarray(mean), np.asarray(scale)
+
+    @property
+    def columns(self):
+        return self.log_columns + self.raw_columns
+
+    @classmethod
+    def _unfitted(cls, data, graph_features):
+        log_columns = list(metric_columns)
+        raw_columns = []
+        if graph_features:
+            log_columns += [col for col in graph_log_columns if col in data.columns]
+            raw_columns = [col for col in graph_raw_columns if col in data.columns]
+        return cls(log_columns, raw_columns, 0.0, 1.0, 0.0, 1.0)
+
+    @classmethod
+    def fit(cls, data, graph_features=False):
+        preprocessor = cls._unfitted(data, graph_features)
+        first = StandardScaler().fit(preprocessor._features(data))
+        preprocessor.log_mean, preprocessor.log_scale = first.mean_, first.scale_
+        second = StandardScaler().fit(preprocessor.standardize(data))
+        preprocessor.mean, preprocessor.scale = second.mean_, second.scale_
+        return preprocessor
+
+    @classmethod
+    def fit_batches(cls, batches, graph_features=False):
+        """
+        Обучение по порциям данных (StandardScaler.partial_fit); возвращает (предобработка, число строк).
+        Второй StandardScaler применяется к уже стандартизованным признакам, поэтому при точной
+        арифметике он тождественный: здесь он не обучается отдельным проходом (mean=0, scale=1).
+        """
+        preprocessor, scaler, rows = None, StandardScaler(), 0
+        for data in batches:
+            if preprocessor is None:
+                preprocessor = cls._unfitted(data, graph_features)
+            scaler.partial_fit(preprocessor._features(data))
+            rows += len(data)
+        if preprocessor is None:
+            raise ValueError("Нет строк без пропусков для обучения предобработки.")
+        preprocessor.log_mean, preprocessor.log_scale = scaler.mean_, scaler.scale_
+        preprocessor.mean, preprocessor.scale = np.zeros_like(scaler.mean_), np.ones_like(scaler.scale_)
+        return preprocessor, rows
+
+    def _features(self, data):
+        X = np.log1p(data[self.log_columns].to_numpy())
+        if self.raw_columns:
+            X = np.hstack([X, data[self.raw_columns].to_numpy(dtype=X.dtype)])
+        return X
+
+    def standardize(self, data):
+        """Признаки после log1p и первого StandardScaler."""
+        X = self._features(data)
+        return ((X - self.log_mean) / self.log_scale).astype(X.dtype, copy=False)
+
+    def transform(self, data):
+        """Итоговые признаки для кластеризации (после второго StandardScaler)."""
+        X = self.standardize(data)
+        return ((X - self.mean) / self.scale).astype(X.dtype, copy=False)
+
+    def to_arrays(self):
+        return {
+            "log_columns": np.array(self.log_columns), "raw_columns": np.array(self.raw_columns, dtype=str),
+            "log_mean": self.log_mean, "log_scale": self.log_scale, "mean": self.mean, "scale": self.scale,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(
+            arrays["log_columns"].tolist(), arrays["raw_columns"].tolist(),
+            arrays["log_mean"], arrays["log_scale"], arrays["mean"], arrays["scale"],
+        )
+
+
+def preprocess_data(data, graph_features=False):
+    """
+    Признаки для кластеризации, таблица стандартизованных признаков для отображения и обученная
+    WalletPreprocessor, которая построила признаки (из нее собирается WalletClusterModel).
+    """
+    preprocessor = WalletPreprocessor.fit(data, graph_features)
+    X_scaled_df = pd.DataFrame(preprocessor.standardize(data), columns=preprocessor.columns)
 
     X_scaled_df['period_first_tx_date'] = pd.to_datetime(data['period_first_tx_date'])
     X_scaled_df['period_last_tx_date'] = pd.to_datetime(data['period_last_tx_date'])
@@ -35,7 +237,27 @@ def preprocess_data(data):
                 X_scaled_df['period_last_tx_date'] - X_scaled_df['period_first_tx_date']).dt.days
     X_scaled_df = X_scaled_df.drop(columns=['period_first_tx_date', 'period_last_tx_date'])
 
-    features = X_scaled_df.drop(columns=['address', 'date_difference_days'], errors='ignore')
-    scaled_features = StandardScaler().fit_transform(features)
+    scaled_features = preprocessor.transform(data)
+
+    return scaled_features, X_scaled_df, preprocessor
+
 
-    return scaled_features, X_scaled_df
\ No newline at end of file
+def preprocess_out_of_core(file_path, output_path, graph_features=False, batch_size=1_000_000):
+    """
+    Предобработка таблицы кошельков, не помещающейся в память: файл (CSV, Parquet, Arrow IPC) читается
+    порциями по batch_size строк дважды — для обучения StandardScaler (partial_fit) и для записи признаков
+    в memory-mapped массив float32 output_path (.npy). Возвращает (признаки, открытые через np.load(mmap_mode="r"),
+    обученную WalletPreprocessor). Порядок строк — как в iter_wallet_batches(file_path), адреса берутся оттуда же.
+    """
+    columns = metric_columns + graph_log_columns + graph_raw_columns + date_columns + ["address"]
+    preprocessor, rows = WalletPreprocessor.fit_batches(
+        iter_wallet_batches(file_path, batch_size, columns), graph_features
+    )
+    features = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.float32, shape=(rows, len(preprocessor.columns)))
+    offset = 0
+    for data in iter_wallet_batches(file_path, batch_size, columns):
+        features[offset:offset + len(data)] = preprocessor.transform(data)
+        offset += len(data)
+    features.flush()
+    del features
+    return np.load(output_path, mmap_mode="r"), preprocessor
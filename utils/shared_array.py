@@ -0,0 +1,52 @@
+import mmap
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArray:
+    """
+    Матрица признаков, доступная процессам пула без копирования через pickle.
+    Обычный массив копируется один раз в multiprocessing.shared_memory; memory-mapped массив
+    (например, из preprocess_out_of_core) не копируется — процессы открывают тот же файл.
+    В процесс передается только descriptor, массив восстанавливается функцией attach.
+    """
+
+    def __init__(self, array):
+        array = np.asarray(array) if not isinstance(array, np.memmap) else array
+        self._shm = None
+        # Срез memmap хранит offset исходного массива, поэтому по файлу открывается только целый массив
+        if isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap) and array.flags.c_contiguous:
+            self.descriptor = ("file", array.filename, array.offset, array.shape, array.dtype.str)
+        else:
+            array = np.ascontiguousarray(array)
+            self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)[...] = array
+            self.descriptor = ("shm", self._shm.name, 0, array.shape, array.dtype.str)
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_attached = {}
+
+
+def attach(descriptor):
+    """Массив (только для чтения) по descriptor из SharedArray; сегмент памяти держится открытым в процессе."""
+    kind, name, offset, shape, dtype = descriptor
+    if kind == "file":
+        return np.memmap(name, dtype=dtype, mode="r", offset=offset, shape=tuple(shape))
+    if name not in _attached:
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=_attached[name].buf)
+    array.flags.writeable = False
+    return array
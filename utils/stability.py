@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from scipy import stats
+from sklearn.metrics import adjusted_rand_score
+from sklearn.metrics.cluster import contingency_matrix
+from threadpoolctl import threadpool_limits
+
+from utils.clustering import (
+    MINIBATCH_BATCH_SIZE, PARALLEL_MIN_ROWS, _engine_features, assign_clusters, fit_kmeans, make_kmeans,
+    resolve_engine,
+)
+from utils.shared_array import SharedArray, attach
+
+RESAMPLING = ("subsample", "bootstrap")
+STABILITY_MAX_RESAMPLES = 30
+STABILITY_MIN_RESAMPLES = 5
+STABILITY_TOLERANCE = 0.02  # половина ширины 95% доверительного интервала ARI, при которой k считается оцененным
+STABILITY_EVAL_ROWS = 20000  # кошельков, на которых сравниваются разбиения
+SUBSAMPLE_FRACTION = 0.8
+
+
+_worker_features = None
+_worker_eval_index = None
+
+
+def _init_stability_worker(descriptor, eval_index, threads):
+    global _worker_features, _worker_eval_index
+    _worker_features = attach(descriptor)
+    _worker_eval_index = eval_index
+    threadpool_limits(threads)
+
+
+def _resample_labels(k, seed, resampling="subsample", fraction=SUBSAMPLE_FRACTION, engine="kmeans",
+                     batch_size=MINIBATCH_BATCH_SIZE, float32=False, scaled_features=None, eval_index=None):
+    """Обучение на одной перевыборке; возвращает (k, метки кошельков eval_index по обученным центроидам)."""
+    scaled_features = _worker_features if scaled_features is None else scaled_features
+    eval_index = _worker_eval_index if eval_index is None else eval_index
+    rng = np.random.default_rng(seed)
+    n_rows = len(scaled_features)
+    if resampling == "bootstrap":
+        rows = np.sort(rng.integers(0, n_rows, n_rows))
+    else:
+        rows = np.sort(rng.choice(n_rows, int(n_rows * fraction), replace=False))
+    kmeans = make_kmeans(k, engine, batch_size, random_state=seed)
+    kmeans.fit(_engine_features(scaled_features[rows], float32))
+    return k, assign_clusters(scaled_features[eval_index], kmeans.cluster_centers_)
+
+
+def cluster_jaccard(reference, labels):
+    """
+    Стабильность каждого эталонного кластера (как в clusterboot): наибольший коэффициент Жаккара
+    между множеством его кошельков и кластерами другого разбиения.
+    """
+    table = contingency_matrix(reference, labels)
+    union = table.sum(axis=1)[:, None] + table.sum(axis=0)[None, :] - table
+    return (table / union).max(axis=1)
+
+
+def _mean_ci(values, confidence=0.95):
+    values = np.asarray(values, dtype=np.float64)
+    mean = float(values.mean())
+    if len(values) < 2:
+        return mean, (mean, mean)
+    half_width = float(stats.t.ppf(0.5 + confidence / 2, len(values) - 1) * values.std(ddof=1) / np.sqrt(len(values)))
+    return mean, (mean - half_width, mean + half_width)
+
+
+def cluster_stability(scaled_features, K_range, resampling="subsample", max_resamples=STABILITY_MAX_RESAMPLES,
+                      min_resamples=STABILITY_MIN_RESAMPLES, tolerance=STABILITY_TOLERANCE,
+                      eval_rows=STABILITY_EVAL_ROWS, fraction=SUBSAMPLE_FRACTION, n_jobs=None, on_result=None,
+                      engine="auto", batch_size=MINIBATCH_BATCH_SIZE, float32=False, cache=None, random_state=42):
+    """
+    Устойчивость кластеров KMeans для каждого k из K_range. Модель обучается заново на перевыборках
+    (resampling: "subsample" — доля fraction строк без возвращения, "bootstrap" — n строк с возвращением)
+    с разным random_state, и ее разбиение фиксированного набора из eval_rows кошельков сравнивается с
+    эталонным (fit_kmeans на всех данных; с cache после find_optimal_clusters эталон не переобучается):
+    adjusted Rand index и средний по кластерам коэффициент Жаккара.
+    Перевыборки считаются в процессах пула (n_jobs, как в find_optimal_clusters) над признаками в общей
+    памяти (SharedArray). Для k перестают запускаться новые перевыборки, когда их не меньше min_resamples
+    и половина 95% доверительного интервала ARI меньше tolerance (или достигнут max_resamples).
+    on_result(k, scores) вызывается, когда оценка k завершена.
+    Возвращает словарь со списками по K_range: 'ari', 'ari_ci', 'jaccard', 'jaccard_ci',
+    'cluster_jaccard' (по эталонным кластерам), 'resamples', а также 'K_range'.
+    """
+    if resampling not in RESAMPLING:
+        raise ValueError(f"Неизвестный способ перевыборки: {resampling}")
+    K_range = list(K_range)
+    n_rows = len(scaled_features)
+    engine = resolve_engine(engine, n_rows)
+    rng = np.random.default_rng(random_state)
+    eval_index = np.sort(rng.choice(n_rows, min(n_rows, eval_rows), replace=False))
+    eval_features = np.asarray(scaled_features[eval_index])
+    references = {
+        k: assign_clusters(eval_features, fit_kmeans(scaled_features, k, engine, batch_size, float32, cache).cluster_centers_)
+        for k in K_range
+    }
+    seeds = iter(rng.integers(0, 2 ** 31 - 1, size=len(K_range) * max_resamples))
+    ari = {k: [] for k in K_range}
+    jaccard = {k: [] for k in K_range}
+    submitted = {k: 0 for k in K_range}
+    results = {}
+
+    def converged(k):
+        if len(ari[k]) >= max_resamples:
+            return True
+        if len(ari[k]) < min_resamples:
+            return False
+        _, (low, high) = _mean_ci(ari[k])
+        return (high - low) / 2 < tolerance
+
+    def collect(k, labels):
+        ari[k].append(adjusted_rand_score(references[k], labels))
+        jaccard[k].append(cluster_jaccard(references[k], labels))
+        if k not in results and converged(k):
+            per_cluster = np.array(jaccard[k])
+            results[k] = {
+                'ari': _mean_ci(ari[k]), 'jaccard': _mean_ci(per_cluster.mean(axis=1)),
+                'cluster_jaccard': per_cluster.mean(axis=0).tolist(), 'resamples': len(ari[k]),
+            }
+            if on_result:
+                on_result(k, results[k])
+
+    def next_task():
+        # Перевыборка для еще не оцененного k с наименьшим числом запущенных (большие k — раньше)
+        candidates = [k for k in K_range if k not in results and submitted[k] < max_resamples]
+        if not candidates:
+            return None
+        k = min(candidates, key=lambda k: (submitted[k], -k))
+        submitted[k] += 1
+        return k, int(next(seeds))
+
+    if n_jobs is None:
+        n_jobs = (os.cpu_count() or 1) if n_rows >= PARALLEL_MIN_ROWS else 1
+
+    params = (resampling, fraction, engine, batch_size, float32)
+    if n_jobs <= 1:
+        while (task := next_task()) is not None:
+            collect(*_resample_labels(*task, *params, scaled_features, eval_index))
+    else:
+        threads = max(1, (os.cpu_count() or 1) // n_jobs)
+        with SharedArray(scaled_features) as shared, ProcessPoolExecutor(
+            max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_stability_worker, initargs=(shared.descriptor, eval_index, threads)
+        ) as executor:
+            # В работе не больше n_jobs перевыборок: решение о следующей принимается по уже готовым
+            running = set()
+            while True:
+                while len(running) < n_jobs and (task := next_task()) is not None:
+                    running.add(executor.submit(_resample_labels, *task, *params))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(*future.result())
+
+    return {
+        'ari': [results[k]['ari'][0] for k in K_range],
+        'ari_ci': [results[k]['ari'][1] for k in K_range],
+        'jaccard': [results[k]['jaccard'][0] for k in K_range],
+        'jaccard_ci': [results[k]['jaccard'][1] for k in K_range],
+        'cluster_jaccard': [results[k]['cluster_jaccard'] for k in K_range],
+        'resamples': [results[k]['resamples'] for k in K_range],
+        'K_range': K_range,
+    }